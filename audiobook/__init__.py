@@ -0,0 +1,62 @@
+"""
+Shared building blocks for the audiobook generation scripts.
+
+Importing the package is cheap: submodules are loaded on first attribute
+access, the ElevenLabs SDK is only imported once a request is made and ffmpeg
+is only started to re-encode or export audio. Text-only work such as markdown
+conversion, chunk planning and cache lookups never touches either.
+"""
+import importlib
+
+
+# Public name -> submodule that defines it
+_EXPORTS = {
+    'AudiobookError': 'errors',
+    'BatchBook': 'batch',
+    'BuildManifest': 'manifest',
+    'Chunk': 'chunking',
+    'ElevenLabsBackend': 'backends',
+    'HLSWriter': 'hls',
+    'NarrationText': 'markdown',
+    'PostProcessing': 'postprocess',
+    'RequestScheduler': 'scheduler',
+    'RetryPolicy': 'retry',
+    'RunJournal': 'journal',
+    'RunMetrics': 'metrics',
+    'StubBackend': 'backends',
+    'TTSBackend': 'backends',
+    'TTSCache': 'cache',
+    'concatenate_mp3': 'mp3',
+    'convert_markdown': 'markdown',
+    'create_backend': 'backends',
+    'export_formats': 'export',
+    'generate_audiobook': 'book',
+    'generate_audiobook_from_chapters': 'book',
+    'generate_audiobooks': 'batch',
+    'iter_chunks': 'chunking',
+    'iter_synthesize': 'synthesis',
+    'join_audio': 'audio',
+    'load_batch': 'batch',
+    'markdown_to_text': 'markdown',
+    'parse_formats': 'export',
+    'plan_audiobook': 'plan',
+    'render_preview': 'preview',
+    'split_text_into_chunks': 'chunking',
+    'synthesize': 'synthesis',
+    'synthesize_many': 'synthesis',
+}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name):
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f'.{module_name}', __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
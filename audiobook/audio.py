@@ -0,0 +1,165 @@
+"""
+Joining synthesized MP3 chunks into a single audio file.
+
+Every join mode streams: chunks are written to the output as they arrive and
+only one chunk is held at a time, so memory stays flat however long the book
+is. Re-encoding pipes the audio through one long-running ffmpeg process
+instead of decoding every chunk to PCM in memory. Normalizing also evens out
+loudness and silence between chunks first (see postprocess.py).
+"""
+import collections
+import os
+import subprocess
+import threading
+
+from .errors import AudiobookError
+from .mp3 import audio_frames, concatenate_mp3, iter_frames, silence_like
+
+
+DEFAULT_BITRATE = '128k'
+
+# How chunks can be joined; see join_audio
+CONCAT_MODES = ('frames', 'reencode', 'normalize')
+
+
+def read_files(paths):
+    """
+    Yield the bytes of each file in turn so only one is held in memory.
+    """
+    for path in paths:
+        with open(path, 'rb') as f:
+            yield f.read()
+
+
+class StreamingEncoder:
+    """
+    A single ffmpeg process that decodes MP3 audio piped into it and encodes
+    it again into one output file.
+
+    Chunks are reduced to their audio frames before being written, so the
+    tags and Info headers of each chunk do not end up in the middle of the
+    stream ffmpeg decodes. Other input, such as raw PCM, can be described with
+    input_args and fed with write_raw().
+    """
+
+    def __init__(self, output_file, bitrate=DEFAULT_BITRATE, ffmpeg='ffmpeg', input_args=('-f', 'mp3')):
+        command = [
+            ffmpeg, '-hide_banner', '-loglevel', 'error', '-y',
+            *input_args, '-i', 'pipe:0',
+            '-c:a', 'libmp3lame', '-b:a', bitrate,
+            '-f', 'mp3', output_file,
+        ]
+        try:
+            self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+        except FileNotFoundError:
+            raise AudiobookError(f"{ffmpeg} not found; it is needed to re-encode audio") from None
+        # Drain stderr on a thread so a chatty ffmpeg can never block on a full pipe
+        self._errors = collections.deque(maxlen=50)
+        self._stderr_thread = threading.Thread(target=self._read_errors, daemon=True)
+        self._stderr_thread.start()
+
+    def _read_errors(self):
+        for line in self.process.stderr:
+            self._errors.append(line.decode('utf-8', 'replace').rstrip())
+
+    def write(self, audio_bytes):
+        """Feed one MP3 chunk to the encoder."""
+        self.write_raw(audio_frames(audio_bytes))
+
+    def write_raw(self, data):
+        """Feed input to the encoder as it is."""
+        try:
+            self.process.stdin.write(data)
+        except BrokenPipeError:
+            self._fail()
+
+    def close(self):
+        """Finish encoding and wait for the output file to be complete."""
+        try:
+            self.process.stdin.close()
+        except BrokenPipeError:
+            pass
+        self.process.wait()
+        self._stderr_thread.join()
+        if self.process.returncode != 0:
+            self._fail()
+
+    def abort(self):
+        """Stop the encoder without finishing the output."""
+        self.process.kill()
+        self.process.wait()
+        self._stderr_thread.join()
+
+    def _fail(self):
+        self.abort()
+        details = '\n'.join(self._errors) or f'exit code {self.process.returncode}'
+        raise AudiobookError(f"ffmpeg failed to encode audio: {details}")
+
+
+def encode_mp3(audio_chunks, output_file, bitrate=DEFAULT_BITRATE):
+    """
+    Decode and re-encode MP3 chunks into output_file with one ffmpeg process.
+    """
+    encoder = StreamingEncoder(output_file, bitrate)
+    try:
+        for audio_bytes in audio_chunks:
+            encoder.write(audio_bytes)
+    except BaseException:
+        encoder.abort()
+        raise
+    encoder.close()
+
+
+def _with_gaps(audio_chunks, gap):
+    """Yield the chunks with gap seconds of silence between each two."""
+    for i, audio_bytes in enumerate(audio_chunks):
+        if i and gap:
+            for header, _ in iter_frames(audio_bytes):
+                yield silence_like(header, gap)
+                break
+        yield audio_bytes
+
+
+def join_audio(audio_chunks, output_file, concat_mode='frames', gap=None):
+    """
+    Write MP3 chunks to output_file as one continuous audio file.
+
+    audio_chunks may be a generator: each chunk is written as soon as it is
+    produced. The audio is written to output_file + '.partial' and renamed
+    once complete, so output_file never holds a truncated book.
+
+    Args:
+        audio_chunks: Iterable of MP3 bytes in playback order
+        output_file: Path to output audio file
+        concat_mode: 'frames' appends MP3 frames as-is,
+                     'reencode' decodes and encodes the audio again with ffmpeg,
+                     'normalize' also matches loudness and trims silence first
+        gap: Seconds of silence between chunks (default: none, or the
+             section gap when normalizing)
+
+    Returns:
+        Duration of the audio in seconds, or None when re-encoding
+
+    Raises:
+        ValueError: If concat_mode is not one of CONCAT_MODES
+    """
+    if concat_mode not in CONCAT_MODES:
+        raise ValueError(f"Unknown concat mode '{concat_mode}' (expected one of: {', '.join(CONCAT_MODES)})")
+    partial_file = output_file + '.partial'
+    duration = None
+    try:
+        if concat_mode == 'frames':
+            duration = concatenate_mp3(_with_gaps(audio_chunks, gap), partial_file)
+        elif concat_mode == 'normalize':
+            from .postprocess import normalize_mp3
+            duration = normalize_mp3(audio_chunks, partial_file, gap=gap)
+        elif concat_mode == 'reencode':
+            encode_mp3(_with_gaps(audio_chunks, gap), partial_file)
+        os.replace(partial_file, output_file)
+    except BaseException:
+        try:
+            os.unlink(partial_file)
+        except OSError:
+            pass
+        raise
+    return duration
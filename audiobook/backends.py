@@ -0,0 +1,207 @@
+"""
+Text-to-speech backends.
+
+A backend turns one chunk of text into MP3 audio. The ElevenLabs backend calls
+the real API; the stub backend points the same SDK at a local stand-in server
+(see stub_server.py) that answers with silent audio after a configurable delay,
+so the concurrency, retry and caching paths can be exercised offline without
+spending quota.
+"""
+import os
+
+from . import config
+from .errors import AudiobookError
+
+
+class TTSBackend:
+    """
+    Interface for text-to-speech backends.
+
+    Attributes:
+        name: Short name used in configuration
+        description: Human readable description printed when connecting
+        cache_namespace: Kept apart from other backends in the TTS cache and the
+                         build manifest, or None for the production API
+    """
+
+    name = None
+    description = None
+    cache_namespace = None
+
+    def convert(self, text, voice_id, model_id, voice_settings):
+        """
+        Convert text to speech.
+
+        Args:
+            text: The text content to convert
+            voice_id: Voice ID to use
+            model_id: Model ID to use
+            voice_settings: Dict of voice settings
+
+        Returns:
+            Iterable of MP3 byte strings
+        """
+        raise NotImplementedError
+
+    def is_transient_error(self, error):
+        """
+        Check whether a failed request may succeed if it is sent again.
+        """
+        return False
+
+
+class ElevenLabsBackend(TTSBackend):
+    """
+    Backend calling the ElevenLabs text-to-speech API.
+
+    The SDK is imported and the client created on the first request. The
+    client is safe to share between threads; with max_connections set, its
+    connection pool keeps that many connections alive so every worker can
+    reuse one instead of opening a new connection per request.
+
+    With streaming set, requests go to the streaming endpoint, which starts
+    sending audio while the rest of the chunk is still being generated rather
+    than once all of it is. The first bytes arrive much sooner and the
+    download overlaps generation, so each chunk completes sooner.
+    """
+
+    name = 'elevenlabs'
+
+    def __init__(self, api_key, timeout=300.0, base_url=None, max_connections=None, streaming=False):
+        self.api_key = api_key
+        self.timeout = timeout
+        self.base_url = base_url
+        self.max_connections = max_connections
+        self.streaming = streaming
+        self._client = None
+
+    @property
+    def description(self):
+        return 'Eleven Labs API (streaming)' if self.streaming else 'Eleven Labs API'
+
+    @property
+    def client(self):
+        if self._client is None:
+            # Extended timeout for large audio generation
+            from elevenlabs.client import ElevenLabs
+
+            options = {'api_key': self.api_key, 'timeout': self.timeout}
+            if self.base_url is not None:
+                options['base_url'] = self.base_url
+            if self.max_connections is not None:
+                import httpx
+
+                options['httpx_client'] = httpx.Client(
+                    timeout=self.timeout,
+                    limits=httpx.Limits(
+                        max_connections=self.max_connections,
+                        max_keepalive_connections=self.max_connections,
+                    ),
+                )
+            self._client = ElevenLabs(**options)
+        return self._client
+
+    def convert(self, text, voice_id, model_id, voice_settings):
+        from elevenlabs import VoiceSettings
+
+        if self.streaming:
+            convert = self.client.text_to_speech.convert_as_stream
+        else:
+            convert = self.client.text_to_speech.convert
+        return convert(
+            voice_id=voice_id,
+            text=text,
+            model_id=model_id,
+            voice_settings=VoiceSettings(**voice_settings)
+        )
+
+    def is_transient_error(self, error):
+        import httpx
+        from elevenlabs.core.api_error import ApiError
+
+        if isinstance(error, ApiError):
+            # Rate limits, timeouts and server errors; other 4xx errors will fail again
+            return error.status_code in (408, 409, 429) or (error.status_code or 0) >= 500
+        # Timeouts, dropped connections and responses cut short
+        return isinstance(error, httpx.TransportError)
+
+
+class StubBackend(ElevenLabsBackend):
+    """
+    Backend sending requests to the local stand-in server.
+
+    Requests go through the ElevenLabs SDK as usual, so API errors, timeouts
+    and connection pooling behave as they do against the real API. Unless a
+    server URL is given (or set in AUDIOBOOK_STUB_URL), a server configured
+    from the AUDIOBOOK_STUB_* environment variables is started in-process.
+    """
+
+    name = 'stub'
+    cache_namespace = 'stub'
+
+    def __init__(self, api_key=None, timeout=300.0, url=None, max_connections=None, streaming=False):
+        url = url or os.environ.get('AUDIOBOOK_STUB_URL')
+        self.server = None
+        if url is None:
+            from .stub_server import StubServer, StubSettings
+
+            self.server = StubServer(StubSettings.from_environment())
+            url = self.server.start()
+        super().__init__(
+            api_key or 'stub', timeout, base_url=url, max_connections=max_connections, streaming=streaming
+        )
+
+    @property
+    def description(self):
+        streaming = ' (streaming)' if self.streaming else ''
+        return f'stand-in TTS server at {self.base_url}{streaming}'
+
+
+_BACKENDS = {
+    ElevenLabsBackend.name: ElevenLabsBackend,
+    StubBackend.name: StubBackend,
+}
+
+
+def cache_namespace(name=None):
+    """
+    Cache namespace of a backend, without creating it.
+
+    Args:
+        name: Backend name (default: AUDIOBOOK_TTS_BACKEND or 'elevenlabs')
+
+    Raises:
+        AudiobookError: If the backend name is unknown
+    """
+    return _backend_class(name).cache_namespace
+
+
+def _backend_class(name):
+    if name is None:
+        name = config.tts_backend_from_environment()
+    backend_class = _BACKENDS.get(name)
+    if backend_class is None:
+        raise AudiobookError(
+            f"Unknown TTS backend '{name}' (expected one of: {', '.join(sorted(_BACKENDS))})"
+        )
+    return backend_class
+
+
+def create_backend(api_key, name=None, timeout=300.0, max_connections=None, streaming=None):
+    """
+    Create the configured text-to-speech backend.
+
+    Args:
+        api_key: Eleven Labs API key (not needed for the stub backend)
+        name: Backend name (default: AUDIOBOOK_TTS_BACKEND or 'elevenlabs')
+        timeout: Request timeout in seconds
+        max_connections: Size of the HTTP connection pool to keep alive
+                         (default: the HTTP client's own limits)
+        streaming: Use the streaming endpoint (default: AUDIOBOOK_TTS_STREAMING or off)
+
+    Raises:
+        AudiobookError: If the backend name is unknown
+    """
+    if streaming is None:
+        streaming = config.tts_streaming_from_environment()
+    return _backend_class(name)(api_key, timeout, max_connections=max_connections, streaming=streaming)
@@ -0,0 +1,241 @@
+"""
+Rendering many books in one process.
+
+A batch file lists books, each with an output file and its chapters in order.
+Every book in the batch shares one TTS client (and so one pool of keep-alive
+connections), one TTS cache and one pool of workers, so the concurrency limit
+applies to the whole batch rather than to each book. Changed chapters from
+all books are synthesized longest first, which keeps a long chapter from
+starting last and holding up the end of the batch. Each book is written as
+soon as its last chapter is done.
+
+Unchanged chapters are reused from each book's build manifest, and every
+synthesized chunk lands in the TTS cache, so running a failed batch again
+only pays for the chunks that were never rendered.
+"""
+import json
+import os
+import time
+
+from . import config
+from .audio import join_audio, read_files
+from .backends import create_backend
+from .cache import TTSCache
+from .errors import AudiobookError
+from .manifest import default_chapters_dir
+from .metrics import RunMetrics
+from .pipeline import (
+    export_book, iter_chapter_texts, join_modes, plan_chapters, print_file_size, report_scheduler,
+    resolve_formats, resolve_settings, write_chapters,
+)
+from .retry import RetryPolicy
+from .scheduler import RequestScheduler
+from .synthesis import iter_synthesize, render_settings
+
+
+class BatchBook:
+    """
+    One book of a batch.
+
+    Attributes:
+        output_file: Path of the audiobook to write
+        chapter_files: Paths of the chapter markdown files, in order
+        chapters_dir: Directory for per-chapter audio and the build manifest
+    """
+
+    def __init__(self, output_file, chapter_files, chapters_dir=None):
+        self.output_file = output_file
+        self.chapter_files = list(chapter_files)
+        self.chapters_dir = chapters_dir or default_chapters_dir(output_file)
+
+
+def load_batch(path):
+    """
+    Read a batch file.
+
+    The file is JSON: either a list of books or an object with a "books" list.
+    Each book has an "output" path and a "chapters" list, and optionally a
+    "chapters_dir". Relative paths are taken from the batch file's directory.
+
+        {"books": [{"output": "out/one.mp3", "chapters": ["one/01.md", "one/02.md"]}]}
+
+    Args:
+        path: Path to the batch file
+
+    Returns:
+        List of BatchBook
+
+    Raises:
+        AudiobookError: If the file is not valid JSON or a book is malformed
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except ValueError as e:
+        raise AudiobookError(f"Invalid batch file {path}: {e}") from None
+
+    base = os.path.dirname(os.path.abspath(path))
+
+    def resolve(value):
+        return os.path.normpath(os.path.join(base, value))
+
+    entries = data.get('books') if isinstance(data, dict) else data
+    if not isinstance(entries, list) or not entries:
+        raise AudiobookError(f"Batch file {path} lists no books")
+
+    books = []
+    for i, entry in enumerate(entries):
+        output = entry.get('output') if isinstance(entry, dict) else None
+        chapters = entry.get('chapters') if isinstance(entry, dict) else None
+        if not isinstance(output, str) or not isinstance(chapters, list) or not chapters:
+            raise AudiobookError(f"Book {i+1} in {path} needs an \"output\" path and a \"chapters\" list")
+        chapters_dir = entry.get('chapters_dir')
+        books.append(BatchBook(
+            resolve(output),
+            [resolve(chapter) for chapter in chapters],
+            resolve(chapters_dir) if chapters_dir else None,
+        ))
+    return books
+
+
+def _format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}h{minutes:02d}m"
+    return f"{minutes}m{seconds:02d}s"
+
+
+def generate_audiobooks(books, api_key, voice_id=None, model_id=None, concurrency=None, concat_mode=None,
+                        chunking=None, metrics=None, formats=None, name='batch'):
+    """
+    Generate several audiobooks from chapter markdown files in one run.
+
+    Args:
+        books: List of BatchBook
+        api_key: Eleven Labs API key (not needed with AUDIOBOOK_TTS_BACKEND=stub)
+        voice_id: Voice ID to use for every book (default: Rachel)
+        model_id: Model ID to use (default: eleven_multilingual_v2)
+        concurrency: Most chunk requests to run at once across all books; the limit is
+                     cut on congestion and only grows past this up to
+                     AUDIOBOOK_MAX_CONCURRENCY, if set (default: AUDIOBOOK_CONCURRENCY or 4)
+        concat_mode: How chapters are joined (default: AUDIOBOOK_CONCAT or 'frames')
+        chunking: How text is packed into chunks (default: AUDIOBOOK_CHUNKING or 'greedy')
+        metrics: RunMetrics recording stage and request timings
+                 (default: AUDIOBOOK_METRICS and AUDIOBOOK_METRICS_PROM, if set)
+        formats: Formats to export every book to besides the MP3, e.g. 'm4b,opus'
+                 (default: AUDIOBOOK_EXPORT_FORMATS, if set)
+        name: Name of the batch in metrics
+
+    Raises:
+        AudiobookError: If a chapter file is missing, two books share an output
+                        file or chapter directory, a book has no text, the
+                        concat mode, chunking strategy or an export format
+                        is unknown, or exporting fails
+    """
+    voice_id, model_id, concurrency, concat_mode, chunking = resolve_settings(
+        voice_id, model_id, concurrency, concat_mode, chunking
+    )
+    targets = resolve_formats(formats)
+    if metrics is None:
+        metrics = RunMetrics.from_environment()
+    settings = render_settings(voice_id, model_id, chunking, concat_mode)
+    _, book_mode = join_modes(concat_mode)
+    chapter_gap = config.chapter_gap_from_environment()
+
+    with metrics.run(name, settings):
+        print(f"📚 Generating {len(books)} audiobooks")
+
+        # Check the whole batch before spending anything on it
+        for attribute in ('output_file', 'chapters_dir'):
+            paths = [os.path.abspath(getattr(book, attribute)) for book in books]
+            if len(set(paths)) != len(paths):
+                raise AudiobookError(f"Books in a batch need their own {attribute.replace('_', ' ')}")
+        for book in books:
+            for chapter_file in book.chapter_files:
+                if not os.path.exists(chapter_file):
+                    raise AudiobookError(f"Chapter file not found: {chapter_file}")
+
+        # Previously synthesized chunks are reused instead of paying for them again
+        cache = TTSCache.from_environment()
+        print(f"🗄️  Using TTS cache: {cache.directory}")
+
+        book_chapters = {}        # output file -> ChapterAudio of each chapter in order
+        remaining = {}            # output file -> chapters still to synthesize
+        pending = []
+        for i, book in enumerate(books):
+            print(f"\n📗 Book {i+1}/{len(books)}: {book.output_file}")
+            chapters, book_pending = plan_chapters(
+                book.chapter_files, book.chapters_dir, settings, metrics, book=book.output_file
+            )
+            if not chapters:
+                raise AudiobookError(f"No text content found in any chapter of {book.output_file}")
+            book_chapters[book.output_file] = chapters
+            remaining[book.output_file] = len(book_pending)
+            pending.extend(book_pending)
+
+        def finish_book(output_file):
+            output_dir = os.path.dirname(output_file)
+            if output_dir:
+                os.makedirs(output_dir, exist_ok=True)
+            chapters = book_chapters[output_file]
+            with metrics.stage('export', book=output_file):
+                join_audio(read_files(chapter.audio_path for chapter in chapters), output_file, book_mode,
+                           chapter_gap)
+            print(f"📕 Audiobook written: {output_file}")
+            print_file_size(output_file, "Size")
+            export_book(output_file, targets, chapters, metrics, chapter_gap, book=output_file)
+
+        for book in books:
+            if not remaining[book.output_file]:
+                finish_book(book.output_file)
+
+        if pending:
+            # Longest chapters first, so the batch does not end waiting on one long chapter
+            pending.sort(key=lambda chapter: len(chapter.text_content), reverse=True)
+            total_characters = sum(len(chapter.text_content) for chapter in pending)
+            books_left = sum(1 for count in remaining.values() if count)
+
+            # One client for the whole batch, with a keep-alive connection for every worker
+            scheduler = RequestScheduler.from_environment(concurrency)
+            backend = create_backend(api_key, max_connections=scheduler.max_workers)
+            print(f"\n🔌 Connecting to {backend.description}...")
+            print(f"\n🎵 Generating audio for {len(pending)} changed chapters in {books_left} books "
+                  f"({total_characters} characters, {scheduler.describe()})...")
+
+            planned = []  # (chapter, text) of each chunk so far
+            done_characters = 0
+            started = time.monotonic()
+
+            def report_chunk(index, audio_bytes):
+                nonlocal done_characters
+                chapter, text = planned[index]
+                done_characters += len(text)
+                fraction = done_characters / total_characters
+                elapsed = time.monotonic() - started
+                eta = _format_duration(elapsed / fraction - elapsed) if fraction else '?'
+                print(f"   ✅ {fraction:6.1%}  {os.path.basename(chapter.book)} / {chapter.name} "
+                      f"({len(text)} characters, about {eta} left)")
+
+            texts = iter_chapter_texts(pending, chunking, metrics, planned)
+            audio_chunks = iter_synthesize(
+                backend, texts, voice_id, model_id, cache, concurrency, report_chunk,
+                RetryPolicy.from_environment(), metrics=metrics, scheduler=scheduler,
+            )
+            try:
+                for chapter in write_chapters(audio_chunks, planned, settings, metrics, concat_mode):
+                    remaining[chapter.book] -= 1
+                    if not remaining[chapter.book]:
+                        books_left -= 1
+                        finish_book(chapter.book)
+                        if books_left:
+                            print(f"   📚 {books_left} more to go")
+            finally:
+                report_scheduler(scheduler, metrics)
+        else:
+            print(f"\n♻️  All chapters unchanged, nothing to synthesize")
+
+        reused = sum(len(chapters) for chapters in book_chapters.values()) - len(pending)
+        print(f"\n✅ {len(books)} audiobooks generated successfully!")
+        print(f"♻️  Chapters reused: {reused}/{reused + len(pending)}")
+        print(f"🗄️  TTS cache: {cache.hits} hits, {cache.misses} misses")
@@ -0,0 +1,386 @@
+"""
+Audiobook generation from a single markdown file or from ordered chapter files.
+"""
+import os
+
+from . import config
+from .audio import join_audio, read_files
+from .backends import create_backend
+from .cache import TTSCache
+from .chunking import iter_chunks
+from .errors import AudiobookError
+from .hls import HLSWriter
+from .journal import RunJournal
+from .manifest import default_chapters_dir
+from .markdown import markdown_title, markdown_to_text
+from .metrics import RunMetrics
+from .pipeline import (
+    export_book, iter_chapter_texts, join_modes, plan_chapters, print_file_size, report_scheduler,
+    resolve_formats, resolve_settings, write_chapters,
+)
+from .retry import RetryPolicy
+from .scheduler import RequestScheduler
+from .synthesis import iter_synthesize, render_settings
+
+
+def _open_journal(directory, settings, resume):
+    journal = RunJournal(directory, settings, resume)
+    if resume:
+        if len(journal):
+            print(f"📒 Resuming: {len(journal)} chunks were completed by an earlier run")
+        else:
+            print("📒 Nothing to resume, starting from the beginning")
+    return journal
+
+
+def _synthesize(backend, texts, voice_id, model_id, cache, concurrency, on_complete, journal, metrics,
+                scheduler):
+    """Synthesize with retries in order, pointing at the journal if the run still fails."""
+    retry = RetryPolicy.from_environment()
+    try:
+        yield from iter_synthesize(
+            backend, texts, voice_id, model_id, cache, concurrency, on_complete, retry, journal,
+            metrics=metrics, scheduler=scheduler,
+        )
+    except Exception:
+        print(f"\n💾 {len(journal)} completed chunks are saved in {journal.directory}")
+        print("   Run again with --resume to continue where this run stopped")
+        raise
+    finally:
+        report_scheduler(scheduler, metrics)
+
+
+class _HLSChapters:
+    """
+    Feeds the chapters of a book to an HLS writer in book order, each as a
+    section: unchanged chapters from their audio files, and changed ones
+    from their chunks as they arrive (or, when chapters are normalized, from
+    their files once written).
+    """
+
+    def __init__(self, writer, chapters, gap):
+        self.writer = writer
+        self.chapters = chapters
+        self.gap = gap
+        self._next = 0  # index of the first chapter not fed yet
+
+    def _start(self, chapter):
+        # Like the book, chapters after the first start with the gap between chapters
+        self.writer.start_section(chapter.title, self.gap if self._next else 0.0)
+        self._next += 1
+
+    def _feed_file(self, chapter):
+        self._start(chapter)
+        for audio_bytes in read_files([chapter.audio_path]):
+            self.writer.write(audio_bytes)
+        self.writer.end_section()
+
+    def _feed_files_until(self, chapter):
+        """Feed the chapters before chapter (or all that are left) from their files."""
+        while self._next < len(self.chapters) and self.chapters[self._next] is not chapter:
+            self._feed_file(self.chapters[self._next])
+
+    def feed_chunks(self, audio_chunks, planned):
+        """Yield each chunk of audio_chunks after writing it to its chapter's section."""
+        current = None
+        for index, audio_bytes in enumerate(audio_chunks):
+            chapter = planned[index][0].audio
+            if chapter is not current:
+                self._feed_files_until(chapter)
+                self._start(chapter)
+                current = chapter
+            self.writer.write(audio_bytes)
+            yield audio_bytes
+        self.writer.end_section()
+
+    def chapter_written(self, chapter):
+        """Feed a freshly written chapter and the unchanged chapters before it."""
+        self._feed_files_until(chapter)
+        self._feed_file(chapter)
+
+    def finish(self):
+        """Feed the chapters that are left and end the playlist."""
+        self._feed_files_until(None)
+        self.writer.finish()
+        self.writer.report()
+
+
+def generate_audiobook(input_file, output_file, api_key, voice_id=None, model_id=None, concurrency=None,
+                       concat_mode=None, resume=False, chunking=None, metrics=None, formats=None,
+                       backend=None, cache=None, hls_dir=None):
+    """
+    Generate audiobook from markdown file using Eleven Labs API.
+    If text exceeds the API limit, it will be split into chunks and combined.
+
+    Args:
+        input_file: Path to input markdown file
+        output_file: Path to output audio file
+        api_key: Eleven Labs API key (not needed with AUDIOBOOK_TTS_BACKEND=stub)
+        voice_id: Voice ID to use (default: Rachel - 21m00Tcm4TlvDq8ikWAM, a calm, clear voice)
+                  This is an Eleven Labs voice identifier. Available voices can be found at:
+                  https://elevenlabs.io/voices
+        model_id: Model ID to use (default: eleven_multilingual_v2)
+                  Available models: https://elevenlabs.io/docs/api-reference/text-to-speech
+        concurrency: Most chunk requests to run at once; the limit is cut on congestion and
+                     only grows past this up to AUDIOBOOK_MAX_CONCURRENCY, if set
+                     (default: AUDIOBOOK_CONCURRENCY or 4)
+        concat_mode: How chunks are joined (default: AUDIOBOOK_CONCAT or 'frames')
+                     'frames' appends MP3 frames as-is, 'reencode' decodes and re-encodes with ffmpeg,
+                     'normalize' also matches loudness and trims silence between chunks
+        resume: Reuse the chunks completed by an earlier run that failed, as
+                recorded in the run journal (<output name>.journal)
+        chunking: How text is packed into chunks (default: AUDIOBOOK_CHUNKING or 'greedy')
+                  'greedy' fills each chunk in turn, 'balanced' evens out chunk sizes,
+                  'anchored' keeps chunk boundaries stable across edits
+        metrics: RunMetrics recording stage and request timings
+                 (default: AUDIOBOOK_METRICS and AUDIOBOOK_METRICS_PROM, if set)
+        formats: Formats to export besides the MP3, e.g. 'm4b,opus,preview'
+                 (default: AUDIOBOOK_EXPORT_FORMATS, if set); see export.py
+        backend: TTSBackend to reuse, such as the one of a watch that builds
+                 repeatedly (default: a new one for api_key)
+        cache: TTSCache to reuse (default: from the environment)
+        hls_dir: Directory to also write the book to as HLS segments and a
+                 playlist, updated as each chunk arrives (see hls.py)
+
+    Raises:
+        AudiobookError: If the markdown contains no text to narrate, the
+                        configured TTS backend, concat mode, chunking
+                        strategy or an export format is unknown, or exporting fails
+    """
+    voice_id, model_id, concurrency, concat_mode, chunking = resolve_settings(
+        voice_id, model_id, concurrency, concat_mode, chunking
+    )
+    targets = resolve_formats(formats)
+    if metrics is None:
+        metrics = RunMetrics.from_environment()
+    with metrics.run(output_file, render_settings(voice_id, model_id, chunking, concat_mode)):
+        print(f"🎙️  Reading markdown file: {input_file}")
+
+        # Read the markdown file
+        with open(input_file, 'r', encoding='utf-8') as f:
+            markdown_content = f.read()
+
+        # Convert to plain text
+        print("📝 Converting markdown to plain text...")
+        with metrics.stage('markdown'):
+            text_content = markdown_to_text(markdown_content)
+
+        # Check text length
+        text_length = len(text_content)
+        print(f"📊 Text length: {text_length} characters")
+
+        if text_length == 0:
+            raise AudiobookError("No text content found after markdown conversion")
+
+        # Requests are paced by an adaptive concurrency limit starting at concurrency
+        scheduler = RequestScheduler.from_environment(concurrency)
+        if backend is None:
+            backend = create_backend(api_key, max_connections=scheduler.max_workers)
+        print(f"🔌 Connecting to {backend.description}...")
+
+        # Previously synthesized chunks are reused instead of paying for them again
+        if cache is None:
+            cache = TTSCache.from_environment()
+        print(f"🗄️  Using TTS cache: {cache.directory}")
+        # A reused cache counts from earlier builds too
+        cache_hits, cache_misses = cache.hits, cache.misses
+
+        # Every completed chunk is journaled so a failed run can be resumed
+        journal_dir = os.path.splitext(output_file)[0] + '.journal'
+        journal = _open_journal(journal_dir, render_settings(voice_id, model_id, chunking), resume)
+
+        if text_length > config.MAX_CHUNK_SIZE:
+            print(f"⚠️  Text exceeds Eleven Labs limit of 10,000 characters")
+            print(f"📦 Splitting text into chunks...")
+
+        # Chunks are submitted for synthesis as soon as the splitter yields them, and
+        # written to the output as soon as they and every chunk before them are done
+        print(f"\n🎵 Generating audio for chunks ({scheduler.describe()})...")
+        print(f"💾 Writing audio to: {output_file}")
+        text_chunks = []
+
+        def plan_chunks():
+            chunks = iter_chunks(text_content, config.MAX_CHUNK_SIZE, chunking)
+            for chunk in metrics.timed('chunking', chunks):
+                text_chunks.append(chunk.text)
+                print(f"📦 Chunk {len(text_chunks)}: {len(chunk.text)} characters ({chunk.boundary} boundary)")
+                yield chunk.text
+
+        def report_chunk(index, audio_bytes):
+            print(f"✅ Chunk {index+1}/{len(text_chunks)} generated ({len(text_chunks[index])} characters)")
+
+        audio_chunks = _synthesize(
+            backend, plan_chunks(), voice_id, model_id, cache, concurrency, report_chunk, journal,
+            metrics, scheduler,
+        )
+        hls = None
+        if hls_dir:
+            hls = HLSWriter.from_environment(hls_dir)
+            print(f"📡 Writing HLS segments to: {hls.playlist_path}")
+            if concat_mode == 'frames':
+                # The chunks go into the book as they are, so they can be segmented as they arrive
+                hls.start_section(markdown_title(markdown_content))
+                audio_chunks = hls.feed(audio_chunks)
+        # Time spent waiting for synthesis is not part of joining
+        with metrics.stage('join') as stage:
+            join_audio(stage.exclude(audio_chunks), output_file, concat_mode)
+        journal.discard()
+        if hls is not None:
+            if concat_mode != 'frames':
+                # Re-encoded audio is only final once the whole book is written
+                hls.start_section(markdown_title(markdown_content))
+                for audio_bytes in read_files([output_file]):
+                    hls.write(audio_bytes)
+            hls.finish()
+
+        print(f"\n🔗 Combined {len(text_chunks)} audio chunks")
+        print(f"✅ Audiobook generated successfully: {output_file}")
+        print_file_size(output_file, "File size")
+        print(f"🗄️  TTS cache: {cache.hits - cache_hits} hits, {cache.misses - cache_misses} misses")
+        if hls is not None:
+            hls.report()
+        export_book(output_file, targets, None, metrics)
+
+
+def generate_audiobook_from_chapters(chapter_files, output_file, api_key, voice_id=None, model_id=None,
+                                     concurrency=None, concat_mode=None, chapters_dir=None, resume=False,
+                                     chunking=None, metrics=None, formats=None, backend=None, cache=None,
+                                     hls_dir=None, hls_chapters=False):
+    """
+    Generate audiobook from multiple chapter markdown files.
+
+    Chapters whose narration text and voice settings have not changed since the
+    last run reuse their previously rendered audio, as recorded in the build
+    manifest kept alongside the chapter audio.
+
+    Args:
+        chapter_files: List of paths to chapter markdown files (in order)
+        output_file: Path to output audio file
+        api_key: Eleven Labs API key (not needed with AUDIOBOOK_TTS_BACKEND=stub)
+        voice_id: Voice ID to use (default: Rachel)
+        model_id: Model ID to use (default: eleven_multilingual_v2)
+        concurrency: Most chunk requests to run at once; the limit is cut on congestion and
+                     only grows past this up to AUDIOBOOK_MAX_CONCURRENCY, if set
+                     (default: AUDIOBOOK_CONCURRENCY or 4)
+        concat_mode: How chapters are joined (default: AUDIOBOOK_CONCAT or 'frames')
+                     'frames' appends MP3 frames as-is, 'reencode' decodes and re-encodes with ffmpeg,
+                     'normalize' matches loudness and trims silence between the chunks of each
+                     chapter as it is written. Chapters are separated by AUDIOBOOK_CHAPTER_GAP
+                     seconds of silence (default: 2)
+        chapters_dir: Directory for per-chapter audio and the build manifest
+                      (default: <output name>_chapters next to the output file)
+        resume: Reuse the chunks completed by an earlier run that failed, as
+                recorded in the run journal in chapters_dir
+        chunking: How text is packed into chunks (default: AUDIOBOOK_CHUNKING or 'greedy')
+                  'greedy' fills each chunk in turn, 'balanced' evens out chunk sizes,
+                  'anchored' keeps chunk boundaries stable across edits
+        metrics: RunMetrics recording stage and request timings
+                 (default: AUDIOBOOK_METRICS and AUDIOBOOK_METRICS_PROM, if set)
+        formats: Formats to export besides the MP3, e.g. 'm4b,opus,preview'
+                 (default: AUDIOBOOK_EXPORT_FORMATS, if set); m4b files get a
+                 chapter marker for every chapter
+        backend: TTSBackend to reuse, such as the one of a watch that builds
+                 repeatedly (default: a new one for api_key, once a chapter needs it)
+        cache: TTSCache to reuse (default: from the environment)
+        hls_dir: Directory to also write the book to as HLS segments and a
+                 playlist, updated as each chunk arrives; the segments of
+                 unchanged chapters are reused (see hls.py)
+        hls_chapters: Also write a playlist for each chapter to hls_dir
+
+    Raises:
+        AudiobookError: If a chapter file is missing, no chapter has any text,
+                        the configured TTS backend, concat mode, chunking
+                        strategy or an export format is unknown, or exporting fails
+    """
+    voice_id, model_id, concurrency, concat_mode, chunking = resolve_settings(
+        voice_id, model_id, concurrency, concat_mode, chunking
+    )
+    targets = resolve_formats(formats)
+    if metrics is None:
+        metrics = RunMetrics.from_environment()
+    with metrics.run(output_file, render_settings(voice_id, model_id, chunking, concat_mode)):
+        if chapters_dir is None:
+            chapters_dir = default_chapters_dir(output_file)
+
+        print(f"🎙️  Generating audiobook from {len(chapter_files)} chapters")
+        print(f"📂 Output file: {output_file}")
+
+        # Verify all chapter files exist
+        for chapter_file in chapter_files:
+            if not os.path.exists(chapter_file):
+                raise AudiobookError(f"Chapter file not found: {chapter_file}")
+
+        settings = render_settings(voice_id, model_id, chunking, concat_mode)
+
+        # Previously synthesized chunks are reused instead of paying for them again
+        if cache is None:
+            cache = TTSCache.from_environment()
+        print(f"🗄️  Using TTS cache: {cache.directory}")
+        # A reused cache counts from earlier builds too
+        cache_hits, cache_misses = cache.hits, cache.misses
+
+        # Plan every chapter first so chunks from all changed chapters share one worker pool
+        chapters, pending = plan_chapters(chapter_files, chapters_dir, settings, metrics)
+
+        if not chapters:
+            raise AudiobookError("No audio segments generated")
+
+        chapter_mode, book_mode = join_modes(concat_mode)
+        chapter_gap = config.chapter_gap_from_environment()
+        hls = None
+        if hls_dir:
+            hls = _HLSChapters(HLSWriter.from_environment(hls_dir, hls_chapters), chapters, chapter_gap)
+            print(f"\n📡 Writing HLS segments to: {hls.writer.playlist_path}")
+
+        if pending:
+            # The backend (and the ElevenLabs SDK) is only needed once there is something to synthesize
+            scheduler = RequestScheduler.from_environment(concurrency)
+            if backend is None:
+                backend = create_backend(api_key, max_connections=scheduler.max_workers)
+            print(f"\n🔌 Connecting to {backend.description}...")
+
+            # Generate audio for every chunk of every changed chapter, several requests at a time.
+            # Chunks are submitted for synthesis as soon as the splitter yields them, and each
+            # chapter is written out as soon as its last chunk is done.
+            journal = _open_journal(os.path.join(chapters_dir, 'journal'), settings, resume)
+            print(f"\n🎵 Generating audio for {len(pending)} changed chapters ({scheduler.describe()})...")
+            planned = []  # (chapter, text) of each chunk so far
+
+            def report_chunk(index, audio_bytes):
+                print(f"   ✅ Chunk {index+1}/{len(planned)} generated ({len(planned[index][1])} characters)")
+
+            texts = iter_chapter_texts(pending, chunking, metrics, planned)
+            audio_chunks = _synthesize(
+                backend, texts, voice_id, model_id, cache, concurrency, report_chunk, journal, metrics,
+                scheduler,
+            )
+            if hls is not None and chapter_mode == 'frames':
+                # Chapters are their chunks as they are, so they can be segmented as the chunks arrive
+                audio_chunks = hls.feed_chunks(audio_chunks, planned)
+            for chapter in write_chapters(audio_chunks, planned, settings, metrics, concat_mode):
+                if hls is not None and chapter_mode != 'frames':
+                    hls.chapter_written(chapter.audio)
+            # Every chapter is now in the manifest, so the chunks are no longer needed
+            journal.discard()
+        else:
+            print(f"\n♻️  All chapters unchanged, nothing to synthesize")
+
+        if hls is not None:
+            # The playlist does not wait for the combined book
+            hls.finish()
+
+        # Combine all chapters
+        print(f"\n{'='*70}")
+        print(f"🔗 Combining {len(chapters)} chapter audio files...")
+        print(f"{'='*70}")
+        print(f"💾 Writing combined audiobook to: {output_file}")
+        with metrics.stage('export'):
+            join_audio(
+                read_files(chapter.audio_path for chapter in chapters), output_file, book_mode, chapter_gap
+            )
+
+        print(f"\n✅ Audiobook generated successfully!")
+        print_file_size(output_file, "Final audiobook size")
+        print(f"♻️  Chapters reused: {len(chapters) - len(pending)}/{len(chapters)}")
+        print(f"🗄️  TTS cache: {cache.hits - cache_hits} hits, {cache.misses - cache_misses} misses")
+        export_book(output_file, targets, chapters, metrics, chapter_gap)
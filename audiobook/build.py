@@ -0,0 +1,332 @@
+"""
+Building every format of the book as a dependency graph.
+
+The book is modelled as targets: the chapter files feed a combined
+manuscript, the manuscript feeds one pandoc target per text format (PDF, EPUB,
+HTML) and the chapters feed the audiobook. Targets whose dependencies are
+done run in parallel, and a target is skipped when the content of its inputs
+and its recipe (the command and settings that produce it) hash the same as
+when its outputs were last built, so a push only rebuilds what an edit
+touches. The hashes are kept in a small JSON state file in the build
+directory.
+"""
+import hashlib
+import json
+import os
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from . import config
+from .book import generate_audiobook_from_chapters
+from .errors import AudiobookError
+from .export import parse_formats
+from .synthesis import render_settings
+
+
+BUILD_STATE_VERSION = 1
+
+# Text between chapters in the combined manuscript: a horizontal rule
+CHAPTER_SEPARATOR = '\n---\n\n'
+
+# Bytes read at a time when hashing a file
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def file_hash(path):
+    """Return the hex SHA-256 of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class Target:
+    """
+    One step of the build.
+
+    Attributes:
+        name: Name used on the command line and in the build state
+        inputs: Files the target reads; files written by another target make
+                it a dependency
+        outputs: Files the target writes
+        recipe: JSON-serializable description of everything besides the
+                inputs that changes the outputs (commands, settings)
+        action: Callable taking no arguments that writes the outputs
+    """
+
+    def __init__(self, name, inputs, outputs, recipe, action):
+        self.name = name
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.recipe = recipe
+        self.action = action
+
+    def key(self):
+        """Hash of the recipe and the current contents of every input."""
+        inputs = {os.path.normpath(path): file_hash(path) for path in self.inputs}
+        data = json.dumps({'recipe': self.recipe, 'inputs': inputs}, sort_keys=True)
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+class BuildState:
+    """
+    JSON record of the key each target was last built with, keyed by target name.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.targets = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                data = {}
+            if data.get('version') == BUILD_STATE_VERSION:
+                self.targets = data.get('targets', {})
+
+    def is_current(self, target, key):
+        """Whether target was built with key and its outputs are all still there."""
+        return self.targets.get(target.name) == key and all(os.path.exists(path) for path in target.outputs)
+
+    def record(self, target, key):
+        """Record a freshly built target and save the state at once."""
+        with self._lock:
+            self.targets[target.name] = key
+            self._save()
+
+    def _save(self):
+        # Written atomically so an interrupted build never corrupts it
+        directory = os.path.dirname(self.path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({'version': BUILD_STATE_VERSION, 'targets': self.targets}, f, indent=2, sort_keys=True)
+            os.replace(temp_path, self.path)
+        except BaseException:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+            raise
+
+
+def _dependencies(targets):
+    """Map each target name to the names of the targets producing its inputs."""
+    producers = {}
+    for target in targets:
+        for path in target.outputs:
+            producers[os.path.normpath(path)] = target.name
+    return {
+        target.name: {
+            producers[os.path.normpath(path)] for path in target.inputs if os.path.normpath(path) in producers
+        }
+        for target in targets
+    }
+
+
+def _closure(names, dependencies):
+    """The given target names and everything they depend on."""
+    selected = set()
+    stack = list(names)
+    while stack:
+        name = stack.pop()
+        if name not in selected:
+            selected.add(name)
+            stack.extend(dependencies[name])
+    return selected
+
+
+def run_build(targets, state_path, names=None, jobs=None, force=False):
+    """
+    Build targets in dependency order, running independent ones in parallel.
+
+    A target runs once every target it depends on has finished, and is
+    skipped when its key matches the build state and its outputs exist. When
+    a target fails, the targets depending on it are not run; the others still
+    finish.
+
+    Args:
+        targets: List of Target
+        state_path: Path of the build state file
+        names: Names of the targets to build, with their dependencies
+               (default: all)
+        jobs: Number of targets to run at once (default: all that are ready)
+        force: Build every selected target even if it is current
+
+    Returns:
+        Dict of target name -> 'built' or 'skipped'
+
+    Raises:
+        AudiobookError: If a name is unknown or a target fails
+    """
+    by_name = {target.name: target for target in targets}
+    dependencies = _dependencies(targets)
+    if names is None:
+        names = list(by_name)
+    unknown = [name for name in names if name not in by_name]
+    if unknown:
+        raise AudiobookError(
+            f"Unknown build target '{unknown[0]}' (expected one of: {', '.join(by_name)})"
+        )
+    selected = _closure(names, dependencies)
+    state = BuildState(state_path)
+    print_lock = threading.Lock()
+
+    def report(message):
+        # Targets report from several threads; keep each line whole
+        with print_lock:
+            print(message)
+
+    def run(target):
+        key = target.key()
+        if not force and state.is_current(target, key):
+            return 'skipped'
+        started = time.monotonic()
+        report(f"⚙️  {target.name}: building...")
+        target.action()
+        state.record(target, key)
+        report(f"✅ {target.name}: built in {time.monotonic() - started:.1f}s")
+        return 'built'
+
+    results = {}
+    failures = {}
+    running = {}
+    with ThreadPoolExecutor(max_workers=jobs or len(selected) or 1) as executor:
+        while True:
+            # Start every target whose dependencies are done, in the order they were defined
+            for target in targets:
+                name = target.name
+                if name not in selected or name in results or name in failures or name in running.values():
+                    continue
+                if dependencies[name] & set(failures):
+                    failures[name] = None  # not run
+                    continue
+                if dependencies[name] <= set(results):
+                    running[executor.submit(run, target)] = name
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    results[name] = future.result()
+                except Exception as e:
+                    report(f"❌ {name}: {e}")
+                    failures[name] = e
+                else:
+                    if results[name] == 'skipped':
+                        report(f"⏭️  {name}: unchanged, skipped")
+
+    if failures:
+        failed = [name for name, error in failures.items() if error is not None]
+        not_run = [name for name, error in failures.items() if error is None]
+        message = f"Build failed: {', '.join(failed)}"
+        if not_run:
+            message += f" (not run: {', '.join(not_run)})"
+        raise AudiobookError(message)
+    return results
+
+
+def write_manuscript(chapter_files, output_file):
+    """
+    Combine chapter files into one manuscript, separated by horizontal rules.
+    """
+    parts = []
+    for chapter_file in chapter_files:
+        with open(chapter_file, 'r', encoding='utf-8') as f:
+            parts.append(f.read())
+    directory = os.path.dirname(output_file)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(output_file, 'w', encoding='utf-8') as f:
+        f.write(CHAPTER_SEPARATOR.join(parts))
+
+
+def _run_pandoc(command, cwd):
+    try:
+        result = subprocess.run(command, cwd=cwd, capture_output=True)
+    except FileNotFoundError:
+        raise AudiobookError(f"{command[0]} not found; it is needed to build the text formats") from None
+    if result.returncode != 0:
+        details = result.stderr.decode('utf-8', 'replace').strip() or f'exit code {result.returncode}'
+        raise AudiobookError(f"pandoc failed: {details}")
+
+
+def book_targets(chapter_files, build_dir, book_name, title, subtitle=None, author=None, api_key=None,
+                 pandoc='pandoc'):
+    """
+    Targets building the book in every format.
+
+    Args:
+        chapter_files: Chapter markdown files in order
+        build_dir: Directory the formats are written to
+        book_name: File name of the outputs, without extension
+        title: Book title
+        subtitle: Optional subtitle, for the PDF
+        author: Optional author, for the PDF
+        api_key: Eleven Labs API key, needed only once the audiobook is rebuilt
+        pandoc: pandoc executable
+
+    Returns:
+        List of Target: 'manuscript', 'pdf', 'epub', 'html' and 'audio'
+    """
+    work_dir = os.path.join(build_dir, '.work')
+    manuscript = os.path.join(work_dir, f'{book_name}.md')
+    # pandoc runs next to the chapters so relative links and images resolve
+    source_dir = os.path.dirname(os.path.abspath(chapter_files[0]))
+
+    targets = [Target(
+        'manuscript', chapter_files, [manuscript], {'separator': CHAPTER_SEPARATOR},
+        lambda: write_manuscript(chapter_files, manuscript),
+    )]
+
+    pdf_args = ['--pdf-engine=xelatex', '--top-level-division=chapter', '--metadata', f'title={title}']
+    if subtitle:
+        pdf_args += ['--metadata', f'subtitle={subtitle}']
+    if author:
+        pdf_args += ['--metadata', f'author={author}']
+    for name, extension, args in (
+        ('pdf', '.pdf', ['-t', 'pdf'] + pdf_args),
+        ('epub', '.epub', ['-t', 'epub']),
+        ('html', '.html', ['-t', 'html', '--standalone', '--metadata', f'title={book_name}']),
+    ):
+        output_file = os.path.join(build_dir, book_name + extension)
+        args = ['-f', 'markdown'] + args
+        command = [pandoc, os.path.abspath(manuscript)] + args + ['-o', os.path.abspath(output_file)]
+
+        def action(command=command):
+            _run_pandoc(command, source_dir)
+
+        targets.append(Target(name, [manuscript], [output_file], {'pandoc': args}, action))
+
+    # Everything besides the chapter text that changes the audiobook
+    voice_id = config.voice_id_from_environment()
+    model_id = config.model_id_from_environment()
+    chunking = config.chunking_from_environment()
+    concat_mode = config.concat_mode_from_environment()
+    formats = config.export_formats_from_environment()
+    audio_file = os.path.join(build_dir, book_name + '.mp3')
+    audio_outputs = [audio_file] + [target.path(audio_file) for target in parse_formats(formats)]
+    recipe = {
+        'settings': render_settings(voice_id, model_id, chunking, concat_mode),
+        'chapter_gap': config.chapter_gap_from_environment(),
+        'formats': formats,
+    }
+
+    def build_audio():
+        if not api_key and config.tts_backend_from_environment() == config.DEFAULT_TTS_BACKEND:
+            raise AudiobookError("ELEVEN_LABS_API_KEY environment variable not set")
+        generate_audiobook_from_chapters(
+            chapter_files, audio_file, api_key, voice_id=voice_id, model_id=model_id, chunking=chunking,
+            concat_mode=concat_mode, formats=formats,
+        )
+
+    targets.append(Target('audio', chapter_files, audio_outputs, recipe, build_audio))
+    return targets
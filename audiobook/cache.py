@@ -0,0 +1,169 @@
+"""
+Content-addressed on-disk cache for synthesized TTS audio.
+
+Each entry holds the MP3 bytes the API returned for one chunk of text, keyed by
+a hash of everything that affects the rendered audio: the text, the voice, the
+model and the voice settings. Once the cache grows past its size cap the least
+recently used entries are evicted first.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+
+DEFAULT_CACHE_DIR = '.tts_cache'
+DEFAULT_MAX_MB = 2048
+
+
+def cache_key(text, voice_id, model_id, voice_settings, namespace=None):
+    """
+    Build the cache key for one synthesis request.
+
+    Args:
+        text: The text sent to the API
+        voice_id: Voice ID used for the request
+        model_id: Model ID used for the request
+        voice_settings: Dict of voice settings used for the request
+        namespace: Optional backend namespace, keeping audio from test backends
+                   apart from real API audio
+
+    Returns:
+        Hex SHA-256 digest identifying the rendered audio
+    """
+    fields = {
+        'text': text,
+        'voice_id': voice_id,
+        'model_id': model_id,
+        'voice_settings': voice_settings,
+    }
+    if namespace is not None:
+        fields['namespace'] = namespace
+    payload = json.dumps(
+        fields,
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class TTSCache:
+    """
+    Size-capped LRU cache of MP3 bytes stored under a directory.
+
+    Entries live at ``<directory>/<key[:2]>/<key>.mp3``. Recency is kept in the
+    file modification time so it survives between runs.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_MB * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = None  # key -> size, least recently used first
+        self._total_bytes = 0
+
+    @classmethod
+    def from_environment(cls):
+        """
+        Create a cache configured from AUDIOBOOK_CACHE_DIR and AUDIOBOOK_CACHE_MAX_MB.
+        """
+        directory = os.environ.get('AUDIOBOOK_CACHE_DIR', DEFAULT_CACHE_DIR)
+        max_mb = float(os.environ.get('AUDIOBOOK_CACHE_MAX_MB', DEFAULT_MAX_MB))
+        return cls(directory, int(max_mb * 1024 * 1024))
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + '.mp3')
+
+    def _load_index(self):
+        """Scan the cache directory once and order entries by last use."""
+        if self._entries is not None:
+            return
+        found = []
+        if os.path.isdir(self.directory):
+            for root, _, files in os.walk(self.directory):
+                for name in files:
+                    if not name.endswith('.mp3'):
+                        continue
+                    try:
+                        stat = os.stat(os.path.join(root, name))
+                    except OSError:
+                        continue
+                    found.append((stat.st_mtime, name[:-4], stat.st_size))
+        found.sort()
+        self._entries = OrderedDict((key, size) for _, key, size in found)
+        self._total_bytes = sum(self._entries.values())
+
+    def __contains__(self, key):
+        with self._lock:
+            self._load_index()
+            return key in self._entries
+
+    def get(self, key):
+        """
+        Return the cached MP3 bytes for key, or None on a miss.
+        """
+        with self._lock:
+            self._load_index()
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            path = self._path(key)
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+                os.utime(path)
+            except OSError:
+                # Entry vanished underneath us; forget it and treat as a miss
+                self._total_bytes -= self._entries.pop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key, data):
+        """
+        Store MP3 bytes under key and evict old entries if over the size cap.
+        """
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temp file first so a crash never leaves a truncated entry
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+            raise
+
+        with self._lock:
+            self._load_index()
+            if key in self._entries:
+                self._total_bytes -= self._entries.pop(key)
+            self._entries[key] = len(data)
+            self._total_bytes += len(data)
+            self._evict()
+
+    def _evict(self):
+        while self._total_bytes > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            try:
+                os.unlink(self._path(key))
+            except OSError:
+                pass
+
+    @property
+    def total_bytes(self):
+        """Total size of all cached entries in bytes."""
+        with self._lock:
+            self._load_index()
+            return self._total_bytes
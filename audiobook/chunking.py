@@ -0,0 +1,349 @@
+"""
+Splitting narration text into chunks that fit the TTS request limit.
+
+The text is cut into pieces: whole paragraphs where they fit, then sentences
+of paragraphs that are too long on their own, then words (or fixed-size
+pieces, if there are no spaces) of sentences that are too long on their own.
+The splitter works on offsets into the original text, so it runs in linear
+time even on a long run of text without any spaces.
+
+Pieces are packed into chunks by one of three strategies:
+
+- greedy: fill each chunk as far as it goes, yielding each chunk as soon as it
+  is complete. The last chunk of a chapter is often tiny.
+- balanced: use the same (minimum) number of chunks, but make the largest
+  chunk as small as possible, then prefer paragraph breaks over sentence and
+  word breaks, then even out the sizes. Fewer characters in the largest chunk
+  shortens the slowest request of a chapter synthesized in parallel.
+- anchored: end chunks at content-defined anchors, paragraph or sentence
+  breaks chosen by a hash of the text just before them. A chunk boundary then
+  depends only on the nearby text rather than on everything before it, so
+  an edit changes the one or two chunks around it and every other chunk
+  keeps its text (and its cached audio). Chunks are smaller on average, which
+  costs more requests but no more characters.
+"""
+import bisect
+import hashlib
+import re
+from collections import namedtuple
+
+from .config import MAX_CHUNK_SIZE
+
+
+DEFAULT_MAX_LENGTH = MAX_CHUNK_SIZE
+
+_PARAGRAPH_SEPARATOR = '\n\n'
+_SENTENCE_SEPARATOR = re.compile(r'(?<=[.!?])\s+')
+
+# Boundary types, describing the break that follows a chunk
+PARAGRAPH = 'paragraph'
+SENTENCE = 'sentence'
+WORD = 'word'
+HARD = 'hard'
+END = 'end'
+
+# Packing strategies
+GREEDY = 'greedy'
+BALANCED = 'balanced'
+ANCHORED = 'anchored'
+STRATEGIES = (GREEDY, BALANCED, ANCHORED)
+
+# How much larger than the smallest possible largest chunk the balanced
+# strategy lets a chunk grow in order to end on a better break
+BALANCE_TOLERANCE = 0.05
+
+# Cost of ending a chunk on each kind of break, for the balanced strategy
+_BREAK_PENALTY = {PARAGRAPH: 0, SENTENCE: 1, WORD: 2, HARD: 3}
+
+# The anchored strategy only ends a chunk at an anchor once it holds this
+# fraction of the limit, and places anchors this fraction of the limit apart
+# on average, so most chunks end at an anchor well before they are full
+ANCHOR_MIN_FRACTION = 0.25
+ANCHOR_SPACING_FRACTION = 0.35
+
+
+class Chunk(namedtuple('Chunk', ['text', 'start', 'end', 'boundary'])):
+    """
+    One chunk of text to synthesize.
+
+    Attributes:
+        text: The chunk text sent to the API
+        start: Offset of the first character of the chunk in the source text
+        end: Offset just past the last character of the chunk in the source text
+        boundary: Kind of break that follows the chunk ('paragraph', 'sentence',
+                  'word', 'hard' or 'end')
+    """
+    __slots__ = ()
+
+
+def _strip_span(text, start, end):
+    """Return (start, end) with surrounding whitespace removed, like str.strip()."""
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    return start, end
+
+
+def _pieces(text, max_length):
+    """
+    Yield (separator, start, end, boundary) for each piece to pack.
+
+    separator is what joins the piece to the previous one in the same chunk and
+    boundary is the kind of break in front of the piece.
+    """
+    length = len(text)
+    position = 0
+    while position <= length:
+        paragraph_end = text.find(_PARAGRAPH_SEPARATOR, position)
+        if paragraph_end == -1:
+            paragraph_end = length
+        if paragraph_end - position <= max_length:
+            yield '\n\n', position, paragraph_end, PARAGRAPH
+        else:
+            yield from _sentence_pieces(text, position, paragraph_end, max_length)
+        position = paragraph_end + len(_PARAGRAPH_SEPARATOR)
+
+
+def _sentence_pieces(text, start, end, max_length):
+    """Yield pieces for a paragraph that is too long to fit in one chunk."""
+    boundary = PARAGRAPH
+    sentence_start = start
+    for separator in _SENTENCE_SEPARATOR.finditer(text, start, end):
+        yield from _word_pieces(text, sentence_start, separator.start(), boundary, max_length)
+        boundary = SENTENCE
+        sentence_start = separator.end()
+    yield from _word_pieces(text, sentence_start, end, boundary, max_length)
+
+
+def _word_pieces(text, start, end, boundary, max_length):
+    """Yield pieces for a sentence, force splitting it if it is too long."""
+    forced = False
+    while end - start > max_length:
+        split_point = text.rfind(' ', start, start + max_length)
+        next_boundary = WORD
+        if split_point == -1:
+            split_point = start + max_length
+            next_boundary = HARD
+        yield (' ',) + _strip_span(text, start, split_point) + (boundary,)
+        start, end = _strip_span(text, split_point, end)
+        boundary = next_boundary
+        forced = True
+    # An empty remainder after force splitting is dropped
+    if end > start or not forced:
+        yield ' ', start, end, boundary
+
+
+def iter_chunks(text, max_length=DEFAULT_MAX_LENGTH, strategy=GREEDY):
+    """
+    Split text into chunks that are under the max_length limit.
+    Tries to split on paragraph boundaries, then sentence boundaries.
+
+    Args:
+        text: The text to split
+        max_length: Maximum length for each chunk (default 9500 to leave buffer)
+        strategy: 'greedy', 'balanced' or 'anchored' (see the module docstring)
+
+    Yields:
+        Chunk records in order; with the greedy and anchored strategies each as
+        soon as it is complete
+
+    Raises:
+        ValueError: If the strategy is unknown
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown chunking strategy '{strategy}' (expected one of: {', '.join(STRATEGIES)})")
+    if not text:
+        return
+    if strategy == ANCHORED:
+        # Short texts are split at anchors too, so a chapter that grows past
+        # the limit keeps the boundaries it had
+        yield from _anchored_chunks(text, max_length)
+        return
+    if len(text) <= max_length:
+        yield Chunk(text, 0, len(text), END)
+        return
+    if strategy == BALANCED:
+        yield from _balanced_chunks(text, max_length)
+    else:
+        yield from _greedy_chunks(text, max_length)
+
+
+def _greedy_chunks(text, max_length):
+    """Pack pieces greedily, yielding each chunk as soon as it is full."""
+    parts = []
+    chunk_length = 0
+    chunk_start = chunk_end = 0
+
+    for separator, start, end, boundary in _pieces(text, max_length):
+        piece_length = end - start
+        if chunk_length and chunk_length + piece_length + len(separator) <= max_length:
+            parts.append(separator)
+            parts.append(text[start:end])
+            chunk_length += piece_length + len(separator)
+            chunk_end = end
+            continue
+        if chunk_length:
+            yield Chunk(''.join(parts), chunk_start, chunk_end, boundary)
+        parts = [text[start:end]]
+        chunk_length = piece_length
+        chunk_start, chunk_end = start, end
+
+    if chunk_length:
+        yield Chunk(''.join(parts), chunk_start, chunk_end, END)
+
+
+def _balanced_chunks(text, max_length):
+    """
+    Pack pieces into the fewest chunks, with the smallest largest chunk,
+    ending on the best breaks available.
+
+    Works on prefix sums of piece lengths, so every chunk length is a
+    subtraction and greedy packing under a cap is a binary search per chunk.
+    """
+    # Empty pieces (from runs of blank lines) would only add separators
+    pieces = [piece for piece in _pieces(text, max_length) if piece[2] > piece[1]]
+    if not pieces:
+        return
+
+    # A chunk of pieces j..i-1 spans content[i] - start[j] characters: content[i]
+    # is where piece i-1 ends and start[j] where piece j's text starts, both
+    # counting every separator as if all pieces were joined into one string
+    content = [0]
+    start = []
+    for separator, piece_start, piece_end, _ in pieces:
+        start.append(content[-1] + len(separator))
+        content.append(start[-1] + piece_end - piece_start)
+    count = len(pieces)
+
+    def chunk_length(j, i):
+        return content[i] - start[j]
+
+    def forward(cap):
+        """Greedy chunk starts under cap: each as late as possible."""
+        starts = [0]
+        while True:
+            end = bisect.bisect_right(content, start[starts[-1]] + cap, 0, count + 1) - 1
+            if end >= count:
+                return starts
+            starts.append(end)
+
+    def backward(cap):
+        """Greedy chunk starts under cap, packed from the end: each as early as possible."""
+        starts = [count]
+        while starts[-1] > 0:
+            starts.append(bisect.bisect_left(start, content[starts[-1]] - cap, 0, count))
+        return starts[::-1]
+
+    # The greedy chunk count is the minimum; find the smallest cap that keeps it
+    greedy_starts = forward(max_length)
+    chunk_count = len(greedy_starts)
+    greedy_largest = max(chunk_length(j, i) for j, i in zip(greedy_starts, greedy_starts[1:] + [count]))
+    low = max(piece[2] - piece[1] for piece in pieces)
+    high = max_length
+    while low < high:
+        middle = (low + high) // 2
+        if len(forward(middle)) <= chunk_count:
+            high = middle
+        else:
+            low = middle + 1
+    # Never let the largest chunk grow past what greedy packing gives
+    cap = min(greedy_largest, int(low * (1 + BALANCE_TOLERANCE)))
+
+    # Under cap, chunk b can start anywhere from its earliest (packed from the
+    # end) to its latest (packed from the start) position; choose the starts by
+    # dynamic programming over those ranges
+    latest = forward(cap)
+    earliest = backward(cap)
+    layers = [{0: ((0, 0), None)}]  # per chunk: end -> ((penalty, sum of squares), start)
+    for b in range(1, chunk_count + 1):
+        ends = range(earliest[b], latest[b] + 1) if b < chunk_count else (count,)
+        layer = {}
+        for i in ends:
+            break_penalty = _BREAK_PENALTY[pieces[i][3]] if i < count else 0
+            for j, ((penalty, squares), _) in layers[-1].items():
+                if j >= i or chunk_length(j, i) > cap:
+                    continue
+                cost = (penalty + break_penalty, squares + chunk_length(j, i) ** 2)
+                if i not in layer or cost < layer[i][0]:
+                    layer[i] = (cost, j)
+        layers.append(layer)
+
+    starts = [count]
+    for layer in reversed(layers[1:]):
+        starts.append(layer[starts[-1]][1])
+    starts.reverse()
+
+    for j, i in zip(starts, starts[1:]):
+        parts = [text[pieces[j][1]:pieces[j][2]]]
+        for separator, piece_start, piece_end, _ in pieces[j + 1:i]:
+            parts.append(separator)
+            parts.append(text[piece_start:piece_end])
+        boundary = pieces[i][3] if i < count else END
+        yield Chunk(''.join(parts), pieces[j][1], pieces[i - 1][2], boundary)
+
+
+
+def _is_anchor(piece, spacing):
+    """
+    Whether the break after piece is an anchor.
+
+    The chance is proportional to the piece length, so anchors come on
+    average every spacing characters whatever the paragraph sizes are, and it
+    depends only on the piece text, so it survives edits elsewhere.
+    """
+    digest = hashlib.blake2b(piece.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % spacing < len(piece)
+
+
+def _anchored_chunks(text, max_length):
+    """
+    Pack pieces into chunks that end at content-defined anchors.
+
+    A chunk ends at the first paragraph or sentence break after an anchor
+    once it is at least ANCHOR_MIN_FRACTION full. A chunk that fills up
+    before reaching one is cut where the next piece no longer fits, as with
+    greedy packing. The anchors after an edit resynchronize the cuts.
+    """
+    min_length = int(max_length * ANCHOR_MIN_FRACTION)
+    spacing = max(1, int(max_length * ANCHOR_SPACING_FRACTION))
+    parts = []
+    chunk_length = 0
+    chunk_start = chunk_end = 0
+    at_anchor = False
+
+    for separator, start, end, boundary in _pieces(text, max_length):
+        if end == start:
+            continue  # Empty pieces (from runs of blank lines) would only add separators
+        piece_length = end - start
+        cut = at_anchor and boundary in (PARAGRAPH, SENTENCE)
+        if chunk_length and not cut and chunk_length + piece_length + len(separator) <= max_length:
+            parts.append(separator)
+            parts.append(text[start:end])
+            chunk_length += piece_length + len(separator)
+            chunk_end = end
+        else:
+            if chunk_length:
+                yield Chunk(''.join(parts), chunk_start, chunk_end, boundary)
+            parts = [text[start:end]]
+            chunk_length = piece_length
+            chunk_start, chunk_end = start, end
+        at_anchor = chunk_length >= min_length and _is_anchor(text[start:end], spacing)
+
+    if chunk_length:
+        yield Chunk(''.join(parts), chunk_start, chunk_end, END)
+
+
+def split_text_into_chunks(text, max_length=DEFAULT_MAX_LENGTH, strategy=GREEDY):
+    """
+    Split text into chunks that are under the max_length limit.
+
+    Args:
+        text: The text to split
+        max_length: Maximum length for each chunk (default 9500 to leave buffer)
+        strategy: 'greedy', 'balanced' or 'anchored' (see the module docstring)
+
+    Returns:
+        List of text chunks
+    """
+    return [chunk.text for chunk in iter_chunks(text, max_length, strategy)]
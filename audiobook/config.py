@@ -0,0 +1,99 @@
+"""
+Settings shared by the audiobook scripts and their environment overrides.
+"""
+import os
+
+
+# Rachel, a calm, clear voice. Available voices: https://elevenlabs.io/voices
+DEFAULT_VOICE_ID = '21m00Tcm4TlvDq8ikWAM'
+# Available models: https://elevenlabs.io/docs/api-reference/text-to-speech
+DEFAULT_MODEL_ID = 'eleven_multilingual_v2'
+
+# Eleven Labs has a 10,000 character limit for standard TTS
+MAX_CHUNK_SIZE = 9500  # Use 9500 to leave some buffer
+
+# Number of requests sent to the API at once unless configured otherwise
+DEFAULT_CONCURRENCY = 4
+
+# 'frames' appends MP3 frames as-is, 'reencode' decodes and re-encodes with ffmpeg and
+# 'normalize' also evens out loudness and silence between chunks (see postprocess.py)
+DEFAULT_CONCAT_MODE = 'frames'
+
+# Seconds of silence between chapters
+DEFAULT_CHAPTER_GAP = 2.0
+
+# 'greedy' fills each chunk as far as it goes, 'balanced' evens out chunk sizes and
+# 'anchored' ends chunks at content-defined points so edits only change nearby chunks
+DEFAULT_CHUNKING = 'greedy'
+
+# Rough figures for dry-run estimates: how fast a narrator speaks, and how long a
+# request takes (fixed overhead plus characters synthesized per second)
+NARRATION_CHARACTERS_PER_SECOND = 15
+ESTIMATED_REQUEST_LATENCY = 2.0
+ESTIMATED_SYNTHESIS_CHARACTERS_PER_SECOND = 250
+
+# 'elevenlabs' calls the real API, 'stub' a local stand-in server for offline load testing
+DEFAULT_TTS_BACKEND = 'elevenlabs'
+
+# Formats exported besides the MP3 book, e.g. 'm4b,opus,preview' (none by default)
+DEFAULT_EXPORT_FORMATS = ''
+
+# Use the streaming endpoint, which sends audio while it is still being generated
+DEFAULT_TTS_STREAMING = False
+
+# Longest HLS segment in seconds; players fetch one segment at a time, so shorter
+# segments start playback sooner at the cost of more files and requests
+DEFAULT_HLS_SEGMENT_DURATION = 6.0
+
+
+def voice_id_from_environment():
+    """Voice ID from ELEVEN_LABS_VOICE_ID, or the default voice."""
+    return os.environ.get('ELEVEN_LABS_VOICE_ID', DEFAULT_VOICE_ID)
+
+
+def model_id_from_environment():
+    """Model ID from ELEVEN_LABS_MODEL_ID, or the default model."""
+    return os.environ.get('ELEVEN_LABS_MODEL_ID', DEFAULT_MODEL_ID)
+
+
+def concurrency_from_environment():
+    """Number of concurrent requests from AUDIOBOOK_CONCURRENCY."""
+    return int(os.environ.get('AUDIOBOOK_CONCURRENCY', DEFAULT_CONCURRENCY))
+
+
+def concat_mode_from_environment():
+    """How chunk audio is joined, from AUDIOBOOK_CONCAT."""
+    return os.environ.get('AUDIOBOOK_CONCAT', DEFAULT_CONCAT_MODE)
+
+
+def chapter_gap_from_environment():
+    """Seconds of silence between chapters, from AUDIOBOOK_CHAPTER_GAP."""
+    return float(os.environ.get('AUDIOBOOK_CHAPTER_GAP', DEFAULT_CHAPTER_GAP))
+
+
+def tts_backend_from_environment():
+    """Text-to-speech backend name from AUDIOBOOK_TTS_BACKEND."""
+    return os.environ.get('AUDIOBOOK_TTS_BACKEND', DEFAULT_TTS_BACKEND)
+
+
+def tts_streaming_from_environment():
+    """Whether to use the streaming TTS endpoint, from AUDIOBOOK_TTS_STREAMING."""
+    value = os.environ.get('AUDIOBOOK_TTS_STREAMING')
+    if value is None:
+        return DEFAULT_TTS_STREAMING
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def chunking_from_environment():
+    """Chunk packing strategy from AUDIOBOOK_CHUNKING."""
+    return os.environ.get('AUDIOBOOK_CHUNKING', DEFAULT_CHUNKING)
+
+
+def export_formats_from_environment():
+    """Comma separated export formats from AUDIOBOOK_EXPORT_FORMATS."""
+    return os.environ.get('AUDIOBOOK_EXPORT_FORMATS', DEFAULT_EXPORT_FORMATS)
+
+
+def hls_segment_duration_from_environment():
+    """Longest HLS segment in seconds, from AUDIOBOOK_HLS_SEGMENT_DURATION."""
+    return float(os.environ.get('AUDIOBOOK_HLS_SEGMENT_DURATION', DEFAULT_HLS_SEGMENT_DURATION))
@@ -0,0 +1,11 @@
+"""
+Exceptions raised by the audiobook package.
+"""
+
+
+class AudiobookError(Exception):
+    """
+    An audiobook could not be generated from the given input.
+
+    The scripts print the message and exit with status 1.
+    """
@@ -0,0 +1,344 @@
+"""
+Exporting the finished audiobook to further formats.
+
+The MP3 book is decoded to PCM once, by one ffmpeg process, and the PCM is
+fed to one encoder process per format, so every format is encoded in
+parallel from the same decode instead of each re-reading the book. Formats:
+
+- ``m4b``: AAC audiobook with chapter markers
+- ``opus``: Ogg Opus for the web
+- ``preview``: low-bitrate mono MP3
+
+A format may name its own bitrate (``opus:24k``); its file then carries the
+bitrate in its name, so several bitrates of one format can be exported at
+once.
+"""
+import collections
+import os
+import queue
+import subprocess
+import threading
+
+from .errors import AudiobookError
+from .mp3 import iter_frames
+
+
+# PCM read from the decoder and handed to every encoder at a time
+BLOCK_SIZE = 256 * 1024
+
+# Blocks each encoder may fall behind the decoder before the decoder waits
+QUEUE_BLOCKS = 16
+
+
+class ExportFormat:
+    """
+    How one kind of export file is encoded.
+
+    Attributes:
+        name: Name used in format lists
+        extension: File extension of the export, after the book's name
+        muxer: ffmpeg output format
+        codec_args: ffmpeg arguments choosing the codec and its settings
+        bitrate: Default audio bitrate
+        chapters: Whether chapter markers are written
+    """
+
+    def __init__(self, name, extension, muxer, codec_args, bitrate, chapters=False):
+        self.name = name
+        self.extension = extension
+        self.muxer = muxer
+        self.codec_args = codec_args
+        self.bitrate = bitrate
+        self.chapters = chapters
+
+
+FORMATS = {
+    'm4b': ExportFormat('m4b', '.m4b', 'ipod', ['-c:a', 'aac'], '64k', chapters=True),
+    # libopus only takes 48, 24, 16, 12 or 8 kHz
+    'opus': ExportFormat('opus', '.opus', 'ogg', ['-c:a', 'libopus', '-ar', '48000'], '32k'),
+    'preview': ExportFormat('preview', '.preview.mp3', 'mp3',
+                            ['-c:a', 'libmp3lame', '-ac', '1', '-ar', '22050'], '32k'),
+}
+
+
+class ExportTarget:
+    """One file to export: a format, its bitrate and where it is written."""
+
+    def __init__(self, export_format, bitrate=None):
+        self.format = export_format
+        self.bitrate = bitrate or export_format.bitrate
+        self.named_bitrate = bitrate
+
+    def path(self, output_file):
+        """Path of the export next to the MP3 book output_file."""
+        stem = os.path.splitext(output_file)[0]
+        if self.named_bitrate:
+            stem = f"{stem}.{self.named_bitrate}"
+        return stem + self.format.extension
+
+    def __str__(self):
+        return f"{self.format.name} {self.bitrate}"
+
+
+def parse_formats(specs):
+    """
+    Parse a list of export formats.
+
+    Args:
+        specs: Comma separated string or list of format names, each optionally
+               followed by ':' and a bitrate, e.g. 'm4b,opus:24k,preview'
+
+    Returns:
+        List of ExportTarget
+
+    Raises:
+        AudiobookError: If a format is unknown or listed twice
+    """
+    if isinstance(specs, str):
+        specs = specs.split(',')
+    targets = []
+    seen = set()
+    for spec in specs:
+        spec = spec.strip()
+        if not spec:
+            continue
+        name, _, bitrate = spec.partition(':')
+        if name not in FORMATS:
+            raise AudiobookError(
+                f"Unknown export format '{name}' (expected one of: {', '.join(FORMATS)})"
+            )
+        target = ExportTarget(FORMATS[name], bitrate.strip() or None)
+        key = (name, target.named_bitrate)
+        if key in seen:
+            raise AudiobookError(f"Export format '{spec}' is listed twice")
+        seen.add(key)
+        targets.append(target)
+    return targets
+
+
+def _escape_metadata(value):
+    for character in ('\\', '=', ';', '#', '\n'):
+        value = value.replace(character, '\\' + character)
+    return value
+
+
+def chapter_metadata(chapters):
+    """
+    Chapter markers in ffmpeg's FFMETADATA format.
+
+    Args:
+        chapters: List of (title, duration in seconds) in playback order
+
+    Returns:
+        The metadata file contents as a string
+    """
+    lines = [';FFMETADATA1']
+    start = 0
+    elapsed = 0.0
+    for title, duration in chapters:
+        elapsed += duration
+        end = round(elapsed * 1000)
+        lines += ['[CHAPTER]', 'TIMEBASE=1/1000', f'START={start}', f'END={end}',
+                  f'title={_escape_metadata(title)}']
+        start = end
+    return '\n'.join(lines) + '\n'
+
+
+def _pcm_format(source_file):
+    """Sample rate and channel count of the first audio frame of an MP3 file."""
+    with open(source_file, 'rb') as f:
+        head = f.read(BLOCK_SIZE)
+    for header, _ in iter_frames(head):
+        return header.sample_rate, header.channels
+    raise AudiobookError(f"No MP3 audio frames found in {source_file}")
+
+
+class _FFmpeg:
+    """An ffmpeg process whose error output is collected on a thread."""
+
+    def __init__(self, command, stdin=None, stdout=None, pass_fds=()):
+        try:
+            self.process = subprocess.Popen(
+                command, stdin=stdin, stdout=stdout, stderr=subprocess.PIPE, pass_fds=pass_fds
+            )
+        except FileNotFoundError:
+            raise AudiobookError(f"{command[0]} not found; it is needed to export audio formats") from None
+        self._errors = collections.deque(maxlen=50)
+        self._stderr_thread = threading.Thread(target=self._read_errors, daemon=True)
+        self._stderr_thread.start()
+
+    def _read_errors(self):
+        for line in self.process.stderr:
+            self._errors.append(line.decode('utf-8', 'replace').rstrip())
+
+    def wait(self):
+        """Wait for the process to exit and return an error message if it failed."""
+        self.process.wait()
+        self._stderr_thread.join()
+        if self.process.stdout is not None:
+            self.process.stdout.close()
+        if self.process.returncode != 0:
+            return '\n'.join(self._errors) or f'exit code {self.process.returncode}'
+        return None
+
+    def kill(self):
+        self.process.kill()
+        self.wait()
+
+
+def _metadata_pipe(text):
+    """
+    A pipe an ffmpeg process can read text from as an input, fed by a thread,
+    so the metadata never touches the disk.
+
+    Returns:
+        Tuple of (read end file descriptor, writer thread)
+    """
+    read_fd, write_fd = os.pipe()
+
+    def write():
+        try:
+            with open(write_fd, 'wb') as f:
+                f.write(text.encode('utf-8'))
+        except OSError:
+            pass  # The encoder failed; its error is reported instead
+
+    writer = threading.Thread(target=write, daemon=True)
+    writer.start()
+    return read_fd, writer
+
+
+class _Encoder(_FFmpeg):
+    """
+    One encoder process, fed PCM blocks through a queue by its own thread so
+    a slow encoder only holds back the decoder once its queue is full.
+    """
+
+    def __init__(self, command, pass_fds=()):
+        super().__init__(command, stdin=subprocess.PIPE, pass_fds=pass_fds)
+        self.broken = False
+        self._blocks = queue.Queue(QUEUE_BLOCKS)
+        self._writer = threading.Thread(target=self._write_blocks, daemon=True)
+        self._writer.start()
+
+    def _write_blocks(self):
+        while True:
+            block = self._blocks.get()
+            if block is None:
+                break
+            if self.broken:
+                # Keep emptying the queue so the decoder never waits on a dead encoder
+                continue
+            try:
+                self.process.stdin.write(block)
+            except (BrokenPipeError, OSError):
+                self.broken = True
+        try:
+            self.process.stdin.close()
+        except (BrokenPipeError, OSError):
+            pass
+
+    def feed(self, block):
+        self._blocks.put(block)
+
+    def finish(self):
+        """Close the input and wait for the encoder; return an error message if it failed."""
+        self._blocks.put(None)
+        self._writer.join()
+        return self.wait()
+
+    def kill(self):
+        super().kill()
+        self._blocks.put(None)
+        self._writer.join()
+
+
+def export_formats(source_file, output_file, targets, chapters=None, ffmpeg='ffmpeg'):
+    """
+    Encode an MP3 book to several formats from a single decode.
+
+    Every file is written to its path + '.partial' and renamed once all of
+    them are complete, so a failed export never leaves truncated files.
+    Chapter markers reach the encoders through pipes, not temporary files.
+
+    Args:
+        source_file: Path of the MP3 book to encode
+        output_file: Path the export file names are derived from
+        targets: List of ExportTarget to encode
+        chapters: Optional list of (title, duration in seconds) used for
+                  chapter markers
+        ffmpeg: ffmpeg executable
+
+    Returns:
+        List of the paths written, in the order of targets
+
+    Raises:
+        AudiobookError: If ffmpeg is missing or fails
+    """
+    sample_rate, channels = _pcm_format(source_file)
+    pcm = ['-f', 's16le', '-ar', str(sample_rate), '-ac', str(channels)]
+    paths = [target.path(output_file) for target in targets]
+
+    metadata = chapter_metadata(chapters) if chapters else None
+
+    decoder = None
+    encoders = []
+    writers = []
+    try:
+        for target, path in zip(targets, paths):
+            command = [ffmpeg, '-hide_banner', '-loglevel', 'error', '-y'] + pcm + ['-i', 'pipe:0']
+            pass_fds = ()
+            if metadata and target.format.chapters:
+                read_fd, writer = _metadata_pipe(metadata)
+                writers.append(writer)
+                pass_fds = (read_fd,)
+                command += ['-f', 'ffmetadata', '-i', f'pipe:{read_fd}',
+                            '-map', '0:a', '-map_metadata', '1', '-map_chapters', '1']
+            command += target.format.codec_args + ['-b:a', target.bitrate, '-f', target.format.muxer,
+                                                   path + '.partial']
+            try:
+                encoders.append(_Encoder(command, pass_fds))
+            finally:
+                # The encoder holds its own copy of the read end; once it exits
+                # the writer sees the pipe close instead of blocking
+                for fd in pass_fds:
+                    os.close(fd)
+
+        decoder = _FFmpeg(
+            [ffmpeg, '-hide_banner', '-loglevel', 'error', '-i', source_file] + pcm + ['pipe:1'],
+            stdout=subprocess.PIPE,
+        )
+        while True:
+            block = decoder.process.stdout.read(BLOCK_SIZE)
+            if not block:
+                break
+            for encoder in encoders:
+                encoder.feed(block)
+
+        errors = []
+        error = decoder.wait()
+        if error:
+            errors.append(f"decoding {source_file}: {error}")
+        for target, encoder in zip(targets, encoders):
+            error = encoder.finish()
+            if error:
+                errors.append(f"{target}: {error}")
+        encoders = []
+        if errors:
+            raise AudiobookError("ffmpeg failed to export audio:\n" + '\n'.join(errors))
+
+        for path in paths:
+            os.replace(path + '.partial', path)
+        return paths
+    except BaseException:
+        for process in encoders + ([decoder] if decoder else []):
+            process.kill()
+        for path in paths:
+            try:
+                os.unlink(path + '.partial')
+            except OSError:
+                pass
+        raise
+    finally:
+        for writer in writers:
+            writer.join()
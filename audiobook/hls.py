@@ -0,0 +1,280 @@
+"""
+Progressive HLS output: the book as short MP3 segments listed in a playlist
+that grows while the book is synthesized.
+
+Segments are cut on MP3 frame boundaries as each chunk arrives, so a player
+pointed at the playlist can start within seconds of a run starting instead
+of waiting for the finished book. While the run goes on the playlist is an
+EVENT playlist that players poll for new segments; finishing it appends
+EXT-X-ENDLIST.
+
+The audio is split into sections, one per chapter, separated by
+EXT-X-DISCONTINUITY. The timestamps of each section start at zero and its
+segments are cut from its own start, so a chapter that did not change gives
+byte-identical segments. Segments are named after a hash of their contents:
+those are reused as they are and a CDN keeps serving them from its cache,
+and only the segments of changed chapters get new names.
+
+With chapter playlists each section also gets a playlist of its own
+(chapter-01.m3u8, ...) pointing at the same segments.
+"""
+import hashlib
+import math
+import os
+import struct
+
+from . import config
+from .mp3 import iter_frames, silence_like
+
+
+PLAYLIST_NAME = 'index.m3u8'
+SEGMENT_PREFIX = 'segment-'
+CHAPTER_PLAYLIST_PREFIX = 'chapter-'
+
+# Packed audio segments carry the MPEG-2 timestamp (90 kHz, 33 bits) of their
+# first sample in an ID3 PRIV frame with this owner
+TIMESTAMP_OWNER = b'com.apple.streaming.transportStreamTimestamp'
+TIMESTAMP_CLOCK = 90000
+
+
+def _syncsafe(value):
+    """32-bit ID3 size with the top bit of every byte clear."""
+    return bytes((value >> shift) & 0x7F for shift in (21, 14, 7, 0))
+
+
+def timestamp_tag(seconds):
+    """
+    ID3v2.4 tag giving the timestamp of the first sample of a packed audio
+    segment, as the HLS specification requires.
+    """
+    timestamp = round(seconds * TIMESTAMP_CLOCK) & ((1 << 33) - 1)
+    payload = TIMESTAMP_OWNER + b'\x00' + struct.pack('>Q', timestamp)
+    frame = b'PRIV' + _syncsafe(len(payload)) + b'\x00\x00' + payload
+    return b'ID3\x04\x00\x00' + _syncsafe(len(frame)) + frame
+
+
+def _write_atomic(path, data):
+    # Write then rename, so a player or CDN never fetches a half-written file
+    partial_path = path + '.partial'
+    try:
+        with open(partial_path, 'wb') as f:
+            f.write(data)
+        os.replace(partial_path, path)
+    except BaseException:
+        try:
+            os.unlink(partial_path)
+        except OSError:
+            pass
+        raise
+
+
+class _Segment:
+    """One segment file and its duration in seconds."""
+
+    def __init__(self, name, duration):
+        self.name = name
+        self.duration = duration
+
+
+class _Section:
+    """The segments of one chapter, with its title and own playlist name, if any."""
+
+    def __init__(self, title, playlist_name):
+        self.title = title
+        self.playlist_name = playlist_name
+        self.segments = []
+        self.ended = False
+
+
+class HLSWriter:
+    """
+    Writes audio as HLS segments and playlists while it is produced.
+
+    Audio is fed one section at a time: start_section(), then write() with
+    each MP3 chunk of the section in order. The playlists are rewritten after
+    every write, only ever by appending segments, and finish() ends them and
+    removes segments left over from earlier runs that are no longer listed.
+
+    Attributes:
+        directory: Directory of the playlists and segments
+        segment_duration: Longest segment in seconds
+        chapter_playlists: Whether each section gets a playlist of its own
+        written: Segments written by this run
+        reused: Segments already there from an earlier run
+        removed: Stale segments and playlists removed by finish()
+    """
+
+    def __init__(self, directory, segment_duration=config.DEFAULT_HLS_SEGMENT_DURATION,
+                 chapter_playlists=False):
+        self.directory = directory
+        self.segment_duration = segment_duration
+        self.chapter_playlists = chapter_playlists
+        self.written = 0
+        self.reused = 0
+        self.removed = 0
+        self._sections = []
+        self._section = None
+        self._frames = []            # frames of the segment being filled
+        self._frame_samples = 0      # samples in those frames
+        self._section_samples = 0    # samples of the section already in segments
+        self._sample_rate = None
+        self._gap = 0.0              # silence still to be put before the next frame
+        self._finished = False
+        os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def from_environment(cls, directory, chapter_playlists=False):
+        """
+        Create a writer for directory with the segment duration from
+        AUDIOBOOK_HLS_SEGMENT_DURATION.
+        """
+        return cls(directory, config.hls_segment_duration_from_environment(), chapter_playlists)
+
+    @property
+    def playlist_path(self):
+        return os.path.join(self.directory, PLAYLIST_NAME)
+
+    @property
+    def segments(self):
+        """Every segment written so far, in playback order."""
+        return [segment for section in self._sections for segment in section.segments]
+
+    def start_section(self, title=None, gap=0.0):
+        """
+        Start a new section, such as a chapter, whose timestamps start at zero.
+
+        Args:
+            title: Shown in the playlist next to the first segment of the section
+            gap: Seconds of silence the section starts with
+        """
+        if self._section is not None:
+            self.end_section()
+        playlist_name = None
+        if self.chapter_playlists:
+            playlist_name = f'{CHAPTER_PLAYLIST_PREFIX}{len(self._sections) + 1:02d}.m3u8'
+        self._section = _Section(title, playlist_name)
+        self._sections.append(self._section)
+        self._section_samples = 0
+        self._gap = gap
+
+    def write(self, audio_bytes):
+        """
+        Append one MP3 chunk to the current section and publish the segments
+        it completes. The last, partly filled segment waits for more audio.
+
+        Args:
+            audio_bytes: MP3 chunk as bytes
+        """
+        if self._section is None:
+            self.start_section()
+        for header, frame in iter_frames(audio_bytes):
+            if self._gap:
+                # The silence takes the format of the audio it goes before
+                for silent_header, silent_frame in iter_frames(silence_like(header, self._gap)):
+                    self._add_frame(silent_header, silent_frame)
+                self._gap = 0.0
+            self._add_frame(header, frame)
+        self._write_playlists()
+
+    def feed(self, audio_chunks):
+        """
+        Yield each MP3 chunk of audio_chunks after writing it to the current
+        section, to segment a stream on its way to being joined.
+        """
+        for audio_bytes in audio_chunks:
+            self.write(audio_bytes)
+            yield audio_bytes
+
+    def end_section(self):
+        """Write the last segment of the current section and end its playlist."""
+        if self._section is None:
+            return
+        if self._frames:
+            self._flush()
+        self._section.ended = True
+        self._write_playlists()
+        self._section = None
+
+    def finish(self):
+        """
+        End the playlist, so players know the book is complete, and remove
+        the segments and chapter playlists no longer listed.
+        """
+        self.end_section()
+        self._finished = True
+        self._write_playlists()
+        self._remove_stale()
+
+    def report(self):
+        """Print where the playlist is and how many segments were reused."""
+        segments = self.segments
+        duration = sum(segment.duration for segment in segments)
+        print(f"📡 HLS playlist: {self.playlist_path} ({len(segments)} segments, {duration / 60:.1f} minutes)")
+        print(f"   {self.written} segments written, {self.reused} reused, {self.removed} stale files removed")
+
+    def _add_frame(self, header, frame):
+        samples = header.samples_per_frame
+        # Cut before a segment would grow past the segment duration
+        if self._frames and self._frame_samples + samples > self.segment_duration * header.sample_rate:
+            self._flush()
+        self._frames.append(frame)
+        self._frame_samples += samples
+        self._sample_rate = header.sample_rate
+
+    def _flush(self):
+        data = timestamp_tag(self._section_samples / self._sample_rate) + b''.join(self._frames)
+        # 64 bits of the hash are plenty to tell the segments of a book apart
+        name = f'{SEGMENT_PREFIX}{hashlib.sha256(data).hexdigest()[:16]}.mp3'
+        path = os.path.join(self.directory, name)
+        if os.path.exists(path):
+            self.reused += 1
+        else:
+            _write_atomic(path, data)
+            self.written += 1
+        self._section.segments.append(_Segment(name, self._frame_samples / self._sample_rate))
+        self._section_samples += self._frame_samples
+        self._frames = []
+        self._frame_samples = 0
+
+    def _playlist(self, sections, ended):
+        lines = [
+            '#EXTM3U',
+            '#EXT-X-VERSION:3',
+            f'#EXT-X-TARGETDURATION:{max(1, math.ceil(self.segment_duration))}',
+            '#EXT-X-MEDIA-SEQUENCE:0',
+            # Segments are only ever appended, so players keep polling until the end tag
+            '#EXT-X-PLAYLIST-TYPE:EVENT',
+        ]
+        started = False
+        for section in sections:
+            for i, segment in enumerate(section.segments):
+                if i == 0 and started:
+                    # Each section restarts its timestamps
+                    lines.append('#EXT-X-DISCONTINUITY')
+                title = ' '.join((section.title or '').split()) if i == 0 else ''
+                lines.append(f'#EXTINF:{segment.duration:.3f},{title}')
+                lines.append(segment.name)
+                started = True
+        if ended:
+            lines.append('#EXT-X-ENDLIST')
+        return ('\n'.join(lines) + '\n').encode('utf-8')
+
+    def _write_playlists(self):
+        _write_atomic(self.playlist_path, self._playlist(self._sections, self._finished))
+        section = self._section
+        if section is not None and section.playlist_name:
+            _write_atomic(
+                os.path.join(self.directory, section.playlist_name), self._playlist([section], section.ended)
+            )
+
+    def _remove_stale(self):
+        listed = {PLAYLIST_NAME}
+        for section in self._sections:
+            listed.add(section.playlist_name)
+            listed.update(segment.name for segment in section.segments)
+        for name in os.listdir(self.directory):
+            is_segment = name.startswith(SEGMENT_PREFIX) and name.endswith('.mp3')
+            is_chapter_playlist = name.startswith(CHAPTER_PLAYLIST_PREFIX) and name.endswith('.m3u8')
+            if (is_segment or is_chapter_playlist) and name not in listed:
+                os.unlink(os.path.join(self.directory, name))
+                self.removed += 1
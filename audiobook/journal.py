@@ -0,0 +1,163 @@
+"""
+Crash-safe journal of synthesized chunks for resumable runs.
+
+Every chunk's audio is written to the journal directory and flushed to disk
+as soon as it arrives, followed by a line in journal.jsonl recording the
+hash of its text. If the run dies partway through a book, a resumed run reads the
+journal back and only requests the chunks that are missing, instead of paying
+for the whole book again. The journal is removed once the run has finished.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+
+JOURNAL_VERSION = 2
+
+
+def _fsync_directory(directory):
+    """Make a rename inside directory durable (a no-op where unsupported)."""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _text_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class RunJournal:
+    """
+    Journal of completed chunks for one run, stored under a directory.
+
+    Entries are keyed by the hash of the chunk text, and the journal is only
+    reused with the same voice settings, so a resumed run reuses the audio of
+    every chunk whose text is unchanged wherever it now falls. In a chapter
+    build, chapters written before the failure are no longer pending when
+    resuming, which moves every later chunk to a new position.
+    """
+
+    def __init__(self, directory, settings, resume=False):
+        """
+        Open the journal, reading back completed chunks when resuming.
+
+        Args:
+            directory: Directory holding the journal and chunk audio
+            settings: Dict of everything besides the text that affects the audio;
+                      a journal written with other settings is discarded
+            resume: Reuse chunks from an earlier run instead of starting over
+        """
+        self.directory = directory
+        self.settings = settings
+        self.path = os.path.join(directory, 'journal.jsonl')
+        self.entries = {}  # text hash -> entry
+        self.resumed = 0
+
+        if resume:
+            self._load()
+        else:
+            self.discard()
+        if not os.path.exists(self.path):
+            os.makedirs(directory, exist_ok=True)
+            self._append({'type': 'run', 'version': JOURNAL_VERSION, 'settings': settings})
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                lines = f.readlines()
+        except OSError:
+            return
+        records = []
+        for line in lines:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                break  # A line cut short by a crash ends the journal
+        header = records[0] if records else {}
+        if (header.get('type') != 'run' or header.get('version') != JOURNAL_VERSION
+                or header.get('settings') != self.settings):
+            self.discard()
+            return
+        for record in records[1:]:
+            if record.get('type') == 'chunk':
+                self.entries[record['text_hash']] = record
+
+    def _append(self, record):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, sort_keys=True) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _audio_path(self, text_hash):
+        return os.path.join(self.directory, f'chunk-{text_hash}.mp3')
+
+    def lookup(self, text):
+        """
+        Return the journaled audio for a chunk with this text, or None.
+
+        Audio is only returned if the file on disk is intact.
+        """
+        text_hash = _text_hash(text)
+        entry = self.entries.get(text_hash)
+        if entry is None:
+            return None
+        try:
+            with open(self._audio_path(text_hash), 'rb') as f:
+                audio_bytes = f.read()
+        except OSError:
+            return None
+        if hashlib.sha256(audio_bytes).hexdigest() != entry.get('audio_hash'):
+            return None
+        self.resumed += 1
+        return audio_bytes
+
+    def record(self, index, text, audio_bytes):
+        """
+        Durably store the audio for the chunk at index of this run.
+        """
+        text_hash = _text_hash(text)
+        if text_hash in self.entries:
+            return  # a repeated chunk, journaled already
+        path = self._audio_path(text_hash)
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(audio_bytes)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, path)
+        except BaseException:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+            raise
+        _fsync_directory(self.directory)
+
+        entry = {
+            'type': 'chunk',
+            'index': index,
+            'characters': len(text),
+            'text_hash': text_hash,
+            'audio_bytes': len(audio_bytes),
+            'audio_hash': hashlib.sha256(audio_bytes).hexdigest(),
+        }
+        self._append(entry)
+        self.entries[text_hash] = entry
+
+    def __len__(self):
+        return len(self.entries)
+
+    def discard(self):
+        """Remove the journal and its audio."""
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self.entries = {}
@@ -0,0 +1,128 @@
+"""
+Build manifest for incremental chapter rebuilds.
+
+The manifest remembers, for each chapter source file, the hashes of its
+markdown and narration text, the voice settings it was rendered with and where
+the rendered chapter audio lives. A chapter whose text and settings have not
+changed since the last run can reuse that audio instead of being synthesized
+again.
+"""
+import hashlib
+import json
+import os
+import tempfile
+
+
+MANIFEST_VERSION = 1
+
+
+def content_hash(text):
+    """Return the hex SHA-256 of a string."""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class BuildManifest:
+    """
+    JSON manifest of rendered chapters, keyed by chapter source path.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.chapters = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                data = {}
+            if data.get('version') == MANIFEST_VERSION:
+                self.chapters = data.get('chapters', {})
+
+    @staticmethod
+    def _key(chapter_file):
+        return os.path.normpath(chapter_file)
+
+    def reusable_audio(self, chapter_file, text_hash, settings):
+        """
+        Return the audio path rendered for this chapter if it is still current.
+
+        Args:
+            chapter_file: Path to the chapter markdown file
+            text_hash: Hash of the chapter text after markdown conversion
+            settings: Dict of everything else that affects the rendered audio
+
+        Returns:
+            Path to the existing chapter audio, or None if it must be rebuilt
+        """
+        entry = self.chapters.get(self._key(chapter_file))
+        if entry is None:
+            return None
+        if entry.get('text_hash') != text_hash or entry.get('settings') != settings:
+            return None
+        audio_path = entry.get('audio_path')
+        if not audio_path or not os.path.exists(audio_path):
+            return None
+        return audio_path
+
+    def duration(self, chapter_file):
+        """
+        Duration in seconds recorded for a chapter's audio, or None if unknown.
+        """
+        entry = self.chapters.get(self._key(chapter_file))
+        return entry.get('duration') if entry else None
+
+    def record(self, chapter_file, source_hash, text_hash, settings, audio_path, duration=None):
+        """
+        Record a freshly rendered chapter.
+        """
+        self.chapters[self._key(chapter_file)] = {
+            'source_hash': source_hash,
+            'text_hash': text_hash,
+            'settings': settings,
+            'audio_path': audio_path,
+        }
+        if duration is not None:
+            self.chapters[self._key(chapter_file)]['duration'] = round(duration, 6)
+
+    def save(self):
+        """
+        Write the manifest atomically so an interrupted run never corrupts it.
+        """
+        directory = os.path.dirname(self.path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(
+                    {'version': MANIFEST_VERSION, 'chapters': self.chapters},
+                    f, indent=2, sort_keys=True,
+                )
+            os.replace(temp_path, self.path)
+        except BaseException:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+            raise
+
+
+def default_chapters_dir(output_file):
+    """
+    Directory for per-chapter audio and the manifest: <output name>_chapters.
+    """
+    return os.path.splitext(output_file)[0] + '_chapters'
+
+
+def manifest_path(chapters_dir):
+    """Path of the build manifest inside chapters_dir."""
+    return os.path.join(chapters_dir, 'manifest.json')
+
+
+def chapter_audio_path(chapters_dir, chapter_file):
+    """
+    Path where the rendered audio for a chapter is kept between runs.
+    """
+    # The path hash keeps chapters with the same file name in different directories apart
+    stem = os.path.splitext(os.path.basename(chapter_file))[0]
+    path_hash = content_hash(os.path.normpath(chapter_file))[:8]
+    return os.path.join(chapters_dir, f"{stem}-{path_hash}.mp3")
@@ -0,0 +1,330 @@
+"""
+Structured performance metrics for audiobook builds.
+
+A run records one JSON line per event as it happens:
+
+- ``run_start`` and ``run``: settings, then totals and the outcome
+- ``stage``: seconds spent in a local stage (markdown conversion, chunking,
+  joining, export, encoding other formats) and the peak RSS of the process at its end
+- ``chunk``: where each chunk's audio came from ('api', 'cache', 'journal' or
+  'duplicate') and, for API requests, latency, time to first byte, bytes per
+  second, retries and characters billed
+- ``chapter``: size and reuse of each chapter in a chapter build
+- ``scheduler``: the concurrency limit requests settled on, its peak and how
+  often it was cut, and the characters sent
+
+At the end of the run the totals are also written in the Prometheus text
+format, for the node_exporter textfile collector. Both outputs are optional;
+without either, recording is a no-op.
+"""
+import contextlib
+import json
+import os
+import resource
+import sys
+import threading
+import time
+import uuid
+
+
+# Quantiles reported for request latency and time to first byte
+QUANTILES = (0.5, 0.9, 0.99)
+
+SOURCES = ('api', 'cache', 'journal', 'duplicate')
+
+
+def peak_rss_bytes():
+    """Highest resident set size of this process so far, in bytes."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _quantile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class RequestStats:
+    """
+    Timing of one synthesis request, filled in by synthesis.synthesize.
+
+    latency and ttfb describe the final (successful) attempt; seconds also
+    covers failed attempts and the backoff between them.
+    """
+
+    def __init__(self, characters, source='api'):
+        self.characters = characters
+        self.source = source
+        self.seconds = 0.0
+        self.latency = None
+        self.ttfb = None
+        self.bytes = 0
+        self.retries = 0
+
+    @property
+    def bytes_per_second(self):
+        if not self.latency:
+            return None
+        return self.bytes / self.latency
+
+    @property
+    def billed_characters(self):
+        return self.characters if self.source == 'api' else 0
+
+
+class _StageTimer:
+    """Time spent waiting on input, to be left out of a stage's time."""
+
+    def __init__(self):
+        self.excluded = 0.0
+
+    def exclude(self, iterable):
+        """Yield from iterable, not counting the time spent producing items."""
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.excluded += time.perf_counter() - start
+            yield item
+
+
+class RunMetrics:
+    """
+    Metrics for one build, written as JSON lines and a Prometheus textfile.
+
+    The JSON lines file is appended to, so several runs can share it; each
+    record carries the run id. The Prometheus file is replaced at the end of
+    each run. Records may be added from several threads.
+    """
+
+    def __init__(self, jsonl_path=None, prometheus_path=None):
+        self.jsonl_path = jsonl_path
+        self.prometheus_path = prometheus_path
+        self.run_id = uuid.uuid4().hex[:12]
+        self._lock = threading.Lock()
+        self._file = None
+        self._labels = {}        # chunk index -> extra fields for its record
+        self._output = None
+        self._started = None
+        self._stage_seconds = {}
+        self._chunks = dict.fromkeys(SOURCES, 0)
+        self._latencies = []
+        self._ttfbs = []
+        self._bytes = 0
+        self._retries = 0
+        self._billed_characters = 0
+        self._scheduler = None
+
+    @classmethod
+    def from_environment(cls, jsonl_path=None, prometheus_path=None):
+        """
+        Create metrics written to AUDIOBOOK_METRICS (JSON lines) and
+        AUDIOBOOK_METRICS_PROM (Prometheus textfile), when set. Paths given
+        as arguments take precedence.
+        """
+        return cls(
+            jsonl_path or os.environ.get('AUDIOBOOK_METRICS') or None,
+            prometheus_path or os.environ.get('AUDIOBOOK_METRICS_PROM') or None,
+        )
+
+    @property
+    def enabled(self):
+        return bool(self.jsonl_path or self.prometheus_path)
+
+    def _write(self, record_type, **fields):
+        if not self.jsonl_path:
+            return
+        record = {'type': record_type, 'run_id': self.run_id, 'time': round(time.time(), 3)}
+        record.update(fields)
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        with self._lock:
+            if self._file is None:
+                directory = os.path.dirname(self.jsonl_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._file = open(self.jsonl_path, 'a', encoding='utf-8')
+            self._file.write(line)
+            self._file.flush()
+
+    @contextlib.contextmanager
+    def run(self, output_file, settings):
+        """
+        Wrap a whole build. The run record and the Prometheus file are written
+        when it ends, whether it succeeded or not.
+        """
+        self._output = output_file
+        self._started = time.perf_counter()
+        self._write('run_start', output=output_file, settings=settings)
+        status = 'failed'
+        try:
+            yield self
+            status = 'succeeded'
+        finally:
+            self._finish(status)
+
+    @contextlib.contextmanager
+    def stage(self, name, **fields):
+        """
+        Time a local stage. Time spent pulling from an iterable wrapped with
+        the yielded timer's exclude() is not counted.
+        """
+        timer = _StageTimer()
+        start = time.perf_counter()
+        try:
+            yield timer
+        finally:
+            self._record_stage(name, time.perf_counter() - start - timer.excluded, fields)
+
+    def timed(self, name, iterable, **fields):
+        """
+        Yield from iterable, recording the time spent producing its items as
+        stage name. Used for stages that are pulled lazily, such as chunking.
+        """
+        seconds = 0.0
+        iterator = iter(iterable)
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    seconds += time.perf_counter() - start
+                yield item
+        finally:
+            self._record_stage(name, seconds, fields)
+
+    def _record_stage(self, name, seconds, fields):
+        with self._lock:
+            self._stage_seconds[name] = self._stage_seconds.get(name, 0.0) + seconds
+        if self.jsonl_path:
+            self._write('stage', stage=name, seconds=round(seconds, 6),
+                        peak_rss_bytes=peak_rss_bytes(), **fields)
+
+    def label_chunk(self, index, **fields):
+        """Add fields (such as the chapter) to the record of chunk index."""
+        if self.enabled:
+            self._labels[index] = fields
+
+    def chunk(self, index, stats):
+        """Record where chunk index came from and how long its request took."""
+        with self._lock:
+            self._chunks[stats.source] += 1
+            if stats.source == 'api':
+                self._latencies.append(stats.latency)
+                self._ttfbs.append(stats.ttfb)
+                self._bytes += stats.bytes
+                self._retries += stats.retries
+                self._billed_characters += stats.billed_characters
+        if not self.jsonl_path:
+            return
+        fields = self._labels.pop(index, {})
+        if stats.source == 'api':
+            fields.update(
+                seconds=round(stats.seconds, 6),
+                latency=round(stats.latency, 6),
+                ttfb=round(stats.ttfb, 6) if stats.ttfb is not None else None,
+                bytes=stats.bytes,
+                bytes_per_second=round(stats.bytes_per_second or 0, 1),
+                retries=stats.retries,
+            )
+        self._write('chunk', index=index, characters=stats.characters, source=stats.source,
+                    billed_characters=stats.billed_characters, **fields)
+
+    def chapter(self, chapter, **fields):
+        """Record one chapter of a chapter build."""
+        self._write('chapter', chapter=chapter, **fields)
+
+    def scheduler(self, **fields):
+        """Record how the request scheduler adapted over the run."""
+        with self._lock:
+            self._scheduler = fields
+        self._write('scheduler', **fields)
+
+    def _finish(self, status):
+        seconds = time.perf_counter() - self._started
+        with self._lock:
+            totals = {
+                'seconds': round(seconds, 6),
+                'chunks': dict(self._chunks),
+                'api_requests': len(self._latencies),
+                'retries': self._retries,
+                'billed_characters': self._billed_characters,
+                'bytes': self._bytes,
+                'stage_seconds': {name: round(value, 6) for name, value in self._stage_seconds.items()},
+                'peak_rss_bytes': peak_rss_bytes(),
+            }
+            if self._scheduler is not None:
+                totals['scheduler'] = dict(self._scheduler)
+        self._write('run', output=self._output, status=status, **totals)
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self.prometheus_path:
+            self._write_prometheus(status, totals)
+
+    def _write_prometheus(self, status, totals):
+        output = self._output.replace('\\', '\\\\').replace('"', '\\"')
+        lines = []
+
+        def metric(name, metric_type, help_text, samples):
+            lines.append(f'# HELP audiobook_{name} {help_text}')
+            lines.append(f'# TYPE audiobook_{name} {metric_type}')
+            for labels, value in samples:
+                label_text = ','.join([f'output="{output}"'] + [f'{k}="{v}"' for k, v in labels])
+                lines.append(f'audiobook_{name}{{{label_text}}} {value}')
+
+        metric('run_success', 'gauge', 'Whether the last run succeeded.',
+               [((), 1 if status == 'succeeded' else 0)])
+        metric('run_timestamp_seconds', 'gauge', 'When the last run finished.',
+               [((), round(time.time(), 3))])
+        metric('run_duration_seconds', 'gauge', 'Wall clock time of the last run.',
+               [((), totals['seconds'])])
+        metric('chunks', 'gauge', 'Chunks in the last run by where their audio came from.',
+               [((('source', source),), count) for source, count in totals['chunks'].items()])
+        metric('api_requests', 'gauge', 'Synthesis requests made by the last run.',
+               [((), totals['api_requests'])])
+        metric('api_retries', 'gauge', 'Retried synthesis requests in the last run.',
+               [((), totals['retries'])])
+        metric('billed_characters', 'gauge', 'Characters sent to the TTS API by the last run.',
+               [((), totals['billed_characters'])])
+        metric('api_bytes', 'gauge', 'Audio bytes received by the last run.',
+               [((), totals['bytes'])])
+        for name, values, help_text in (
+            ('api_request_duration_seconds', self._latencies, 'Latency of synthesis requests.'),
+            ('api_time_to_first_byte_seconds', [v for v in self._ttfbs if v is not None],
+             'Time to the first audio byte of synthesis requests.'),
+        ):
+            samples = []
+            if values:
+                samples = [((('quantile', q),), round(_quantile(values, q), 6)) for q in QUANTILES]
+            metric(name, 'summary', help_text, samples)
+            lines.append(f'audiobook_{name}_sum{{output="{output}"}} {round(sum(values), 6)}')
+            lines.append(f'audiobook_{name}_count{{output="{output}"}} {len(values)}')
+        total_latency = sum(self._latencies)
+        metric('api_bytes_per_second', 'gauge', 'Audio bytes received per second of request time.',
+               [((), round(totals['bytes'] / total_latency, 1) if total_latency else 0)])
+        if 'scheduler' in totals:
+            scheduler = totals['scheduler']
+            metric('concurrency_limit', 'gauge', 'Concurrency limit requests settled on in the last run.',
+                   [((), scheduler['concurrency'])])
+            metric('concurrency_peak', 'gauge', 'Highest concurrency limit reached in the last run.',
+                   [((), scheduler['peak_concurrency'])])
+            metric('concurrency_decreases', 'gauge', 'Times the concurrency limit was cut in the last run.',
+                   [((), scheduler['decreases'])])
+        metric('stage_duration_seconds', 'gauge', 'Time spent in each local stage of the last run.',
+               [((('stage', name),), value) for name, value in totals['stage_seconds'].items()])
+        metric('peak_rss_bytes', 'gauge', 'Peak resident set size of the last run.',
+               [((), totals['peak_rss_bytes'])])
+
+        # Write then rename, so the collector never reads a half-written file
+        partial_path = self.prometheus_path + '.partial'
+        with open(partial_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(partial_path, self.prometheus_path)
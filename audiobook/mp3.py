@@ -0,0 +1,355 @@
+"""
+Frame-level MP3 handling.
+
+MP3 files are a sequence of self-contained frames, optionally wrapped in ID3
+tags and led by a Xing/Info/VBRI frame describing the whole file. Appending the
+audio frames of several files gives a valid MP3 with exactly the same audio,
+without decoding to PCM and encoding again.
+"""
+import struct
+
+
+# Bitrates in kbps indexed by [version is MPEG-1][layer][bitrate index]
+_BITRATES = {
+    True: {
+        1: (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+        2: (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+        3: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    },
+    False: {
+        1: (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+        2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+        3: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    },
+}
+
+# Sample rates in Hz indexed by version bits then sample rate index
+_SAMPLE_RATES = {
+    0b11: (44100, 48000, 32000),  # MPEG-1
+    0b10: (22050, 24000, 16000),  # MPEG-2
+    0b00: (11025, 12000, 8000),   # MPEG-2.5
+}
+
+_LAYERS = {0b11: 1, 0b10: 2, 0b01: 3}
+
+
+class FrameHeader:
+    """
+    Decoded fields of a 4-byte MPEG audio frame header.
+    """
+
+    def __init__(self, raw, version, layer, bitrate, sample_rate, padding, channel_mode):
+        self.raw = raw
+        self.version = version
+        self.layer = layer
+        self.bitrate = bitrate
+        self.sample_rate = sample_rate
+        self.padding = padding
+        self.channel_mode = channel_mode
+
+    @property
+    def is_mpeg1(self):
+        return self.version == 0b11
+
+    @property
+    def channels(self):
+        return 1 if self.channel_mode == 0b11 else 2
+
+    @property
+    def samples_per_frame(self):
+        if self.layer == 1:
+            return 384
+        if self.layer == 3 and not self.is_mpeg1:
+            return 576
+        return 1152
+
+    @property
+    def frame_length(self):
+        """Length of the whole frame in bytes, header included."""
+        if self.layer == 1:
+            return (12 * self.bitrate * 1000 // self.sample_rate + self.padding) * 4
+        coefficient = 72 if self.layer == 3 and not self.is_mpeg1 else 144
+        return coefficient * self.bitrate * 1000 // self.sample_rate + self.padding
+
+    @property
+    def side_info_length(self):
+        """Length of the Layer III side information following the header."""
+        if self.is_mpeg1:
+            return 17 if self.channels == 1 else 32
+        return 9 if self.channels == 1 else 17
+
+    def stream_format(self):
+        """Fields that must match for frames to be joined into one stream."""
+        return (self.version, self.layer, self.sample_rate, self.channels)
+
+
+def parse_frame_header(data, offset=0):
+    """
+    Parse the frame header at data[offset:offset + 4].
+
+    Returns:
+        FrameHeader, or None if the bytes are not a valid frame header
+    """
+    if offset + 4 > len(data):
+        return None
+    raw = bytes(data[offset:offset + 4])
+    value = struct.unpack('>I', raw)[0]
+    if value >> 21 != 0x7FF:
+        return None
+
+    version = (value >> 19) & 0b11
+    layer = _LAYERS.get((value >> 17) & 0b11)
+    bitrate_index = (value >> 12) & 0b1111
+    sample_rate_index = (value >> 10) & 0b11
+    if version == 0b01 or layer is None or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+
+    return FrameHeader(
+        raw=raw,
+        version=version,
+        layer=layer,
+        bitrate=_BITRATES[version == 0b11][layer][bitrate_index],
+        sample_rate=_SAMPLE_RATES[version][sample_rate_index],
+        padding=(value >> 9) & 1,
+        channel_mode=(value >> 6) & 0b11,
+    )
+
+
+def _id3v2_length(data):
+    """Length of a leading ID3v2 tag, or 0 if there is none."""
+    if len(data) < 10 or data[:3] != b'ID3':
+        return 0
+    size = 0
+    for byte in data[6:10]:
+        size = (size << 7) | (byte & 0x7F)
+    has_footer = data[5] & 0x10
+    return 10 + size + (10 if has_footer else 0)
+
+
+def _audio_end(data):
+    """Offset where trailing ID3v1/APEv2 tags start, or len(data)."""
+    end = len(data)
+    if end >= 128 and data[end - 128:end - 125] == b'TAG':
+        end -= 128
+    if end >= 32 and data[end - 32:end - 24] == b'APETAGEX':
+        tag_size = struct.unpack('<I', bytes(data[end - 20:end - 16]))[0]
+        has_header = data[end - 9] & 0x80
+        end -= tag_size + (32 if has_header else 0)
+    return max(end, 0)
+
+
+def is_info_frame(data, header, offset):
+    """
+    Check whether the frame at offset is a Xing/Info/VBRI header frame.
+
+    These frames carry no audio; they describe the frame count and size of the
+    file they were written for, so they must not be copied into a joined file.
+    """
+    if header.layer != 3:
+        return False
+    xing_offset = offset + 4 + header.side_info_length
+    if bytes(data[xing_offset:xing_offset + 4]) in (b'Xing', b'Info'):
+        return True
+    return bytes(data[offset + 36:offset + 40]) == b'VBRI'
+
+
+def _iter_frame_offsets(data, view):
+    """Yield (header, offset, length) for each audio frame; see iter_frames."""
+    offset = _id3v2_length(data)
+    end = _audio_end(data)
+    first = True
+
+    while offset + 4 <= end:
+        header = parse_frame_header(view, offset)
+        if header is None or offset + header.frame_length > end:
+            # Not a frame boundary; resynchronize on the next sync byte
+            offset = data.find(b'\xff', offset + 1, end)
+            if offset == -1:
+                break
+            continue
+        length = header.frame_length
+        if not (first and is_info_frame(view, header, offset)):
+            yield header, offset, length
+        first = False
+        offset += length
+
+
+def iter_frames(data):
+    """
+    Yield (header, frame_bytes) for each audio frame in an MP3 file.
+
+    ID3 tags and Xing/Info/VBRI frames are skipped. Garbage between frames is
+    skipped by scanning for the next valid frame header.
+
+    Args:
+        data: Contents of an MP3 file as bytes
+    """
+    view = memoryview(data)
+    for header, offset, length in _iter_frame_offsets(data, view):
+        yield header, view[offset:offset + length]
+
+
+def audio_frames(data):
+    """
+    The audio frames of an MP3 file as one buffer, without its tags and
+    Info frame, ready to be piped to a decoder.
+
+    Frames written by one encoder follow each other without gaps, so this is
+    usually a view into data and nothing is copied; only frames separated by
+    garbage are joined into new bytes.
+
+    Args:
+        data: Contents of an MP3 file as bytes
+
+    Returns:
+        Bytes-like object (memoryview or bytes)
+    """
+    view = memoryview(data)
+    runs = []  # [start, end] of each stretch of back-to-back frames
+    for _, offset, length in _iter_frame_offsets(data, view):
+        if runs and runs[-1][1] == offset:
+            runs[-1][1] = offset + length
+        else:
+            runs.append([offset, offset + length])
+    if len(runs) == 1:
+        return view[runs[0][0]:runs[0][1]]
+    return b''.join(view[start:end] for start, end in runs)
+
+
+def frames_duration(data):
+    """
+    Duration in seconds of the audio frames in an MP3 file, from their headers.
+
+    Args:
+        data: Contents of an MP3 file as bytes
+    """
+    samples = 0
+    sample_rate = None
+    for header, _ in iter_frames(data):
+        samples += header.samples_per_frame
+        sample_rate = header.sample_rate
+    return samples / sample_rate if sample_rate else 0.0
+
+
+def _info_frame(header, frame_count, byte_count, vbr):
+    """Build a Xing/Info frame with the same format as header."""
+    # Build the header without padding so the frame length is predictable
+    raw = bytearray(header.raw)
+    raw[2] &= ~0x02
+    template = parse_frame_header(bytes(raw))
+    frame = bytearray(template.frame_length)
+    frame[:4] = raw
+    position = 4 + template.side_info_length
+    tag = b'Xing' if vbr else b'Info'
+    # Flags 0x1 and 0x2: frame count and byte count fields are present
+    fields = tag + struct.pack('>III', 0x3, frame_count, byte_count)
+    if position + len(fields) > len(frame):
+        return None
+    frame[position:position + len(fields)] = fields
+    return bytes(frame)
+
+
+def concatenate_mp3(sources, output_file):
+    """
+    Join MP3 files by copying their audio frames into one file.
+
+    Only one source is held at a time and no audio is decoded. A fresh Info
+    header describing the joined stream is written at the start of the output.
+
+    Args:
+        sources: Iterable of MP3 file contents as bytes, in playback order
+        output_file: Path of the MP3 file to write
+
+    Returns:
+        Duration of the joined audio in seconds
+
+    Raises:
+        ValueError: If the sources differ in sample rate, channels or MPEG
+                    version, or contain no audio frames
+    """
+    stream_format = None
+    info_header = None
+    info_length = 0
+    bitrates = set()
+    frame_count = 0
+    audio_bytes = 0
+    samples = 0
+
+    with open(output_file, 'wb') as out:
+        for data in sources:
+            for header, frame in iter_frames(data):
+                if stream_format is None:
+                    stream_format = header.stream_format()
+                    sample_rate = header.sample_rate
+                    # Reserve room for the Info frame; its counts are filled in at the end
+                    info_header = header
+                    placeholder = _info_frame(header, 0, 0, vbr=False)
+                    if placeholder is not None:
+                        info_length = len(placeholder)
+                        out.write(placeholder)
+                elif header.stream_format() != stream_format:
+                    raise ValueError(
+                        'Cannot join MP3 streams with different formats: '
+                        f'{stream_format} and {header.stream_format()}'
+                    )
+                out.write(frame)
+                bitrates.add(header.bitrate)
+                frame_count += 1
+                audio_bytes += len(frame)
+                samples += header.samples_per_frame
+
+        if stream_format is None:
+            raise ValueError('No MP3 audio frames found in sources')
+
+        if info_length:
+            info = _info_frame(
+                info_header, frame_count, info_length + audio_bytes, vbr=len(bitrates) > 1
+            )
+            out.seek(0)
+            out.write(info)
+
+    return samples / sample_rate
+
+
+def silence_like(header, duration):
+    """
+    Silent frames in the same format as header, to put a pause between
+    joined streams without decoding them.
+
+    Args:
+        header: FrameHeader of the audio the silence goes next to
+        duration: Length of the pause in seconds
+
+    Returns:
+        MP3 frames as bytes
+    """
+    raw = bytearray(header.raw)
+    raw[1] |= 0x01   # no CRC
+    raw[2] &= 0xFD   # no padding
+    # Zeroed side information and main data decode as silence
+    frame = bytes(raw) + bytes(parse_frame_header(raw).frame_length - 4)
+    return frame * round(duration * header.sample_rate / header.samples_per_frame)
+
+
+def silent_frames(duration, bitrate=128, sample_rate=44100):
+    """
+    Build a valid mono MPEG-1 Layer III stream of silence.
+
+    Every frame has zeroed side information and main data, which decoders
+    render as silence. Used by the local stand-in TTS server.
+
+    Args:
+        duration: Length of the audio in seconds
+        bitrate: Bitrate in kbps (one of the MPEG-1 Layer III bitrates)
+        sample_rate: Sample rate in Hz (44100, 48000 or 32000)
+
+    Returns:
+        MP3 audio as bytes
+    """
+    bitrate_index = _BITRATES[True][3].index(bitrate)
+    sample_rate_index = _SAMPLE_RATES[0b11].index(sample_rate)
+    # Sync, MPEG-1, Layer III, no CRC / bitrate, sample rate / mono, original
+    header = bytes([0xFF, 0xFB, (bitrate_index << 4) | (sample_rate_index << 2), 0xC4])
+    frame = header + bytes(parse_frame_header(header).frame_length - 4)
+    frame_count = max(1, round(duration * sample_rate / 1152))
+    return frame * frame_count
@@ -0,0 +1,247 @@
+"""
+The stages every chapter-based build goes through, shared by chapter builds,
+batches and previews.
+
+Settings left unset are filled in from the environment. Each chapter is
+converted to narration text and checked against its build manifest: the
+unchanged ones reuse their rendered audio, the changed ones become pending
+chapters whose chunks are synthesized together and written back chapter by
+chapter as their last chunk arrives. The finished book is then exported to
+the other formats.
+"""
+import itertools
+import os
+
+from . import config
+from .audio import CONCAT_MODES, join_audio
+from .chunking import STRATEGIES, iter_chunks
+from .errors import AudiobookError
+from .export import export_formats, parse_formats
+from .manifest import BuildManifest, chapter_audio_path, content_hash, manifest_path
+from .markdown import markdown_title, markdown_to_text
+from .mp3 import frames_duration
+
+
+def resolve_settings(voice_id, model_id, concurrency, concat_mode, chunking):
+    """
+    Fill in unset settings from the environment.
+
+    Raises:
+        AudiobookError: If the concat mode or chunking strategy is unknown
+    """
+    if voice_id is None:
+        env_voice_id = config.voice_id_from_environment()
+        print(f"🔍 ELEVEN_LABS_VOICE_ID from environment: '{env_voice_id}'")
+        voice_id = env_voice_id
+    if model_id is None:
+        model_id = config.model_id_from_environment()
+    if concurrency is None:
+        concurrency = config.concurrency_from_environment()
+    if concat_mode is None:
+        concat_mode = config.concat_mode_from_environment()
+    if chunking is None:
+        chunking = config.chunking_from_environment()
+    if concat_mode not in CONCAT_MODES:
+        raise AudiobookError(
+            f"Unknown concat mode '{concat_mode}' (expected one of: {', '.join(CONCAT_MODES)})"
+        )
+    if chunking not in STRATEGIES:
+        raise AudiobookError(
+            f"Unknown chunking strategy '{chunking}' (expected one of: {', '.join(STRATEGIES)})"
+        )
+    return voice_id, model_id, concurrency, concat_mode, chunking
+
+
+def resolve_formats(formats):
+    """Export targets from formats, or from the environment when unset."""
+    if formats is None:
+        formats = config.export_formats_from_environment()
+    return parse_formats(formats)
+
+
+def report_scheduler(scheduler, metrics):
+    """Print and record the concurrency a run settled on."""
+    scheduler.report()
+    metrics.scheduler(**scheduler.summary())
+
+
+def join_modes(concat_mode):
+    """
+    How a chapter build joins the chunks of each chapter, and then the chapters.
+    """
+    if concat_mode == 'normalize':
+        # Chapters are normalized as they are written, so joining them only appends frames
+        return 'normalize', 'frames'
+    return 'frames', concat_mode
+
+
+def print_file_size(output_file, label):
+    """Print the size of a written file in megabytes."""
+    file_size = os.path.getsize(output_file)
+    file_size_mb = file_size / (1024 * 1024)
+    print(f"📦 {label}: {file_size_mb:.2f} MB")
+
+
+class ChapterAudio:
+    """
+    The audio of one chapter of a book, with its title and, once known, its
+    duration in seconds.
+    """
+
+    def __init__(self, title, audio_path, duration=None):
+        self.title = title
+        self.audio_path = audio_path
+        self.duration = duration
+
+
+def chapter_labels(chapter_file, book=None):
+    """Fields identifying a chapter, and its book in a batch, in metrics records."""
+    chapter_name = os.path.basename(chapter_file)
+    if book is None:
+        return {'chapter': chapter_name}
+    return {'book': book, 'chapter': chapter_name}
+
+
+class PendingChapter:
+    """A chapter whose audio has to be synthesized."""
+
+    def __init__(self, chapter_file, source_hash, text_hash, audio, text_content, manifest, book=None):
+        self.chapter_file = chapter_file
+        self.name = os.path.basename(chapter_file)
+        self.source_hash = source_hash
+        self.text_hash = text_hash
+        self.audio = audio
+        self.audio_path = audio.audio_path
+        self.text_content = text_content
+        self.manifest = manifest
+        self.book = book
+        self.text_chunks = []
+
+    @property
+    def labels(self):
+        """Fields identifying the chapter in metrics records."""
+        return chapter_labels(self.chapter_file, self.book)
+
+
+def plan_chapters(chapter_files, chapters_dir, settings, metrics, book=None):
+    """
+    Convert each chapter to narration text and find the ones that changed.
+
+    Returns:
+        Tuple of (ChapterAudio of every chapter with text in order, list of
+        PendingChapter that need synthesizing)
+    """
+    os.makedirs(chapters_dir, exist_ok=True)
+    manifest = BuildManifest(manifest_path(chapters_dir))
+    chapters = []
+    pending = []
+    for i, chapter_file in enumerate(chapter_files):
+        chapter_name = os.path.basename(chapter_file)
+        labels = chapter_labels(chapter_file, book)
+        print(f"\n{'='*70}")
+        print(f"📖 Chapter {i+1}/{len(chapter_files)}: {chapter_name}")
+        print(f"{'='*70}")
+
+        # Read the markdown file
+        with open(chapter_file, 'r', encoding='utf-8') as f:
+            markdown_content = f.read()
+
+        # Convert to plain text
+        with metrics.stage('markdown', **labels):
+            text_content = markdown_to_text(markdown_content)
+
+        if len(text_content) == 0:
+            print(f"   ⚠️  Warning: No text content found, skipping chapter")
+            continue
+
+        print(f"   Text length: {len(text_content)} characters")
+
+        title = markdown_title(markdown_content) or os.path.splitext(chapter_name)[0]
+        text_hash = content_hash(text_content)
+        audio_path = manifest.reusable_audio(chapter_file, text_hash, settings)
+        if audio_path is not None:
+            print(f"   ♻️  Unchanged since last build, reusing {audio_path}")
+            metrics.chapter(characters=len(text_content), reused=True, **labels)
+            audio = ChapterAudio(title, audio_path, manifest.duration(chapter_file))
+        else:
+            audio = ChapterAudio(title, chapter_audio_path(chapters_dir, chapter_file))
+            pending.append(PendingChapter(
+                chapter_file, content_hash(markdown_content), text_hash, audio, text_content,
+                manifest, book,
+            ))
+        chapters.append(audio)
+    return chapters, pending
+
+
+def iter_chapter_texts(chapters, chunking, metrics, planned):
+    """
+    Yield the chunk texts of chapters in order, appending (chapter, text) to
+    planned for each one so the audio can be matched back to its chapter.
+    """
+    for chapter in chapters:
+        chunks = iter_chunks(chapter.text_content, config.MAX_CHUNK_SIZE, chunking)
+        for chunk in metrics.timed('chunking', chunks, **chapter.labels):
+            metrics.label_chunk(len(planned), **chapter.labels)
+            chapter.text_chunks.append(chunk.text)
+            planned.append((chapter, chunk.text))
+            print(f"   📦 {chapter.name} chunk {len(chapter.text_chunks)}: {len(chunk.text)} characters")
+            yield chunk.text
+
+
+def write_chapters(audio_chunks, planned, settings, metrics, concat_mode):
+    """
+    Write each chapter from its chunks in order and record it in its manifest.
+
+    Yields:
+        Each PendingChapter once its audio is written
+    """
+    chapter_mode, _ = join_modes(concat_mode)
+    chunks_by_chapter = itertools.groupby(enumerate(audio_chunks), key=lambda item: planned[item[0]][0])
+    for chapter, chapter_chunks in chunks_by_chapter:
+        # Time spent waiting for synthesis is not part of joining
+        with metrics.stage('join', **chapter.labels) as stage:
+            chapter.audio.duration = join_audio(
+                stage.exclude(audio_bytes for _, audio_bytes in chapter_chunks), chapter.audio_path,
+                chapter_mode,
+            )
+        print(f"   💾 Chapter written: {chapter.audio_path}")
+        chapter.manifest.record(
+            chapter.chapter_file, chapter.source_hash, chapter.text_hash, settings, chapter.audio_path,
+            chapter.audio.duration,
+        )
+        chapter.manifest.save()
+        metrics.chapter(characters=len(chapter.text_content), chunks=len(chapter.text_chunks),
+                        reused=False, **chapter.labels)
+        yield chapter
+
+
+def export_book(output_file, targets, chapters, metrics, gap=0.0, **labels):
+    """
+    Encode the finished MP3 book to every export format at once.
+
+    Args:
+        output_file: Path of the MP3 book
+        targets: List of export.ExportTarget
+        chapters: Optional list of ChapterAudio used for chapter markers
+        metrics: RunMetrics recording the encode stage
+        gap: Seconds of silence between chapters in the book
+        **labels: Fields identifying the book in metrics records
+    """
+    if not targets:
+        return
+    markers = None
+    if chapters:
+        markers = []
+        for chapter in chapters:
+            if chapter.duration is None:
+                # Chapters rendered before durations were recorded in the manifest
+                with open(chapter.audio_path, 'rb') as f:
+                    chapter.duration = frames_duration(f.read())
+            markers.append((chapter.title, chapter.duration + gap))
+        # The last chapter is not followed by a gap
+        markers[-1] = (markers[-1][0], markers[-1][1] - gap)
+    print(f"🎚️  Encoding {', '.join(str(target) for target in targets)} from one decode...")
+    with metrics.stage('encode', **labels):
+        paths = export_formats(output_file, output_file, targets, markers)
+    for path in paths:
+        print(f"   💾 Written: {path} ({os.path.getsize(path) / (1024 * 1024):.2f} MB)")
@@ -0,0 +1,201 @@
+"""
+Dry-run planning: what a build would synthesize, and what it would cost.
+
+Planning only converts markdown and splits it into chunks. It checks the TTS
+cache and the build manifest to see which chunks and chapters would be reused,
+and estimates narration length and wall-clock time from rough figures in
+config.py. It never contacts the API and never imports the ElevenLabs SDK or
+starts ffmpeg, so it is cheap enough to run on every change to the text.
+"""
+import heapq
+import json
+import os
+
+from . import config
+from .backends import cache_namespace
+from .cache import TTSCache, cache_key
+from .chunking import STRATEGIES, iter_chunks
+from .errors import AudiobookError
+from .manifest import BuildManifest, content_hash, manifest_path
+from .markdown import markdown_to_text
+from .scheduler import RequestScheduler
+from .synthesis import VOICE_SETTINGS, render_settings
+
+
+PLAN_VERSION = 1
+
+
+def _request_seconds(characters, request_latency, synthesis_rate):
+    return request_latency + characters / synthesis_rate
+
+
+def estimate_wall_clock(request_sizes, concurrency, request_latency=config.ESTIMATED_REQUEST_LATENCY,
+                        synthesis_rate=config.ESTIMATED_SYNTHESIS_CHARACTERS_PER_SECOND):
+    """
+    Estimate how long a run takes to synthesize requests of the given sizes.
+
+    Requests are handed to concurrency workers in order, as the real run does.
+
+    Args:
+        request_sizes: Character count of each request, in submission order
+        concurrency: Number of requests in flight at once
+        request_latency: Fixed seconds of overhead per request
+        synthesis_rate: Characters synthesized per second within a request
+
+    Returns:
+        Estimated seconds until the last request finishes
+    """
+    workers = [0.0] * max(1, concurrency)
+    for characters in request_sizes:
+        start = heapq.heappop(workers)
+        heapq.heappush(workers, start + _request_seconds(characters, request_latency, synthesis_rate))
+    return max(workers)
+
+
+def plan_audiobook(chapter_files, voice_id=None, model_id=None, concurrency=None, chapters_dir=None,
+                   cache=None, chunking=None):
+    """
+    Plan the synthesis of an audiobook without making any API calls.
+
+    Args:
+        chapter_files: List of paths to chapter markdown files (in order)
+        voice_id: Voice ID to plan for (default: ELEVEN_LABS_VOICE_ID or Rachel)
+        model_id: Model ID to plan for (default: ELEVEN_LABS_MODEL_ID or eleven_multilingual_v2)
+        concurrency: Number of requests in flight at once (default: AUDIOBOOK_CONCURRENCY or 4)
+        chapters_dir: Directory holding the build manifest, to count reusable
+                      chapters; None when chapters are not kept between runs
+        cache: TTSCache to count cached chunks in (default: from the environment)
+        chunking: Chunk packing strategy (default: AUDIOBOOK_CHUNKING or 'greedy')
+
+    Returns:
+        Dict with the plan settings, a list of per-chapter plans and totals
+    """
+    if voice_id is None:
+        voice_id = config.voice_id_from_environment()
+    if model_id is None:
+        model_id = config.model_id_from_environment()
+    if concurrency is None:
+        concurrency = config.concurrency_from_environment()
+    if cache is None:
+        cache = TTSCache.from_environment()
+    if chunking is None:
+        chunking = config.chunking_from_environment()
+    if chunking not in STRATEGIES:
+        raise AudiobookError(
+            f"Unknown chunking strategy '{chunking}' (expected one of: {', '.join(STRATEGIES)})"
+        )
+
+    settings = render_settings(voice_id, model_id, chunking, config.concat_mode_from_environment())
+    namespace = cache_namespace()
+    manifest = BuildManifest(manifest_path(chapters_dir)) if chapters_dir else None
+
+    chapters = []
+    request_sizes = []
+    for chapter_file in chapter_files:
+        with open(chapter_file, 'r', encoding='utf-8') as f:
+            text_content = markdown_to_text(f.read())
+
+        chunk_sizes = []
+        cached_chunks = 0
+        billable_characters = 0
+        reused = (
+            manifest is not None
+            and manifest.reusable_audio(chapter_file, content_hash(text_content), settings) is not None
+        )
+        for chunk in iter_chunks(text_content, config.MAX_CHUNK_SIZE, chunking):
+            chunk_sizes.append(len(chunk.text))
+            if reused:
+                continue
+            if cache_key(chunk.text, voice_id, model_id, VOICE_SETTINGS, namespace) in cache:
+                cached_chunks += 1
+            else:
+                billable_characters += len(chunk.text)
+                request_sizes.append(len(chunk.text))
+
+        chapters.append({
+            'file': chapter_file,
+            'characters': len(text_content),
+            'chunks': len(chunk_sizes),
+            'chunk_sizes': chunk_sizes,
+            'reused': reused,
+            'cached_chunks': cached_chunks,
+            'requests': len(chunk_sizes) - cached_chunks if not reused else 0,
+            'billable_characters': billable_characters,
+            'narration_seconds': round(len(text_content) / config.NARRATION_CHARACTERS_PER_SECOND, 1),
+        })
+
+    characters = sum(chapter['characters'] for chapter in chapters)
+    return {
+        'version': PLAN_VERSION,
+        'settings': {
+            'voice_id': voice_id,
+            'model_id': model_id,
+            'tts_backend': config.tts_backend_from_environment(),
+            'max_chunk_size': config.MAX_CHUNK_SIZE,
+            'chunking': chunking,
+            'concurrency': concurrency,
+            'max_characters': RequestScheduler.from_environment(concurrency).max_characters,
+        },
+        'chapters': chapters,
+        'totals': {
+            'chapters': len(chapters),
+            'reused_chapters': sum(chapter['reused'] for chapter in chapters),
+            'characters': characters,
+            'chunks': sum(chapter['chunks'] for chapter in chapters),
+            'cached_chunks': sum(chapter['cached_chunks'] for chapter in chapters),
+            'requests': len(request_sizes),
+            'billable_characters': sum(request_sizes),
+            'narration_seconds': round(characters / config.NARRATION_CHARACTERS_PER_SECOND, 1),
+            'estimated_wall_clock_seconds': round(estimate_wall_clock(request_sizes, concurrency), 1),
+        },
+    }
+
+
+def _format_duration(seconds):
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+
+def print_plan(plan):
+    """Print a plan in the same style as a build's progress output."""
+    settings = plan['settings']
+    print(f"🧮 Plan for voice {settings['voice_id']} / {settings['model_id']} "
+          f"({settings['tts_backend']} backend, {settings['chunking']} chunking, "
+          f"{settings['concurrency']} at a time)")
+    for chapter in plan['chapters']:
+        print(f"\n📖 {os.path.basename(chapter['file'])}: {chapter['characters']} characters, "
+              f"{chapter['chunks']} chunks")
+        if chapter['chunk_sizes']:
+            sizes = chapter['chunk_sizes']
+            print(f"   📦 Chunk sizes: {', '.join(str(size) for size in sizes)} "
+                  f"(smallest {min(sizes)}, largest {max(sizes)})")
+        if chapter['reused']:
+            print("   ♻️  Unchanged since last build, would be reused")
+        else:
+            print(f"   🗄️  Cached: {chapter['cached_chunks']}/{chapter['chunks']} chunks, "
+                  f"{chapter['billable_characters']} characters to synthesize")
+        print(f"   ⏱️  Narration: {_format_duration(chapter['narration_seconds'])}")
+
+    totals = plan['totals']
+    print(f"\n{'='*70}")
+    print(f"📚 {totals['chapters']} chapters ({totals['reused_chapters']} reused), "
+          f"{totals['chunks']} chunks, {totals['characters']} characters")
+    print(f"🗄️  {totals['cached_chunks']} chunks cached, {totals['requests']} requests to make")
+    print(f"💳 Billable characters: {totals['billable_characters']}")
+    max_characters = settings.get('max_characters')
+    if max_characters is not None and totals['billable_characters'] > max_characters:
+        print(f"⚠️  More than the character quota of {max_characters} (AUDIOBOOK_MAX_CHARACTERS); "
+              f"the build would stop once it is reached")
+    print(f"⏱️  Narration: {_format_duration(totals['narration_seconds'])}, "
+          f"estimated synthesis time: {_format_duration(totals['estimated_wall_clock_seconds'])}")
+
+
+def write_plan_json(plan, path):
+    """Write a plan as JSON to path, or to stdout if path is '-'."""
+    data = json.dumps(plan, indent=2)
+    if path == '-':
+        print(data)
+        return
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(data + '\n')
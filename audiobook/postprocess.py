@@ -0,0 +1,280 @@
+"""
+Evening out synthesized speech on PCM with NumPy.
+
+Chunks from separate requests differ in loudness and in the silence before
+and after the speech. With concat mode 'normalize', every chunk is decoded to
+16-bit PCM by ffmpeg and:
+
+- its loudness is measured as gated RMS (the gating of ITU-R BS.1770, without
+  the K-weighting filter) and a gain brings it to a common target, limited so
+  peaks stay under a ceiling
+- silence below a threshold is trimmed from both ends
+- a fixed pause, the section gap, is put between chunks in its place
+
+The result is encoded by one long-running ffmpeg process. Only the PCM of the
+chunk being processed is held, and it is measured and written in blocks, so
+memory does not grow with the length of the book.
+
+NumPy is only imported once audio is normalized.
+"""
+import os
+import subprocess
+
+from .audio import DEFAULT_BITRATE, StreamingEncoder
+from .errors import AudiobookError
+from .mp3 import audio_frames, iter_frames
+
+
+DEFAULT_TARGET_LOUDNESS = -20.0    # dBFS RMS; ACX asks for -23 to -18
+DEFAULT_PEAK_CEILING = -3.0        # dBFS
+DEFAULT_SILENCE_THRESHOLD = -50.0  # dBFS
+DEFAULT_SECTION_GAP = 0.75         # seconds between chunks
+
+# Loudness is measured over windows this long, ignoring windows below the
+# absolute gate and then those more than RELATIVE_GATE below the rest
+LOUDNESS_WINDOW = 0.4
+ABSOLUTE_GATE = -70.0
+RELATIVE_GATE = -10.0
+
+# Silence kept before and after the speech when trimming, in seconds
+TRIM_PADDING = 0.05
+
+# Sample frames processed at a time
+BLOCK_FRAMES = 64 * 1024
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise AudiobookError("numpy is needed to normalize audio (pip install numpy)") from None
+    return numpy
+
+
+class PostProcessing:
+    """
+    Loudness and silence settings for normalizing chunks.
+
+    Attributes:
+        target_loudness: Loudness every chunk is brought to, in dBFS RMS
+        peak_ceiling: Highest sample peak a gain may produce, in dBFS
+        silence_threshold: Level below which chunk edges count as silence, in dBFS
+        section_gap: Seconds of silence put between chunks
+    """
+
+    def __init__(self, target_loudness=DEFAULT_TARGET_LOUDNESS, peak_ceiling=DEFAULT_PEAK_CEILING,
+                 silence_threshold=DEFAULT_SILENCE_THRESHOLD, section_gap=DEFAULT_SECTION_GAP):
+        self.target_loudness = target_loudness
+        self.peak_ceiling = peak_ceiling
+        self.silence_threshold = silence_threshold
+        self.section_gap = section_gap
+
+    @classmethod
+    def from_environment(cls):
+        """
+        Settings from AUDIOBOOK_LOUDNESS, AUDIOBOOK_PEAK_CEILING,
+        AUDIOBOOK_SILENCE_THRESHOLD and AUDIOBOOK_SECTION_GAP.
+        """
+        return cls(
+            target_loudness=float(os.environ.get('AUDIOBOOK_LOUDNESS', DEFAULT_TARGET_LOUDNESS)),
+            peak_ceiling=float(os.environ.get('AUDIOBOOK_PEAK_CEILING', DEFAULT_PEAK_CEILING)),
+            silence_threshold=float(os.environ.get('AUDIOBOOK_SILENCE_THRESHOLD', DEFAULT_SILENCE_THRESHOLD)),
+            section_gap=float(os.environ.get('AUDIOBOOK_SECTION_GAP', DEFAULT_SECTION_GAP)),
+        )
+
+    def settings(self):
+        """The settings as a dict, for the render settings of a build."""
+        return {
+            'target_loudness': self.target_loudness,
+            'peak_ceiling': self.peak_ceiling,
+            'silence_threshold': self.silence_threshold,
+            'section_gap': self.section_gap,
+        }
+
+
+def _level(db):
+    """Sample value of a level in dBFS."""
+    return 32768 * 10 ** (db / 20)
+
+
+def loudness(pcm, sample_rate):
+    """
+    Gated RMS loudness of PCM audio.
+
+    Args:
+        pcm: int16 array of shape (frames, channels)
+        sample_rate: Sample rate in Hz
+
+    Returns:
+        Loudness in dBFS, or None if the audio is silent
+    """
+    np = _numpy()
+    window = max(1, int(LOUDNESS_WINDOW * sample_rate))
+    windows = len(pcm) // window or 1
+    powers = []
+    windows_per_block = max(1, BLOCK_FRAMES // window)
+    for start in range(0, windows, windows_per_block):
+        stop = min(windows, start + windows_per_block)
+        block = pcm[start * window:stop * window].astype(np.float32) / 32768
+        powers.append(np.mean((block * block).reshape(stop - start, -1), axis=1))
+    power = np.concatenate(powers)
+
+    power = power[power > 10 ** (ABSOLUTE_GATE / 10)]
+    if not len(power):
+        return None
+    power = power[power > np.mean(power) * 10 ** (RELATIVE_GATE / 10)]
+    return 10 * np.log10(np.mean(power))
+
+
+def peak_level(pcm):
+    """Highest absolute sample of PCM audio in dBFS, or None if it is all zero."""
+    np = _numpy()
+    if not len(pcm):
+        return None
+    peak = max(int(pcm.max()), -int(pcm.min()))
+    return 20 * np.log10(peak / 32768) if peak else None
+
+
+def speech_bounds(pcm, threshold, sample_rate):
+    """
+    First and last frame of PCM audio louder than threshold, with TRIM_PADDING
+    of silence kept around them.
+
+    Blocks are scanned from each end, so only the silence is looked at.
+
+    Args:
+        pcm: int16 array of shape (frames, channels)
+        threshold: Silence threshold in dBFS
+        sample_rate: Sample rate in Hz
+
+    Returns:
+        Tuple of (start, end) frame indices; start == end if it is all silence
+    """
+    np = _numpy()
+    level = _level(threshold)
+    padding = int(TRIM_PADDING * sample_rate)
+
+    def loud(block):
+        return np.flatnonzero(np.max(np.abs(block.astype(np.int32)), axis=1) > level)
+
+    start = None
+    for offset in range(0, len(pcm), BLOCK_FRAMES):
+        found = loud(pcm[offset:offset + BLOCK_FRAMES])
+        if len(found):
+            start = offset + found[0]
+            break
+    if start is None:
+        return 0, 0
+
+    end = start
+    for stop in range(len(pcm), start, -BLOCK_FRAMES):
+        offset = max(start, stop - BLOCK_FRAMES)
+        found = loud(pcm[offset:stop])
+        if len(found):
+            end = offset + found[-1] + 1
+            break
+    return max(0, start - padding), min(len(pcm), end + padding)
+
+
+def decode_mp3(audio_bytes, sample_rate, channels, ffmpeg='ffmpeg'):
+    """
+    Decode MP3 audio to PCM with ffmpeg.
+
+    Args:
+        audio_bytes: MP3 audio as bytes
+        sample_rate: Sample rate of the PCM in Hz
+        channels: Channels of the PCM
+        ffmpeg: ffmpeg executable
+
+    Returns:
+        int16 array of shape (frames, channels)
+    """
+    np = _numpy()
+    frames = audio_frames(audio_bytes)
+    command = [
+        ffmpeg, '-hide_banner', '-loglevel', 'error',
+        '-f', 'mp3', '-i', 'pipe:0',
+        '-f', 's16le', '-ar', str(sample_rate), '-ac', str(channels), 'pipe:1',
+    ]
+    try:
+        result = subprocess.run(command, input=frames, capture_output=True)
+    except FileNotFoundError:
+        raise AudiobookError(f"{ffmpeg} not found; it is needed to normalize audio") from None
+    if result.returncode != 0:
+        details = result.stderr.decode('utf-8', 'replace').strip() or f'exit code {result.returncode}'
+        raise AudiobookError(f"ffmpeg failed to decode audio: {details}")
+    return np.frombuffer(result.stdout, dtype='<i2').reshape(-1, channels)
+
+
+def normalize_mp3(audio_chunks, output_file, processing=None, gap=None, bitrate=DEFAULT_BITRATE,
+                  ffmpeg='ffmpeg'):
+    """
+    Match the loudness of MP3 chunks, trim the silence around each and encode
+    them into one MP3 file with a pause between chunks.
+
+    Args:
+        audio_chunks: Iterable of MP3 bytes in playback order
+        output_file: Path of the MP3 file to write
+        processing: PostProcessing settings (default: from the environment)
+        gap: Seconds of silence between chunks (default: the section gap)
+        bitrate: Bitrate of the output
+        ffmpeg: ffmpeg executable
+
+    Returns:
+        Duration of the audio in seconds
+
+    Raises:
+        AudiobookError: If numpy or ffmpeg is missing or ffmpeg fails
+    """
+    np = _numpy()
+    if processing is None:
+        processing = PostProcessing.from_environment()
+    if gap is None:
+        gap = processing.section_gap
+
+    encoder = None
+    frames_written = 0
+    try:
+        for audio_bytes in audio_chunks:
+            if encoder is None:
+                # The first chunk sets the format; later chunks are decoded to match it
+                header = next((header for header, _ in iter_frames(audio_bytes)), None)
+                if header is None:
+                    raise AudiobookError("No MP3 audio frames found in the first chunk")
+                sample_rate, channels = header.sample_rate, header.channels
+                encoder = StreamingEncoder(
+                    output_file, bitrate, ffmpeg,
+                    input_args=('-f', 's16le', '-ar', str(sample_rate), '-ac', str(channels)),
+                )
+            elif gap:
+                silence = np.zeros((int(gap * sample_rate), channels), dtype='<i2')
+                encoder.write_raw(silence.tobytes())
+                frames_written += len(silence)
+
+            pcm = decode_mp3(audio_bytes, sample_rate, channels, ffmpeg)
+            start, end = speech_bounds(pcm, processing.silence_threshold, sample_rate)
+            speech = pcm[start:end]
+            level = loudness(speech, sample_rate) if len(speech) else None
+            gain = 0.0
+            if level is not None:
+                gain = processing.target_loudness - level
+                peak = peak_level(speech)
+                if peak is not None:
+                    gain = min(gain, processing.peak_ceiling - peak)
+            factor = np.float32(10 ** (gain / 20))
+
+            for offset in range(0, len(speech), BLOCK_FRAMES):
+                block = speech[offset:offset + BLOCK_FRAMES].astype(np.float32)
+                block *= factor
+                np.clip(np.rint(block, out=block), -32768, 32767, out=block)
+                encoder.write_raw(block.astype('<i2').tobytes())
+            frames_written += len(speech)
+
+        if encoder is None:
+            raise AudiobookError("No audio chunks to normalize")
+    except BaseException:
+        if encoder is not None:
+            encoder.abort()
+        raise
+    encoder.close()
+    return frames_written / sample_rate
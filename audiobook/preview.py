@@ -0,0 +1,172 @@
+"""
+Rendering a short clip of one passage, to check how it sounds.
+
+A passage is chosen in one chapter by markdown line, by paragraph or by
+character of the narration text, and mapped through markdown_to_text to the
+narration text it produces. Either only that text is synthesized, which costs
+just its characters, or the chunks of the full chapter that cover it, which
+sound exactly as they will in the book and land in the TTS cache for the next
+full build.
+"""
+import os
+
+from . import config
+from .audio import join_audio
+from .backends import create_backend
+from .cache import TTSCache
+from .chunking import iter_chunks
+from .errors import AudiobookError
+from .markdown import convert_markdown
+from .pipeline import join_modes, resolve_settings
+from .retry import RetryPolicy
+from .scheduler import RequestScheduler
+from .synthesis import iter_synthesize
+
+
+LINES = 'lines'
+PARAGRAPHS = 'paragraphs'
+CHARACTERS = 'characters'
+UNITS = (LINES, PARAGRAPHS, CHARACTERS)
+
+
+def parse_range(value):
+    """
+    Parse a 1-based inclusive range such as '12' or '12-20'.
+
+    Returns:
+        Tuple of (first, last)
+
+    Raises:
+        ValueError: If value is not a range of positive numbers in order
+    """
+    first, _, last = value.partition('-')
+    first = int(first)
+    last = int(last) if last else first
+    if first < 1 or last < first:
+        raise ValueError(f"invalid range '{value}'")
+    return first, last
+
+
+def _paragraph_spans(text):
+    spans = []
+    position = 0
+    for paragraph in text.split('\n\n'):
+        spans.append((position, position + len(paragraph)))
+        position += len(paragraph) + 2
+    return spans
+
+
+def select_span(narration, unit, first, last):
+    """
+    Find the narration text selected by a range.
+
+    Args:
+        narration: NarrationText of the chapter
+        unit: LINES (of the markdown source), PARAGRAPHS or CHARACTERS (of the
+              narration text)
+        first: First line, paragraph or character, counting from 1
+        last: Last line, paragraph or character, inclusive
+
+    Returns:
+        Tuple of (start, end) offsets in narration.text
+
+    Raises:
+        AudiobookError: If the range selects no narration text
+    """
+    text = narration.text
+    if unit == LINES:
+        span = narration.source_span(first, last)
+        if span is None:
+            raise AudiobookError(f"Lines {first}-{last} have no text to narrate")
+        return span
+    if unit == PARAGRAPHS:
+        spans = _paragraph_spans(text) if text else []
+        if first > len(spans):
+            raise AudiobookError(f"The chapter has only {len(spans)} paragraphs")
+        return spans[first - 1][0], spans[min(last, len(spans)) - 1][1]
+    if unit == CHARACTERS:
+        if first > len(text):
+            raise AudiobookError(f"The chapter has only {len(text)} characters of narration text")
+        return first - 1, min(last, len(text))
+    raise ValueError(f"Unknown unit '{unit}' (expected one of: {', '.join(UNITS)})")
+
+
+def preview_path(chapter_file):
+    """Default clip path for a chapter: <chapter name>.clip.mp3 in the current directory."""
+    return os.path.splitext(os.path.basename(chapter_file))[0] + '.clip.mp3'
+
+
+def render_preview(chapter_file, output_file, api_key, unit, first, last, whole_chunks=False,
+                   voice_id=None, model_id=None, concurrency=None, chunking=None, backend=None, cache=None):
+    """
+    Synthesize one passage of a chapter into a short clip.
+
+    Args:
+        chapter_file: Path to the chapter markdown file
+        output_file: Path of the clip to write
+        api_key: Eleven Labs API key (not needed with AUDIOBOOK_TTS_BACKEND=stub)
+        unit: LINES, PARAGRAPHS or CHARACTERS; see select_span
+        first: First line, paragraph or character of the passage, counting from 1
+        last: Last line, paragraph or character of the passage, inclusive
+        whole_chunks: Synthesize every chunk of the chapter that overlaps the
+                      passage, exactly as the full build would, instead of
+                      only the passage
+        voice_id: Voice ID to use (default: ELEVEN_LABS_VOICE_ID or Rachel)
+        model_id: Model ID to use (default: eleven_multilingual_v2)
+        concurrency: Most chunk requests to run at once; the limit is cut on congestion and
+                     only grows past this up to AUDIOBOOK_MAX_CONCURRENCY, if set
+                     (default: AUDIOBOOK_CONCURRENCY or 4)
+        chunking: How text is packed into chunks (default: AUDIOBOOK_CHUNKING or 'greedy')
+        backend: TTSBackend to reuse (default: a new one for api_key)
+        cache: TTSCache to reuse (default: from the environment)
+
+    Raises:
+        AudiobookError: If the range selects no text, or the configured TTS
+                        backend, concat mode or chunking strategy is unknown
+    """
+    voice_id, model_id, concurrency, concat_mode, chunking = resolve_settings(
+        voice_id, model_id, concurrency, None, chunking
+    )
+    with open(chapter_file, 'r', encoding='utf-8') as f:
+        narration = convert_markdown(f.read())
+    start, end = select_span(narration, unit, first, last)
+
+    if whole_chunks:
+        chunks = [
+            chunk for chunk in iter_chunks(narration.text, config.MAX_CHUNK_SIZE, chunking)
+            if chunk.start < end and chunk.end > start
+        ]
+        start, end = chunks[0].start, chunks[-1].end
+    else:
+        chunks = list(iter_chunks(narration.text[start:end], config.MAX_CHUNK_SIZE, chunking))
+    texts = [chunk.text for chunk in chunks]
+    if not texts:
+        raise AudiobookError(f"The selected {unit} have no text to narrate")
+
+    first_line, last_line = narration.source_line(start), narration.source_line(max(start, end - 1))
+    lines = f"line {first_line}" if first_line == last_line else f"lines {first_line}-{last_line}"
+    print(f"🔎 {os.path.basename(chapter_file)}, {unit} {first}-{last}: {lines} of the markdown")
+    excerpt = ' '.join(narration.text[start:end].split())
+    print(f"   \"{excerpt[:70]}{'...' if len(excerpt) > 70 else ''}\"")
+    what = 'covering chunks' if whole_chunks else 'passage'
+    print(f"📦 Synthesizing the {what}: {sum(len(text) for text in texts)} characters "
+          f"in {len(texts)} chunk{'s' if len(texts) != 1 else ''}")
+
+    if cache is None:
+        cache = TTSCache.from_environment()
+    misses = cache.misses
+
+    def report_chunk(index, audio_bytes):
+        print(f"   ✅ Chunk {index+1}/{len(texts)} generated ({len(texts[index])} characters)")
+
+    scheduler = RequestScheduler.from_environment(concurrency)
+    if backend is None:
+        backend = create_backend(api_key, max_connections=scheduler.max_workers)
+    audio_chunks = iter_synthesize(
+        backend, texts, voice_id, model_id, cache, concurrency, report_chunk, RetryPolicy.from_environment(),
+        scheduler=scheduler,
+    )
+    chunk_mode, _ = join_modes(concat_mode)
+    join_audio(audio_chunks, output_file, chunk_mode)
+    print(f"💾 Clip written: {output_file}")
+    print(f"🗄️  TTS cache: {len(texts) - (cache.misses - misses)} of {len(texts)} chunks were cached")
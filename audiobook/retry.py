@@ -0,0 +1,73 @@
+"""
+Retrying transient TTS failures with exponential backoff and jitter.
+"""
+import os
+import random
+import time
+
+
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_BASE_DELAY = 1.0
+DEFAULT_MAX_DELAY = 60.0
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter.
+
+    The delay before retry n (counting from 0) is drawn uniformly from
+    [0, min(max_delay, base_delay * 2**n)], so workers that failed together do
+    not all come back at the same moment.
+    """
+
+    def __init__(self, max_retries=DEFAULT_MAX_RETRIES, base_delay=DEFAULT_BASE_DELAY,
+                 max_delay=DEFAULT_MAX_DELAY, sleep=time.sleep, rng=None):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.sleep = sleep
+        self.random = rng or random.Random()
+
+    @classmethod
+    def from_environment(cls):
+        """
+        Create a policy configured from AUDIOBOOK_MAX_RETRIES, AUDIOBOOK_RETRY_BASE_DELAY
+        and AUDIOBOOK_RETRY_MAX_DELAY.
+        """
+        return cls(
+            max_retries=int(os.environ.get('AUDIOBOOK_MAX_RETRIES', DEFAULT_MAX_RETRIES)),
+            base_delay=float(os.environ.get('AUDIOBOOK_RETRY_BASE_DELAY', DEFAULT_BASE_DELAY)),
+            max_delay=float(os.environ.get('AUDIOBOOK_RETRY_MAX_DELAY', DEFAULT_MAX_DELAY)),
+        )
+
+    def delay(self, attempt):
+        """Seconds to wait before retry number attempt (0-based)."""
+        return self.random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def call(self, function, is_transient, on_retry=None):
+        """
+        Call function, retrying it while it fails with transient errors.
+
+        Args:
+            function: Callable taking no arguments
+            is_transient: Callable(error) -> True if the call may succeed if retried
+            on_retry: Optional callback(error, attempt, delay) called before each wait
+
+        Returns:
+            The result of the first successful call
+
+        Raises:
+            The last error, once it is not transient or the retries are used up
+        """
+        attempt = 0
+        while True:
+            try:
+                return function()
+            except Exception as e:
+                if attempt >= self.max_retries or not is_transient(e):
+                    raise
+                delay = self.delay(attempt)
+                if on_retry is not None:
+                    on_retry(e, attempt, delay)
+                self.sleep(delay)
+                attempt += 1
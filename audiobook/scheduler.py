@@ -0,0 +1,279 @@
+"""
+Pacing synthesis requests to what the TTS API will take.
+
+A fixed concurrency either leaves throughput unused or runs into 429s and
+timeouts. The scheduler adapts it instead, AIMD style (additive increase,
+multiplicative decrease, as TCP congestion control does):
+
+- while requests succeed at a healthy latency and every slot is in use, the
+  concurrency limit grows by about one request per round of requests
+- a congestion signal (a 429, 5xx or timeout, or a request much slower per
+  character than the best seen lately) halves it, once per round, since the
+  other requests already in flight were sent at the old limit
+
+The configured concurrency is a ceiling, since accounts have a cap on
+concurrent requests: the limit only grows past it up to a maximum set
+explicitly (AUDIOBOOK_MAX_CONCURRENCY). Without one it is only ever cut and
+recovers back up to the configured concurrency.
+
+Independently, a token bucket keeps the characters sent per minute under a
+configured rate, and a character quota stops the run with an error before it
+would send more characters than allowed.
+"""
+import contextlib
+import os
+import threading
+import time
+
+from .errors import AudiobookError
+
+
+# A request counts as a latency spike when its latency per character is this
+# many times the baseline
+DEFAULT_LATENCY_TOLERANCE = 2.0
+
+# Factor the concurrency limit is multiplied with on congestion
+DECREASE_FACTOR = 0.5
+
+# Latency is compared per (characters + REQUEST_OVERHEAD_CHARACTERS), so the
+# fixed cost of a request does not make short chunks look slow
+REQUEST_OVERHEAD_CHARACTERS = 500
+
+# How far the latency baseline moves towards each slower request; a lower
+# request resets it at once
+BASELINE_DRIFT = 0.05
+
+# Requests measured before latency spikes are acted on
+WARMUP_REQUESTS = 3
+
+
+class TokenBucket:
+    """
+    Characters-per-minute limit shared by all workers.
+
+    The bucket holds up to a minute of characters and refills continuously.
+    A request larger than the bucket waits until it is full and then takes
+    the bucket into debt, so later requests wait for it to be paid back.
+    """
+
+    def __init__(self, characters_per_minute, clock=time.monotonic, sleep=time.sleep):
+        self.rate = characters_per_minute / 60.0
+        self.capacity = float(characters_per_minute)
+        self.tokens = self.capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.waited = 0.0
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, characters):
+        """Wait until characters may be sent, then take them from the bucket."""
+        needed = min(characters, self.capacity)
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= needed:
+                    self.tokens -= characters
+                    return
+                delay = (needed - self.tokens) / self.rate
+                self.waited += delay
+            self.sleep(delay)
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD limit on the number of requests in flight.
+
+    Attributes:
+        limit: Current concurrency limit (fractional while it grows)
+        minimum: Lowest limit
+        maximum: Highest limit
+        peak: Highest limit reached
+        decreases: Number of times the limit was cut
+    """
+
+    def __init__(self, initial, minimum=1, maximum=None, latency_tolerance=DEFAULT_LATENCY_TOLERANCE):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, initial if maximum is None else maximum)
+        self.limit = float(min(self.maximum, max(self.minimum, initial)))
+        self.latency_tolerance = latency_tolerance
+        self.peak = int(self.limit)
+        self.decreases = 0
+        self._in_flight = 0
+        self._round = 0        # bumped on every decrease
+        self._baseline = None  # seconds per character of a healthy request
+        self._measured = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        """
+        Wait for a free slot and take it.
+
+        Returns:
+            Round the request was sent in, to be passed to release
+        """
+        with self._condition:
+            while self._in_flight >= int(self.limit):
+                self._condition.wait()
+            self._in_flight += 1
+            return self._round
+
+    def release(self, sent_in, characters=0, latency=None, congested=False):
+        """
+        Free a slot and adapt the limit to how its request went.
+
+        Args:
+            sent_in: Round returned by acquire
+            characters: Characters in the request
+            latency: Seconds the request took, if it succeeded
+            congested: Whether it failed with a sign of overload
+        """
+        with self._condition:
+            saturated = self._in_flight >= int(self.limit)
+            self._in_flight -= 1
+            if latency is not None and not congested:
+                congested = self._is_spike(latency / (characters + REQUEST_OVERHEAD_CHARACTERS))
+            if congested:
+                # Requests sent before the last cut already saw the old limit
+                if sent_in == self._round:
+                    self.limit = max(self.minimum, int(self.limit * DECREASE_FACTOR))
+                    self._round += 1
+                    self.decreases += 1
+            elif latency is not None and saturated:
+                self.limit = min(self.maximum, self.limit + 1 / int(self.limit))
+                self.peak = max(self.peak, int(self.limit))
+            self._condition.notify_all()
+
+    def _is_spike(self, cost):
+        self._measured += 1
+        if self._baseline is None or cost < self._baseline:
+            self._baseline = cost
+            return False
+        spike = self._measured > WARMUP_REQUESTS and cost > self._baseline * self.latency_tolerance
+        if not spike:
+            self._baseline += BASELINE_DRIFT * (cost - self._baseline)
+        return spike
+
+
+class RequestScheduler:
+    """
+    Admission control for synthesis requests: an adaptive concurrency limit,
+    an optional characters-per-minute rate and an optional character quota
+    for the run.
+
+    Attributes:
+        concurrency: AdaptiveConcurrency limiting requests in flight
+        bucket: TokenBucket limiting characters per minute, or None
+        max_characters: Most characters the run may send, or None
+        characters: Characters reserved by requests so far
+    """
+
+    def __init__(self, concurrency, max_concurrency=None, characters_per_minute=None, max_characters=None,
+                 latency_tolerance=DEFAULT_LATENCY_TOLERANCE):
+        self.concurrency = AdaptiveConcurrency(
+            concurrency, maximum=max_concurrency, latency_tolerance=latency_tolerance
+        )
+        self.bucket = TokenBucket(characters_per_minute) if characters_per_minute else None
+        self.max_characters = max_characters or None
+        self.characters = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_environment(cls, concurrency):
+        """
+        Create a scheduler starting at concurrency, configured from
+        AUDIOBOOK_MAX_CONCURRENCY, AUDIOBOOK_CHARACTERS_PER_MINUTE,
+        AUDIOBOOK_MAX_CHARACTERS and AUDIOBOOK_LATENCY_TOLERANCE.
+
+        The limit never grows past concurrency unless
+        AUDIOBOOK_MAX_CONCURRENCY is set higher; it is still cut on
+        congestion either way.
+        """
+        max_concurrency = os.environ.get('AUDIOBOOK_MAX_CONCURRENCY')
+        return cls(
+            concurrency,
+            max_concurrency=int(max_concurrency) if max_concurrency else None,
+            characters_per_minute=int(os.environ.get('AUDIOBOOK_CHARACTERS_PER_MINUTE', 0)),
+            max_characters=int(os.environ.get('AUDIOBOOK_MAX_CHARACTERS', 0)),
+            latency_tolerance=float(os.environ.get('AUDIOBOOK_LATENCY_TOLERANCE', DEFAULT_LATENCY_TOLERANCE)),
+        )
+
+    @property
+    def max_workers(self):
+        """Threads needed to reach the highest concurrency limit."""
+        return self.concurrency.maximum
+
+    def reserve(self, characters):
+        """
+        Count characters about to be sent against the quota.
+
+        Raises:
+            AudiobookError: If sending them would exceed the quota
+        """
+        with self._lock:
+            if self.max_characters is not None and self.characters + characters > self.max_characters:
+                raise AudiobookError(
+                    f"Character quota of {self.max_characters} for this run reached "
+                    f"({self.characters} sent, {characters} more needed); "
+                    f"raise AUDIOBOOK_MAX_CHARACTERS to continue"
+                )
+            self.characters += characters
+
+    @contextlib.contextmanager
+    def request(self, characters, is_congestion):
+        """
+        Hold a slot (and, with a rate, the characters) for one request attempt.
+
+        Args:
+            characters: Characters in the request
+            is_congestion: Callable(error) -> True if a failure is a sign of overload
+        """
+        if self.bucket is not None:
+            self.bucket.acquire(characters)
+        sent_in = self.concurrency.acquire()
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self.concurrency.release(sent_in, characters, congested=is_congestion(e))
+            raise
+        except BaseException:
+            self.concurrency.release(sent_in, characters)
+            raise
+        self.concurrency.release(sent_in, characters, latency=time.perf_counter() - started)
+
+    def describe(self):
+        """How many requests are sent at once, for progress messages."""
+        start = int(self.concurrency.limit)
+        if self.concurrency.maximum > start:
+            return f"{start} at a time, adapting up to {self.concurrency.maximum}"
+        return f"up to {start} at a time"
+
+    def summary(self):
+        """Concurrency reached and characters sent, for reports and metrics."""
+        summary = {
+            'concurrency': int(self.concurrency.limit),
+            'peak_concurrency': self.concurrency.peak,
+            'max_concurrency': self.concurrency.maximum,
+            'decreases': self.concurrency.decreases,
+            'characters': self.characters,
+        }
+        if self.bucket is not None:
+            summary['rate_limit_wait_seconds'] = round(self.bucket.waited, 3)
+        return summary
+
+    def report(self):
+        """Print the concurrency the run settled on."""
+        summary = self.summary()
+        print(f"🎚️  Concurrency settled at {summary['concurrency']} "
+              f"(peak {summary['peak_concurrency']} of {summary['max_concurrency']}, "
+              f"cut {summary['decreases']} times)")
+        if self.bucket is not None:
+            print(f"⏳ Waited {summary['rate_limit_wait_seconds']:.1f}s for the characters-per-minute limit")
+        if self.max_characters is not None:
+            print(f"🧾 Characters sent: {self.characters} of the {self.max_characters} allowed")
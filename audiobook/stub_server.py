@@ -0,0 +1,248 @@
+"""
+Local stand-in for the ElevenLabs text-to-speech API.
+
+The server answers the same endpoints as the real API with silent but valid
+MP3 audio whose length scales with the text, after a configurable delay. It
+can inject 429 and 5xx errors at given rates, answer 429 once more requests
+than a plan allows are in flight, as the real API does, and throttle the
+response body to a given number of bytes per second. With a realtime factor
+set, generating the audio takes time too: the regular endpoint answers once
+the whole chunk is generated, while the streaming endpoint sends audio as it
+is generated. The concurrency, retry and caching paths can then be load-tested
+offline, through the real SDK and HTTP stack.
+
+Run it on its own with:
+
+    python -m audiobook.stub_server --port 8765 --latency 1.5 --error-rate-429 0.05
+"""
+import argparse
+import json
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .config import NARRATION_CHARACTERS_PER_SECOND
+from .mp3 import silent_frames
+
+
+_TTS_PATH = re.compile(r'^/v1/text-to-speech/([^/?]+)(/stream)?(\?.*)?$')
+
+
+class StubSettings:
+    """
+    Behaviour of the stand-in server.
+
+    Attributes:
+        latency: Seconds to wait before answering each request
+        jitter: Maximum random deviation from latency, in seconds
+        error_rate_429: Fraction of requests answered with 429 Too Many Requests
+        error_rate_5xx: Fraction of requests answered with a 500 or 503 error
+        max_concurrent: Requests served at once before answering 429, or 0 for no limit
+        bytes_per_second: Throttle for the response body, or 0 for no limit
+        realtime_factor: Seconds of audio generated per second, or 0 for instant
+        seed: Optional random seed for reproducible runs
+    """
+
+    def __init__(self, latency=0.5, jitter=0.0, error_rate_429=0.0, error_rate_5xx=0.0,
+                 bytes_per_second=0, realtime_factor=0.0, seed=None, max_concurrent=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate_429 = error_rate_429
+        self.error_rate_5xx = error_rate_5xx
+        self.bytes_per_second = bytes_per_second
+        self.realtime_factor = realtime_factor
+        self.seed = seed
+        self.max_concurrent = max_concurrent
+
+    @classmethod
+    def from_environment(cls):
+        """Settings from the AUDIOBOOK_STUB_* environment variables."""
+        seed = os.environ.get('AUDIOBOOK_STUB_SEED')
+        return cls(
+            latency=float(os.environ.get('AUDIOBOOK_STUB_LATENCY', 0.5)),
+            jitter=float(os.environ.get('AUDIOBOOK_STUB_JITTER', 0.0)),
+            error_rate_429=float(os.environ.get('AUDIOBOOK_STUB_ERROR_RATE_429', 0.0)),
+            error_rate_5xx=float(os.environ.get('AUDIOBOOK_STUB_ERROR_RATE_5XX', 0.0)),
+            bytes_per_second=int(os.environ.get('AUDIOBOOK_STUB_BYTES_PER_SECOND', 0)),
+            realtime_factor=float(os.environ.get('AUDIOBOOK_STUB_REALTIME_FACTOR', 0.0)),
+            seed=int(seed) if seed is not None else None,
+            max_concurrent=int(os.environ.get('AUDIOBOOK_STUB_MAX_CONCURRENT', 0)),
+        )
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass  # Keep load tests quiet
+
+    def _send_json(self, status, body):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length)
+
+        match = _TTS_PATH.match(self.path)
+        if not match:
+            self._send_json(404, {'detail': 'Not Found'})
+            return
+        streaming = match.group(2) is not None
+        try:
+            text = json.loads(body or b'{}')['text']
+        except (ValueError, KeyError):
+            self._send_json(422, {'detail': [{'msg': 'field required', 'loc': ['body', 'text']}]})
+            return
+
+        settings = server.settings
+        with server.lock:
+            server.requests += 1
+            server.characters += len(text)
+            delay = max(0.0, settings.latency + server.random.uniform(-settings.jitter, settings.jitter))
+            roll = server.random.random()
+            error_status = None
+            if settings.max_concurrent and server.active >= settings.max_concurrent:
+                error_status = 429
+            elif roll < settings.error_rate_429:
+                error_status = 429
+            elif roll < settings.error_rate_429 + settings.error_rate_5xx:
+                error_status = server.random.choice((500, 503))
+            if error_status is not None:
+                server.errors += 1
+            else:
+                server.active += 1
+        try:
+            self._answer(text, streaming, delay, error_status)
+        finally:
+            if error_status is None:
+                with server.lock:
+                    server.active -= 1
+
+    def _answer(self, text, streaming, delay, error_status):
+        settings = self.server.settings
+        time.sleep(delay)
+
+        if error_status == 429:
+            self._send_json(429, {'detail': {
+                'status': 'too_many_concurrent_requests',
+                'message': 'Too many concurrent requests (stand-in server)',
+            }})
+            return
+        if error_status is not None:
+            self._send_json(error_status, {'detail': 'Service unavailable (stand-in server)'})
+            return
+
+        duration = len(text) / NARRATION_CHARACTERS_PER_SECOND
+        audio = silent_frames(duration)
+        generation_time = duration / settings.realtime_factor if settings.realtime_factor else 0.0
+
+        # The regular endpoint only answers once the whole chunk is generated;
+        # the streaming endpoint sends audio as fast as it is generated
+        rates = [settings.bytes_per_second] if settings.bytes_per_second else []
+        if streaming and generation_time:
+            rates.append(len(audio) / generation_time)
+        else:
+            time.sleep(generation_time)
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'audio/mpeg')
+        self.send_header('Content-Length', str(len(audio)))
+        self.end_headers()
+
+        if not rates:
+            self.wfile.write(audio)
+            return
+        # Send in 50 ms slices to approximate a steady transfer rate
+        rate = min(rates)
+        block = max(1, int(rate / 20))
+        for start in range(0, len(audio), block):
+            self.wfile.write(audio[start:start + block])
+            self.wfile.flush()
+            time.sleep(len(audio[start:start + block]) / rate)
+
+
+class StubServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server imitating the ElevenLabs text-to-speech endpoints.
+
+    Attributes:
+        requests: Number of requests received
+        characters: Number of characters received
+        errors: Number of injected errors
+        active: Number of requests being served
+    """
+
+    daemon_threads = True
+
+    def __init__(self, settings=None, host='127.0.0.1', port=0):
+        super().__init__((host, port), _Handler)
+        self.settings = settings or StubSettings()
+        self.random = random.Random(self.settings.seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.characters = 0
+        self.errors = 0
+        self.active = 0
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        """
+        Serve requests on a background daemon thread and return the base URL.
+        """
+        thread = threading.Thread(target=self.serve_forever, name='tts-stub-server', daemon=True)
+        thread.start()
+        return self.url
+
+
+def main():
+    """Run the stand-in server in the foreground."""
+    parser = argparse.ArgumentParser(description='Local stand-in for the ElevenLabs TTS API.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.5, help='seconds before each response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='maximum random deviation from latency')
+    parser.add_argument('--error-rate-429', type=float, default=0.0)
+    parser.add_argument('--error-rate-5xx', type=float, default=0.0)
+    parser.add_argument('--bytes-per-second', type=int, default=0, help='response throttle, 0 for none')
+    parser.add_argument('--realtime-factor', type=float, default=0.0,
+                        help='seconds of audio generated per second, 0 for instant')
+    parser.add_argument('--max-concurrent', type=int, default=0,
+                        help='requests served at once before answering 429, 0 for no limit')
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    settings = StubSettings(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate_429=args.error_rate_429,
+        error_rate_5xx=args.error_rate_5xx,
+        bytes_per_second=args.bytes_per_second,
+        realtime_factor=args.realtime_factor,
+        seed=args.seed,
+        max_concurrent=args.max_concurrent,
+    )
+    server = StubServer(settings, args.host, args.port)
+    print(f"🧪 Stand-in TTS server listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,273 @@
+"""
+Text-to-speech requests shared by the audiobook scripts.
+
+Requests go through a backend (see backends.py). The ElevenLabs SDK is only
+imported when the first request is made, so planning and cache lookups never
+pay for loading it.
+"""
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+
+from . import config
+from .cache import cache_key
+from .config import DEFAULT_CONCURRENCY
+from .metrics import RequestStats
+from .postprocess import PostProcessing
+
+
+# How many chunks iter_synthesize may run ahead of the consumer, per worker
+WINDOW_PER_WORKER = 4
+
+# Voice settings used for every request
+VOICE_SETTINGS = {
+    'stability': 0.5,
+    'similarity_boost': 0.75,
+    'style': 0.0,
+    'use_speaker_boost': True,
+}
+
+
+def render_settings(voice_id, model_id, chunking=config.DEFAULT_CHUNKING,
+                    concat_mode=config.DEFAULT_CONCAT_MODE):
+    """
+    Everything besides the text that changes the rendered audio.
+
+    Rendered chapters and journaled chunks are only reused while these match.
+    """
+    settings = {
+        'voice_id': voice_id,
+        'model_id': model_id,
+        'voice_settings': VOICE_SETTINGS,
+        'max_chunk_size': config.MAX_CHUNK_SIZE,
+    }
+    if chunking != config.DEFAULT_CHUNKING:
+        settings['chunking'] = chunking
+    if concat_mode == 'normalize':
+        # Chapters are normalized as they are written
+        settings['postprocess'] = PostProcessing.from_environment().settings()
+    backend_name = config.tts_backend_from_environment()
+    if backend_name != config.DEFAULT_TTS_BACKEND:
+        # Audio from a test backend must never be reused for a real build
+        settings['tts_backend'] = backend_name
+    return settings
+
+
+def synthesize(backend, text, voice_id, model_id, cache=None, retry=None, stats=None, scheduler=None):
+    """
+    Convert text to MP3 bytes, serving repeated requests from the cache.
+
+    Transient failures (rate limits, server errors, timeouts) are retried with
+    exponential backoff when a retry policy is given. With a scheduler, each
+    attempt waits for a slot under its concurrency and rate limits, and the
+    request counts against its character quota.
+
+    Args:
+        backend: TTSBackend used for requests that miss the cache
+        text: The text content to convert
+        voice_id: Voice ID to use
+        model_id: Model ID to use
+        cache: Optional TTSCache checked before calling the API
+        retry: Optional RetryPolicy for transient failures
+        stats: Optional metrics.RequestStats to fill in with the request timing
+        scheduler: Optional RequestScheduler pacing requests
+
+    Returns:
+        MP3 audio as bytes
+
+    Raises:
+        AudiobookError: If the request would exceed the scheduler's character quota
+    """
+    if stats is None:
+        stats = RequestStats(len(text))
+    started = time.perf_counter()
+
+    key = cache_key(text, voice_id, model_id, VOICE_SETTINGS, backend.cache_namespace)
+    if cache is not None:
+        audio_bytes = cache.get(key)
+        if audio_bytes is not None:
+            stats.source = 'cache'
+            return audio_bytes
+    if scheduler is not None:
+        scheduler.reserve(len(text))
+
+    def attempt():
+        # The request is only sent once the generator is consumed, so joining
+        # belongs inside the retried call
+        attempt_started = time.perf_counter()
+        stats.ttfb = None
+        parts = []
+        for part in backend.convert(text, voice_id, model_id, VOICE_SETTINGS):
+            if stats.ttfb is None:
+                stats.ttfb = time.perf_counter() - attempt_started
+            parts.append(part)
+        audio_bytes = b''.join(parts)
+        stats.latency = time.perf_counter() - attempt_started
+        stats.bytes = len(audio_bytes)
+        return audio_bytes
+
+    def request():
+        if scheduler is None:
+            return attempt()
+        with scheduler.request(len(text), backend.is_transient_error):
+            return attempt()
+
+    def report_retry(error, attempt, delay):
+        stats.retries += 1
+        print(f"   🔁 Request for {len(text)} characters failed ({error}); "
+              f"retry {attempt + 1}/{retry.max_retries} in {delay:.1f}s")
+
+    if retry is None:
+        audio_bytes = request()
+    else:
+        audio_bytes = retry.call(request, backend.is_transient_error, report_retry)
+    stats.seconds = time.perf_counter() - started
+
+    if cache is not None:
+        cache.put(key, audio_bytes)
+    return audio_bytes
+
+
+def iter_synthesize(backend, texts, voice_id, model_id, cache=None, concurrency=DEFAULT_CONCURRENCY,
+                    on_complete=None, retry=None, journal=None, window=None, metrics=None, scheduler=None):
+    """
+    Convert texts to MP3 bytes using a bounded pool of worker threads, yielding
+    the audio in input order as soon as it is available.
+
+    texts may be a generator: each text is pulled and submitted as soon as
+    there is room, so synthesis of the first chunk starts while later ones are
+    still being split. At most window texts are pulled ahead of the last chunk
+    yielded, which bounds how much audio waits in memory behind a slow chunk.
+    Identical texts in flight at the same time are requested only once. With a
+    journal, chunks completed by an earlier run are read back instead of
+    requested, and each new chunk is recorded as soon as it arrives.
+
+    With a scheduler, enough workers are started to reach its highest
+    concurrency limit, and the scheduler decides how many of them have a
+    request in flight at any moment.
+
+    If any request fails, requests that have not started yet are cancelled,
+    the ones in flight are allowed to finish (and are journaled), and the
+    error is raised.
+
+    Args:
+        backend: TTSBackend used for requests that miss the cache
+        texts: Iterable of texts to convert
+        voice_id: Voice ID to use
+        model_id: Model ID to use
+        cache: Optional TTSCache checked before calling the API
+        concurrency: Maximum number of requests in flight at once
+        on_complete: Optional callback(index, audio_bytes) called as each text finishes
+        retry: Optional RetryPolicy for transient failures
+        journal: Optional RunJournal recording completed chunks
+        window: Maximum number of texts pulled but not yet yielded
+                (default: WINDOW_PER_WORKER per worker)
+        metrics: Optional RunMetrics recording where each chunk came from and
+                 how long its request took
+        scheduler: Optional RequestScheduler pacing requests; concurrency is
+                   then its starting limit
+
+    Yields:
+        MP3 bytes in the same order as texts
+    """
+    concurrency = max(1, concurrency)
+    if window is None:
+        window = WINDOW_PER_WORKER * concurrency
+    workers = concurrency if scheduler is None else max(concurrency, scheduler.max_workers)
+    window = max(window, workers)
+
+    texts = iter(texts)
+    exhausted = False
+    pulled = 0       # texts taken from the iterable so far
+    next_index = 0   # index of the next chunk to yield
+    ready = {}       # index -> audio bytes waiting for earlier chunks
+    in_flight = {}   # future -> (index, text) of the texts it answers
+    submitted = {}   # text -> future, while in flight
+    request_stats = {}  # future -> RequestStats of its request
+
+    def finish(future):
+        answers = in_flight.pop(future)
+        stats = request_stats.pop(future)
+        submitted.pop(answers[0][1], None)
+        audio_bytes = future.result()
+        for position, (index, text) in enumerate(answers):
+            ready[index] = audio_bytes
+            if journal is not None:
+                journal.record(index, text, audio_bytes)
+            if metrics is not None:
+                metrics.chunk(index, stats if position == 0 else RequestStats(len(text), 'duplicate'))
+            if on_complete is not None:
+                on_complete(index, audio_bytes)
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        while True:
+            # Keep the workers busy, but never run more than window chunks ahead
+            while not exhausted and pulled - next_index < window:
+                try:
+                    text = next(texts)
+                except StopIteration:
+                    exhausted = True
+                    break
+                index = pulled
+                pulled += 1
+                if journal is not None:
+                    audio_bytes = journal.lookup(text)
+                    if audio_bytes is not None:
+                        ready[index] = audio_bytes
+                        if metrics is not None:
+                            metrics.chunk(index, RequestStats(len(text), 'journal'))
+                        if on_complete is not None:
+                            on_complete(index, audio_bytes)
+                        continue
+                future = submitted.get(text)
+                if future is None:
+                    stats = RequestStats(len(text))
+                    future = executor.submit(
+                        synthesize, backend, text, voice_id, model_id, cache, retry, stats, scheduler
+                    )
+                    submitted[text] = future
+                    request_stats[future] = stats
+                    in_flight[future] = []
+                in_flight[future].append((index, text))
+
+            while next_index in ready:
+                yield ready.pop(next_index)
+                next_index += 1
+
+            if not in_flight:
+                if exhausted and next_index == pulled:
+                    break
+                continue
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    finish(future)
+                except Exception:
+                    if journal is not None:
+                        # Requests already in flight are paid for; journal them before giving up
+                        for other in in_flight:
+                            other.cancel()
+                        for other in as_completed(list(in_flight)):
+                            if not other.cancelled() and other.exception() is None:
+                                finish(other)
+                    raise
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def synthesize_many(backend, texts, voice_id, model_id, cache=None, concurrency=DEFAULT_CONCURRENCY,
+                    on_complete=None, retry=None, journal=None, metrics=None, scheduler=None):
+    """
+    Convert several texts to MP3 bytes using a bounded pool of worker threads.
+
+    Takes the same arguments as iter_synthesize, but keeps every chunk in
+    memory and does not limit how far ahead texts are pulled.
+
+    Returns:
+        List of MP3 bytes in the same order as texts
+    """
+    return list(iter_synthesize(
+        backend, texts, voice_id, model_id, cache, concurrency, on_complete, retry, journal,
+        window=float('inf'), metrics=metrics, scheduler=scheduler,
+    ))
@@ -0,0 +1,138 @@
+"""
+Rebuilding an audiobook whenever its markdown changes.
+
+Watching keeps one process running, so modules stay imported, the TTS client
+keeps its connections open and the TTS cache stays open between builds. The
+files are polled, so no extra dependency is needed. After each save the new
+narration text is compared with the previous version, the changed paragraphs
+are reported and the book is built again: unchanged chapters are reused from
+the build manifest and unchanged chunks come from the TTS cache, so only the
+edited chunks are synthesized. Saves that do not change the narration text
+(formatting, comments) do not trigger a build.
+"""
+import difflib
+import os
+import time
+import traceback
+
+from .errors import AudiobookError
+from .markdown import markdown_to_text
+
+
+# Seconds between checks for changed files
+DEFAULT_INTERVAL = 0.5
+
+
+def _snapshot(paths):
+    """Modification time and size of each file, or None if it is missing."""
+    snapshot = {}
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            snapshot[path] = None
+        else:
+            snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+    return snapshot
+
+
+def _narration_text(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return markdown_to_text(f.read())
+    except (OSError, UnicodeDecodeError):
+        return None
+
+
+def _span(start, end):
+    if end - start == 1:
+        return f"paragraph {start + 1}"
+    return f"paragraphs {start + 1}-{end}"
+
+
+def describe_changes(old_text, new_text):
+    """
+    Describe how narration text changed, paragraph by paragraph.
+
+    Args:
+        old_text: Previous narration text, or None if the file did not exist
+        new_text: Current narration text, or None if the file is gone
+
+    Returns:
+        List of short descriptions such as 'changed paragraph 12'
+    """
+    if new_text is None:
+        return ["file removed"]
+    old = old_text.split('\n\n') if old_text else []
+    new = new_text.split('\n\n') if new_text else []
+    changes = []
+    matcher = difflib.SequenceMatcher(None, old, new, autojunk=False)
+    for tag, old_start, old_end, new_start, new_end in matcher.get_opcodes():
+        if tag == 'replace':
+            changes.append(f"changed {_span(new_start, new_end)}")
+        elif tag == 'insert':
+            changes.append(f"added {_span(new_start, new_end)}")
+        elif tag == 'delete':
+            changes.append(f"removed {_span(old_start, old_end)}")
+    return changes
+
+
+def _build(build):
+    """Run one build, reporting failures instead of ending the watch."""
+    started = time.monotonic()
+    try:
+        build()
+    except AudiobookError as e:
+        print(f"❌ Error: {e}")
+    except Exception as e:
+        print(f"\n❌ Error generating audiobook: {e}")
+        traceback.print_exc()
+    else:
+        print(f"⚡ Built in {time.monotonic() - started:.1f}s")
+
+
+def watch(paths, build, interval=DEFAULT_INTERVAL, sleep=time.sleep):
+    """
+    Build once, then build again each time the narration text of a file
+    changes, until interrupted with Ctrl+C.
+
+    Args:
+        paths: Markdown files to watch
+        build: Callable taking no arguments that builds the audiobook
+        interval: Seconds between checks for changes
+        sleep: Function used to wait between checks
+    """
+    texts = {path: _narration_text(path) for path in paths}
+    _build(build)
+    snapshot = _snapshot(paths)
+    print(f"\n👀 Watching {len(paths)} files for changes (Ctrl+C to stop)")
+    try:
+        while True:
+            sleep(interval)
+            current = _snapshot(paths)
+            if current == snapshot:
+                continue
+            # Editors often save in several steps; wait until the files settle
+            while True:
+                sleep(interval)
+                settled = _snapshot(paths)
+                if settled == current:
+                    break
+                current = settled
+            snapshot = current
+
+            changed = False
+            for path in paths:
+                text = _narration_text(path)
+                if text == texts[path]:
+                    continue
+                print(f"\n✏️  {os.path.basename(path)}: {', '.join(describe_changes(texts[path], text))}")
+                texts[path] = text
+                changed = True
+            if not changed:
+                print("\n💤 Saved without changes to the narration text, nothing to build")
+                continue
+            _build(build)
+            print(f"\n👀 Watching {len(paths)} files for changes (Ctrl+C to stop)")
+    except KeyboardInterrupt:
+        print("\n👋 Stopped watching")
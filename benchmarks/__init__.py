@@ -0,0 +1,17 @@
+"""
+Benchmarks for the audiobook pipeline.
+
+Synthetic manuscripts from 10 KB to 100 MB are run through each stage of the
+pipeline (markdown conversion, chunking, audio assembly) against a fake audio
+source, measuring throughput, peak memory and how the cost scales with input
+size. Results are written as JSON so runs of different versions can be
+compared:
+
+    python -m benchmarks --sizes 10KB,1MB --output before.json
+    python -m benchmarks --sizes 10KB,1MB --compare before.json
+
+benchmarks.edits measures how many chunks each chunking strategy keeps
+unchanged when a manuscript is edited:
+
+    python -m benchmarks.edits
+"""
@@ -0,0 +1,185 @@
+"""
+How many chunks survive an edit, for each chunking strategy.
+
+Typical small edits (fixing a word, adding or removing a sentence or a
+paragraph) are applied at random places in the stories under src/ and in
+synthetic manuscripts. Each edited text is chunked again, and every chunk
+whose text is unchanged counts as reused: its audio would come from the TTS
+cache instead of a new request.
+
+    python -m benchmarks.edits
+    python -m benchmarks.edits --sources src,prose:200KB --trials 50 --output edits.json
+"""
+import argparse
+import glob
+import json
+import os
+import random
+import re
+from collections import Counter
+
+from audiobook.chunking import STRATEGIES, iter_chunks
+from audiobook.markdown import markdown_to_text
+
+from .manuscripts import _sentence, generate_manuscript
+from .runner import format_size, parse_size
+
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+
+DEFAULT_SOURCES = ('src', 'prose:200KB', 'long_paragraphs:200KB')
+
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+
+
+def _paragraph_spans(text):
+    spans = []
+    position = 0
+    for match in re.finditer(r'\n\n+', text):
+        if match.start() > position:
+            spans.append((position, match.start()))
+        position = match.end()
+    if position < len(text):
+        spans.append((position, len(text)))
+    return spans
+
+
+def _fix_word(rng, text):
+    words = list(re.finditer(r'\b[a-z]{4,}\b', text))
+    word = rng.choice(words)
+    return text[:word.start()] + word.group()[::-1] + text[word.end():]
+
+
+def _sentence_breaks(text):
+    return [match.start() for match in _SENTENCE_END.finditer(text)]
+
+
+def _insert_sentence(rng, text):
+    position = rng.choice(_sentence_breaks(text))
+    return text[:position] + ' ' + _sentence(rng) + text[position:]
+
+
+def _delete_sentence(rng, text):
+    breaks = _sentence_breaks(text)
+    i = rng.randrange(len(breaks) - 1)
+    return text[:breaks[i]] + text[breaks[i + 1]:]
+
+
+def _insert_paragraph(rng, text):
+    _, end = rng.choice(_paragraph_spans(text))
+    paragraph = ' '.join(_sentence(rng) for _ in range(rng.randint(2, 5)))
+    return text[:end] + '\n\n' + paragraph + text[end:]
+
+
+def _delete_paragraph(rng, text):
+    start, end = rng.choice(_paragraph_spans(text))
+    return text[:start] + text[end:].lstrip('\n')
+
+
+EDITS = {
+    'fix_word': _fix_word,
+    'insert_sentence': _insert_sentence,
+    'delete_sentence': _delete_sentence,
+    'insert_paragraph': _insert_paragraph,
+    'delete_paragraph': _delete_paragraph,
+}
+
+
+def load_sources(names, seed):
+    """
+    Narration texts to edit, as {name: [text, ...]}.
+
+    'src' is every story under src/, and 'kind:size' a synthetic manuscript.
+    """
+    sources = {}
+    for name in names:
+        if name == 'src':
+            texts = []
+            for path in sorted(glob.glob(os.path.join(SRC_DIR, '*.md'))):
+                with open(path, 'r', encoding='utf-8') as f:
+                    texts.append(markdown_to_text(f.read()))
+        else:
+            kind, _, size = name.partition(':')
+            texts = [markdown_to_text(generate_manuscript(kind, parse_size(size or '200KB'), seed))]
+        sources[name] = [text for text in texts if _sentence_breaks(text)]
+    return sources
+
+
+def measure(texts, strategy, edit, trials, seed):
+    """
+    Apply edit trials times to a random text and count the chunks that survive.
+
+    Returns:
+        Dict of totals over all trials
+    """
+    rng = random.Random(f'{seed}-{edit}')
+    chunked = [[chunk.text for chunk in iter_chunks(text, strategy=strategy)] for text in texts]
+    totals = Counter()
+    for _ in range(trials):
+        i = rng.randrange(len(texts))
+        before = Counter(chunked[i])
+        after = [chunk.text for chunk in iter_chunks(EDITS[edit](rng, texts[i]), strategy=strategy)]
+        reused = 0
+        for text in after:
+            if before[text]:
+                before[text] -= 1
+                reused += 1
+            else:
+                totals['resynthesized_characters'] += len(text)
+        totals['chunks'] += len(after)
+        totals['reused_chunks'] += reused
+        totals['characters'] += sum(len(text) for text in after)
+    return totals
+
+
+def main(argv=None):
+    """Run the edit benchmark from the command line."""
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.edits', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sources', default=','.join(DEFAULT_SOURCES),
+                        help=f"comma separated 'src' or kind:size manuscripts "
+                             f"(default: {','.join(DEFAULT_SOURCES)})")
+    parser.add_argument('--strategies', default=','.join(STRATEGIES),
+                        help=f"comma separated chunking strategies (default: {','.join(STRATEGIES)})")
+    parser.add_argument('--trials', type=int, default=20, help='edits per source and edit kind')
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args(argv)
+
+    strategies = [name for name in args.strategies.split(',') if name]
+    for strategy in strategies:
+        if strategy not in STRATEGIES:
+            parser.error(f"unknown chunking strategy '{strategy}'")
+
+    results = []
+    for name, texts in load_sources([name for name in args.sources.split(',') if name], args.seed).items():
+        characters = sum(len(text) for text in texts)
+        print(f"\n📝 {name}: {len(texts)} texts, {format_size(characters)}")
+        print(f"   {'edit':<18}" + ''.join(f"{strategy:>22}" for strategy in strategies))
+        for edit in EDITS:
+            row = f"   {edit:<18}"
+            for strategy in strategies:
+                totals = measure(texts, strategy, edit, args.trials, args.seed)
+                reused = totals['reused_chunks'] / totals['chunks']
+                resynthesized = totals['resynthesized_characters'] / args.trials
+                row += f"{reused:>9.0%} {resynthesized:>8.0f} chars"
+                results.append({
+                    'source': name,
+                    'edit': edit,
+                    'strategy': strategy,
+                    'trials': args.trials,
+                    'chunks_per_edit': totals['chunks'] / args.trials,
+                    'reused_fraction': round(reused, 4),
+                    'resynthesized_characters_per_edit': round(resynthesized, 1),
+                })
+            print(row)
+    print("\n   (share of chunks reused, characters sent again per edit)")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'seed': args.seed, 'results': results}, f, indent=2)
+        print(f"\n💾 Results written to: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
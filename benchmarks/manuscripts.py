@@ -0,0 +1,111 @@
+"""
+Deterministic synthetic manuscripts for the benchmarks.
+
+Each kind stresses a different part of the pipeline:
+
+- prose: ordinary chapters of short paragraphs, the common case
+- long_paragraphs: paragraphs longer than a chunk, forcing sentence splitting
+- no_whitespace: long runs without spaces, forcing hard splits
+- heavy_markdown: emphasis, links, images, code and HTML in every sentence
+"""
+import random
+import string
+
+
+_WORDS = (
+    'the a of and to in is was that it he she they for on as with his her at by from this '
+    'consciousness memory machine voice silence morning window river garden letter question '
+    'remembered whispered wondered listened answered carried followed understood returned '
+    'quietly slowly suddenly almost never always somewhere nothing everything between beyond '
+    'light shadow signal pattern story chapter reader writer dream language mirror threshold'
+).split()
+
+# Paragraphs are sampled from a pool, so even 100 MB manuscripts are quick to build
+_POOL_SIZE = 256
+
+
+def _sentence(rng, low=6, high=20):
+    words = [rng.choice(_WORDS) for _ in range(rng.randint(low, high))]
+    words[0] = words[0].capitalize()
+    return ' '.join(words) + rng.choice('...!?')
+
+
+def _prose_paragraph(rng):
+    return ' '.join(_sentence(rng) for _ in range(rng.randint(3, 8)))
+
+
+def _long_paragraph(rng):
+    # Roughly 12-40 KB, well past the 9,500 character chunk limit
+    return ' '.join(_sentence(rng) for _ in range(rng.randint(120, 400)))
+
+
+def _no_whitespace_paragraph(rng):
+    if rng.random() < 0.5:
+        return _prose_paragraph(rng)
+    alphabet = string.ascii_letters + string.digits + '+/'
+    return ''.join(rng.choice(alphabet) for _ in range(rng.randint(5000, 30000)))
+
+
+def _decorate(rng, sentence):
+    words = sentence.split(' ')
+    for _ in range(max(1, len(words) // 4)):
+        i = rng.randrange(len(words))
+        words[i] = rng.choice((
+            '**{}**', '*{}*', '__{}__', '_{}_', '***{}***', '`{}`',
+            '[{}](https://example.com/page)', '![{}](image.png)', '<span>{}</span>',
+        )).format(words[i])
+    return ' '.join(words)
+
+
+def _heavy_markdown_paragraph(rng):
+    roll = rng.random()
+    if roll < 0.1:
+        return '#' * rng.randint(1, 6) + ' ' + _sentence(rng, 2, 6)
+    if roll < 0.15:
+        return '```\n' + '\n'.join(_sentence(rng) for _ in range(3)) + '\n```'
+    if roll < 0.2:
+        return '---'
+    if roll < 0.3:
+        return '\n'.join('- ' + _decorate(rng, _sentence(rng, 3, 8)) for _ in range(rng.randint(2, 6)))
+    if roll < 0.35:
+        return '```inline code``` ' + _decorate(rng, _sentence(rng))
+    return ' '.join(_decorate(rng, _sentence(rng)) for _ in range(rng.randint(3, 8)))
+
+
+KINDS = {
+    'prose': _prose_paragraph,
+    'long_paragraphs': _long_paragraph,
+    'no_whitespace': _no_whitespace_paragraph,
+    'heavy_markdown': _heavy_markdown_paragraph,
+}
+
+
+def generate_manuscript(kind, size, seed=0):
+    """
+    Build a markdown manuscript of about size characters.
+
+    Args:
+        kind: One of the keys of KINDS
+        size: Target length in characters
+        seed: Random seed; the same arguments always give the same manuscript
+
+    Returns:
+        Markdown text, cut to exactly size characters
+    """
+    rng = random.Random(f'{kind}-{seed}')
+    make_paragraph = KINDS[kind]
+    pool = [make_paragraph(rng) for _ in range(_POOL_SIZE)]
+
+    parts = []
+    length = 0
+    chapter = 0
+    while length < size:
+        if not parts or rng.random() < 0.02:
+            chapter += 1
+            heading = f'# Chapter {chapter}'
+            parts.append(heading)
+            length += len(heading) + 2
+        paragraph = rng.choice(pool)
+        parts.append(paragraph)
+        length += len(paragraph) + 2
+    return '\n\n'.join(parts)[:size]
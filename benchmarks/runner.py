@@ -0,0 +1,279 @@
+"""
+Command line runner for the benchmarks.
+
+Each measurement runs in a fresh process, so the peak RSS it reports belongs
+to that stage and manuscript alone.
+"""
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from .manuscripts import KINDS, generate_manuscript
+from .stages import STAGES
+
+
+DEFAULT_SIZES = ('10KB', '100KB', '1MB', '10MB', '100MB')
+RESULTS_VERSION = 1
+
+_UNITS = {'KB': 1024, 'MB': 1024 ** 2, 'GB': 1024 ** 3, 'B': 1}
+
+
+def parse_size(value):
+    """Parse a size such as '10KB' or '1MB' into a number of characters."""
+    value = value.strip().upper()
+    for unit, factor in _UNITS.items():
+        if value.endswith(unit):
+            return int(float(value[:-len(unit)]) * factor)
+    return int(value)
+
+
+def format_size(size):
+    for unit in ('GB', 'MB', 'KB'):
+        if size >= _UNITS[unit] and size % _UNITS[unit] == 0:
+            return f'{size // _UNITS[unit]}{unit}'
+    return f'{size}B'
+
+
+def _reset_peak_rss():
+    """
+    Reset the peak RSS high-water mark where the kernel allows it.
+
+    Returns:
+        True if the next _peak_rss_bytes() covers only what ran after the reset
+    """
+    try:
+        # Linux: writing 5 to clear_refs resets VmHWM
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_bytes():
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _current_rss_bytes():
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return _peak_rss_bytes()
+
+
+def _measure(stage_name, manuscript_path, repeat, connection):
+    """Run one stage on one manuscript in a child process and send back the result."""
+    try:
+        stage = STAGES[stage_name]
+        with open(manuscript_path, 'r', encoding='utf-8') as f:
+            markdown = f.read()
+        stage_input = stage.prepare(markdown)
+        del markdown
+        baseline_rss = _current_rss_bytes()
+        peak_reset = _reset_peak_rss()
+
+        timings = []
+        metrics = {}
+        for _ in range(repeat):
+            start = time.perf_counter()
+            metrics = stage.run(stage_input) or {}
+            timings.append(time.perf_counter() - start)
+
+        peak_rss = _peak_rss_bytes()
+        connection.send({
+            'seconds': min(timings),
+            'timings': timings,
+            'peak_rss_bytes': peak_rss,
+            # Memory the stage itself needed on top of its prepared input. Without
+            # a peak reset this can hide behind a higher peak reached while preparing.
+            'stage_rss_bytes': max(0, peak_rss - baseline_rss),
+            'peak_rss_reset': peak_reset,
+            'metrics': metrics,
+        })
+    except BaseException as e:
+        connection.send({'error': f'{type(e).__name__}: {e}'})
+    finally:
+        connection.close()
+
+
+def run_measurement(stage_name, manuscript_path, repeat, timeout):
+    """Measure one stage on one manuscript in a fresh process."""
+    context = multiprocessing.get_context('spawn')
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_measure, args=(stage_name, manuscript_path, repeat, sender))
+    process.start()
+    sender.close()
+    try:
+        if not receiver.poll(timeout):
+            process.kill()
+            return {'error': f'timed out after {timeout} seconds'}
+        return receiver.recv()
+    except EOFError:
+        return {'error': f'benchmark process exited with code {process.exitcode}'}
+    finally:
+        process.join()
+        receiver.close()
+
+
+def scaling_exponents(results):
+    """
+    Estimate how each stage's cost grows with input size.
+
+    For each stage and manuscript kind, compare consecutive sizes: an exponent
+    of 1 means time grows linearly with size, 2 quadratically.
+
+    Returns:
+        Dict of 'stage/kind' -> list of {'from', 'to', 'exponent'}
+    """
+    curves = {}
+    for result in results:
+        if 'seconds' in result:
+            curves.setdefault(f"{result['stage']}/{result['kind']}", []).append(result)
+    exponents = {}
+    for name, points in curves.items():
+        points.sort(key=lambda point: point['size'])
+        exponents[name] = [
+            {
+                'from': format_size(a['size']),
+                'to': format_size(b['size']),
+                'exponent': round(math.log(b['seconds'] / a['seconds']) / math.log(b['size'] / a['size']), 2),
+            }
+            for a, b in zip(points, points[1:])
+            if a['seconds'] > 0 and b['seconds'] > 0
+        ]
+    return exponents
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    """Print the speed ratio of each measurement against a previous results file."""
+    previous = {
+        (r['stage'], r['kind'], r['size']): r for r in baseline.get('results', []) if 'seconds' in r
+    }
+    print(f"\n📊 Compared with {baseline.get('revision') or 'baseline'} (>1.00x is faster now)")
+    for result in results:
+        old = previous.get((result['stage'], result['kind'], result['size']))
+        if old is None or 'seconds' not in result or not result['seconds']:
+            continue
+        speedup = old['seconds'] / result['seconds']
+        memory = result['peak_rss_bytes'] / old['peak_rss_bytes'] if old['peak_rss_bytes'] else 0
+        marker = '⚠️ ' if speedup < 0.9 else '  '
+        print(f"{marker}{result['stage']:<18} {result['kind']:<16} {format_size(result['size']):>6}  "
+              f"{speedup:5.2f}x speed  {memory:5.2f}x peak RSS")
+
+
+def main(argv=None):
+    """Run the benchmarks from the command line."""
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description=__doc__)
+    parser.add_argument('--stages', default=','.join(STAGES),
+                        help=f"comma separated stages (default: {','.join(STAGES)})")
+    parser.add_argument('--kinds', default=','.join(KINDS),
+                        help=f"comma separated manuscript kinds (default: {','.join(KINDS)})")
+    parser.add_argument('--sizes', default=','.join(DEFAULT_SIZES),
+                        help=f"comma separated manuscript sizes (default: {','.join(DEFAULT_SIZES)})")
+    parser.add_argument('--all-sizes', action='store_true',
+                        help='also run stages on sizes above their default limit')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='runs per measurement below 10MB, the fastest is kept (default: 3)')
+    parser.add_argument('--timeout', type=float, default=600, help='seconds allowed per measurement')
+    parser.add_argument('--seed', type=int, default=0, help='manuscript random seed')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--compare', help='previous results JSON to compare against')
+    args = parser.parse_args(argv)
+
+    stage_names = [name for name in args.stages.split(',') if name]
+    kinds = [kind for kind in args.kinds.split(',') if kind]
+    sizes = sorted(parse_size(size) for size in args.sizes.split(',') if size)
+    for name in stage_names:
+        if name not in STAGES:
+            parser.error(f"unknown stage '{name}'")
+    for kind in kinds:
+        if kind not in KINDS:
+            parser.error(f"unknown manuscript kind '{kind}'")
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix='audiobook-bench-') as directory:
+        for kind in kinds:
+            for size in sizes:
+                manuscript_path = os.path.join(directory, f'{kind}-{size}.md')
+                print(f"📝 Generating {format_size(size)} {kind} manuscript...")
+                with open(manuscript_path, 'w', encoding='utf-8') as f:
+                    f.write(generate_manuscript(kind, size, args.seed))
+
+                for name in stage_names:
+                    stage = STAGES[name]
+                    result = {'stage': name, 'kind': kind, 'size': size}
+                    reason = stage.available()
+                    if reason is None and stage.max_size and size > stage.max_size and not args.all_sizes:
+                        reason = f'above default limit of {format_size(stage.max_size)}'
+                    if reason is not None:
+                        result['skipped'] = reason
+                        results.append(result)
+                        continue
+
+                    repeat = args.repeat if size < 10 * 1024 ** 2 else 1
+                    result.update(run_measurement(name, manuscript_path, repeat, args.timeout))
+                    results.append(result)
+                    if 'error' in result:
+                        print(f"   ❌ {name:<18} {result['error']}")
+                        continue
+                    result['mb_per_second'] = round(size / 1024 ** 2 / result['seconds'], 3) if result['seconds'] else None
+                    print(f"   ⏱️  {name:<18} {result['seconds']:9.4f}s  "
+                          f"{result['mb_per_second'] or 0:9.2f} MB/s  "
+                          f"peak RSS {result['peak_rss_bytes'] / 1024 ** 2:7.1f} MB "
+                          f"(+{result['stage_rss_bytes'] / 1024 ** 2:.1f} MB)")
+                os.unlink(manuscript_path)
+
+    exponents = scaling_exponents(results)
+    print("\n📈 Scaling (1.0 = linear in input size)")
+    for name, steps in sorted(exponents.items()):
+        curve = '  '.join(f"{step['from']}→{step['to']}: {step['exponent']:.2f}" for step in steps)
+        print(f"   {name:<32} {curve}")
+
+    report = {
+        'version': RESULTS_VERSION,
+        'revision': _git_revision(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'seed': args.seed,
+        'results': results,
+        'scaling': exponents,
+    }
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            compare(results, json.load(f))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Results written to: {args.output}")
@@ -0,0 +1,215 @@
+"""
+Pipeline stages measured by the benchmarks.
+
+Each stage has an untimed prepare step that builds its input from the
+manuscript (so chunking is measured on narration text rather than markdown)
+and a timed run step. Audio stages use a fake audio source: silent MP3 frames
+sized from each chunk's length, standing in for the TTS API. Normalizing needs
+audio that is not silent, so its stages get tones at a different level in
+each chunk, with silence before and after, rendered by ffmpeg.
+"""
+import io
+import os
+import shutil
+import statistics
+import subprocess
+import tempfile
+from collections import namedtuple
+
+from audiobook.audio import join_audio
+from audiobook.chunking import ANCHORED, BALANCED, GREEDY, PARAGRAPH, iter_chunks, split_text_into_chunks
+from audiobook.markdown import markdown_to_text
+from audiobook.mp3 import silent_frames
+from audiobook.postprocess import PostProcessing
+
+
+# The fake audio source renders speech this fast; real narration is about 15
+# characters a second, which would make the re-encode stage impractically large
+FAKE_CHARACTERS_PER_SECOND = 100
+FAKE_BITRATE = 32
+
+# Openers that are never closed in the unclosed markup stage: link and image
+# text, a link target, an HTML tag and a bare less-than sign
+UNCLOSED_OPENERS = ('[', '![', '[link](', '<', '< ')
+_CLOSERS = str.maketrans('', '', '])>')
+
+Stage = namedtuple('Stage', ['name', 'prepare', 'run', 'max_size', 'available'])
+Stage.__doc__ = """
+A benchmarked stage.
+
+Attributes:
+    name: Stage name used on the command line and in results
+    prepare: Function(markdown) -> input, not timed
+    run: Function(input) -> dict of extra metrics (may be empty), timed
+    max_size: Largest manuscript the stage runs on by default, or None
+    available: Function() -> None, or a reason the stage cannot run here
+"""
+
+
+def fake_audio(chunks):
+    """Silent MP3 audio for each chunk, as the TTS API would return it."""
+    return [
+        silent_frames(len(chunk) / FAKE_CHARACTERS_PER_SECOND, bitrate=FAKE_BITRATE)
+        for chunk in chunks
+    ]
+
+
+def _always_available():
+    return None
+
+
+def _ffmpeg_available():
+    if shutil.which('ffmpeg') is None:
+        return 'ffmpeg not found'
+    return None
+
+
+def _normalize_available():
+    try:
+        import numpy  # noqa: F401
+    except ImportError:
+        return 'numpy not installed'
+    return _ffmpeg_available()
+
+
+def _pydub_available():
+    try:
+        import pydub  # noqa: F401
+    except ImportError:
+        return 'pydub not installed'
+    if shutil.which('ffprobe') is None:
+        return 'ffprobe not found'
+    return _normalize_available()
+
+
+def _run_markdown(markdown):
+    text = markdown_to_text(markdown)
+    return {'output_characters': len(text)}
+
+
+def _prepare_unclosed_markup(markdown):
+    """
+    The words of the manuscript as a single paragraph with an opener that is
+    never closed before every fifth word.
+
+    An inline pattern that scans to the end of the paragraph looking for a
+    closer costs time quadratic in the paragraph length on this input, which
+    shows as a scaling exponent of 2 (and soon a timeout) instead of 1.
+    """
+    words = markdown.translate(_CLOSERS).split()
+    for i in range(0, len(words), 5):
+        words[i] = UNCLOSED_OPENERS[i // 5 % len(UNCLOSED_OPENERS)] + words[i]
+    return ' '.join(words)
+
+
+def _chunk_metrics(chunks):
+    sizes = [len(chunk.text) for chunk in chunks]
+    return {
+        'chunks': len(chunks),
+        'smallest_chunk': min(sizes, default=0),
+        'largest_chunk': max(sizes, default=0),
+        'chunk_size_stdev': round(statistics.pstdev(sizes), 1) if sizes else 0,
+        # Breaks inside a paragraph, which the listener may hear as a seam
+        'mid_paragraph_breaks': sum(1 for chunk in chunks[:-1] if chunk.boundary != PARAGRAPH),
+    }
+
+
+def _run_chunking(text):
+    return _chunk_metrics(list(iter_chunks(text, strategy=GREEDY)))
+
+
+def _run_chunking_balanced(text):
+    return _chunk_metrics(list(iter_chunks(text, strategy=BALANCED)))
+
+
+def _run_chunking_anchored(text):
+    return _chunk_metrics(list(iter_chunks(text, strategy=ANCHORED)))
+
+
+def _prepare_audio(markdown):
+    return fake_audio(split_text_into_chunks(markdown_to_text(markdown)))
+
+
+def _join(audio_chunks, concat_mode):
+    fd, output_file = tempfile.mkstemp(suffix='.mp3')
+    os.close(fd)
+    try:
+        join_audio(audio_chunks, output_file, concat_mode)
+        return {
+            'chunks': len(audio_chunks),
+            'input_bytes': sum(len(chunk) for chunk in audio_chunks),
+            'output_bytes': os.path.getsize(output_file),
+        }
+    finally:
+        os.unlink(output_file)
+
+
+def _run_join_frames(audio_chunks):
+    return _join(audio_chunks, 'frames')
+
+
+def _run_join_reencode(audio_chunks):
+    return _join(audio_chunks, 'reencode')
+
+
+def _prepare_speech(markdown):
+    """A tone per chunk, 0 to 24 dB quieter than the first, padded with silence."""
+    audio_chunks = []
+    for i, chunk in enumerate(split_text_into_chunks(markdown_to_text(markdown))):
+        duration = len(chunk) / FAKE_CHARACTERS_PER_SECOND
+        audio_chunks.append(subprocess.run([
+            'ffmpeg', '-hide_banner', '-loglevel', 'error',
+            '-f', 'lavfi', '-i', f'sine=frequency=220:duration={duration}',
+            '-af', f'tremolo=f=3:d=0.8,volume=-{(i * 7) % 25}dB,adelay=400:all=1,apad=pad_dur=0.8',
+            '-ac', '1', '-b:a', f'{FAKE_BITRATE}k', '-f', 'mp3', 'pipe:1',
+        ], capture_output=True, check=True).stdout)
+    return audio_chunks
+
+
+def _run_normalize(audio_chunks):
+    return _join(audio_chunks, 'normalize')
+
+
+def _run_normalize_pydub(audio_chunks):
+    """The same processing with pydub, for comparison: the whole book is held as one AudioSegment."""
+    from pydub import AudioSegment
+    from pydub.silence import detect_leading_silence
+
+    processing = PostProcessing()
+    book = AudioSegment.empty()
+    gap = AudioSegment.silent(duration=processing.section_gap * 1000)
+    for i, audio_bytes in enumerate(audio_chunks):
+        segment = AudioSegment.from_file(io.BytesIO(audio_bytes), format='mp3')
+        start = detect_leading_silence(segment, processing.silence_threshold)
+        end = len(segment) - detect_leading_silence(segment.reverse(), processing.silence_threshold)
+        segment = segment[start:end]
+        if segment.dBFS != float('-inf'):
+            segment = segment.apply_gain(processing.target_loudness - segment.dBFS)
+        book = book + gap + segment if i else segment
+
+    fd, output_file = tempfile.mkstemp(suffix='.mp3')
+    os.close(fd)
+    try:
+        book.export(output_file, format='mp3', bitrate='128k')
+        return {
+            'chunks': len(audio_chunks),
+            'input_bytes': sum(len(chunk) for chunk in audio_chunks),
+            'output_bytes': os.path.getsize(output_file),
+        }
+    finally:
+        os.unlink(output_file)
+
+
+STAGES = {
+    stage.name: stage for stage in (
+        Stage('markdown', lambda markdown: markdown, _run_markdown, None, _always_available),
+        Stage('markdown_unclosed', _prepare_unclosed_markup, _run_markdown, None, _always_available),
+        Stage('chunking', markdown_to_text, _run_chunking, None, _always_available),
+        Stage('chunking_balanced', markdown_to_text, _run_chunking_balanced, None, _always_available),
+        Stage('chunking_anchored', markdown_to_text, _run_chunking_anchored, None, _always_available),
+        Stage('join_frames', _prepare_audio, _run_join_frames, 10 * 1024 ** 2, _always_available),
+        Stage('join_reencode', _prepare_audio, _run_join_reencode, 100 * 1024, _ffmpeg_available),
+        Stage('normalize', _prepare_speech, _run_normalize, 100 * 1024, _normalize_available),
+        Stage('normalize_pydub', _prepare_speech, _run_normalize_pydub, 100 * 1024, _pydub_available),
+    )
+}
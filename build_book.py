@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Build The Consciousness Files in every format: PDF, EPUB and HTML with pandoc,
+and the audiobook with Eleven Labs API. Independent formats are built in
+parallel, and formats whose inputs have not changed since the last build are
+skipped.
+"""
+import argparse
+import os
+import sys
+import traceback
+
+from audiobook.build import book_targets, run_build
+from audiobook.errors import AudiobookError
+
+
+BOOK_NAME = 'The_Consciousness_Files'
+TITLE = 'The Consciousness Files'
+SUBTITLE = 'A collection of philosophical short stories exploring perception, creation, and the illusion of self'
+AUTHOR = 'Gavin Williams & ChatGPT'
+
+# Chapters in reading order, relative to this script
+CHAPTERS = [
+    'src/The_Consciousness_Files.md',
+    'src/You_Me_and_ChatGPT.md',
+    'src/The_Self_That_Sang.md',
+]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Build the book as PDF, EPUB, HTML and audiobook, skipping formats that are up to date.",
+        epilog="Example: python build_book.py pdf epub html",
+    )
+    parser.add_argument('targets', nargs='*', metavar='target',
+                        help='formats to build: manuscript, pdf, epub, html, audio (default: all)')
+    parser.add_argument('--build-dir', default='build', metavar='DIR',
+                        help='directory the formats are written to (default: build)')
+    parser.add_argument('--jobs', type=int, metavar='N',
+                        help='number of targets to build at once (default: all that are ready)')
+    parser.add_argument('--force', action='store_true',
+                        help='build the targets even if their inputs have not changed')
+    return parser.parse_args()
+
+
+def main():
+    """Main entry point."""
+    args = parse_args()
+    root = os.path.dirname(os.path.abspath(__file__))
+    chapter_files = [os.path.relpath(os.path.join(root, chapter)) for chapter in CHAPTERS]
+
+    # Only needed once the audiobook has to be rebuilt
+    api_key = os.environ.get('ELEVEN_LABS_API_KEY')
+
+    try:
+        targets = book_targets(chapter_files, args.build_dir, BOOK_NAME, TITLE, SUBTITLE, AUTHOR, api_key)
+        results = run_build(
+            targets, os.path.join(args.build_dir, '.work', 'state.json'), args.targets or None,
+            jobs=args.jobs, force=args.force,
+        )
+    except AudiobookError as e:
+        print(f"❌ Error: {e}")
+        sys.exit(1)
+    except Exception as e:
+        print(f"\n❌ Error building the book: {e}")
+        traceback.print_exc()
+        sys.exit(1)
+
+    built = [name for name, result in results.items() if result == 'built']
+    skipped = [name for name, result in results.items() if result == 'skipped']
+    print(f"\n🏁 Built: {', '.join(built) or 'nothing'}; up to date: {', '.join(skipped) or 'nothing'}")
+
+
+if __name__ == '__main__':
+    main()
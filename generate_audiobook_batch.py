@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Generate many audiobooks listed in a batch file using Eleven Labs API.
+All books share one API client, connection pool and concurrency limit.
+"""
+import argparse
+import os
+import sys
+import traceback
+
+from audiobook import config
+from audiobook.batch import generate_audiobooks, load_batch
+from audiobook.chunking import STRATEGIES
+from audiobook.errors import AudiobookError
+from audiobook.metrics import RunMetrics
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Generate many audiobooks listed in a batch file using Eleven Labs API.",
+        epilog='Example: python generate_audiobook_batch.py books.json\n\n'
+               'books.json: {"books": [{"output": "one.mp3", "chapters": ["one/01.md", "one/02.md"]}]}',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('batch_file', metavar='batch.json')
+    parser.add_argument('--concurrency', type=int,
+                        help='most requests to run at once across all books; fewer are sent on congestion, '
+                             'and more only up to AUDIOBOOK_MAX_CONCURRENCY, if set '
+                             '(default: AUDIOBOOK_CONCURRENCY or 4)')
+    parser.add_argument('--chunking', choices=STRATEGIES,
+                        help="how text is packed into chunks: 'greedy' fills each chunk in turn, "
+                             "'balanced' evens out chunk sizes, 'anchored' keeps chunks stable across edits "
+                             "(default: AUDIOBOOK_CHUNKING or greedy)")
+    parser.add_argument('--metrics', metavar='PATH',
+                        help='append per-stage and per-chunk metrics to PATH as JSON lines '
+                             '(default: AUDIOBOOK_METRICS)')
+    parser.add_argument('--metrics-prom', metavar='PATH',
+                        help='write run metrics to PATH in the Prometheus textfile format '
+                             '(default: AUDIOBOOK_METRICS_PROM)')
+    parser.add_argument('--formats', metavar='LIST',
+                        help="formats to export besides the MP3, encoded in parallel from one decode: "
+                             "comma separated m4b (with chapter markers), opus and preview (low-bitrate mono), "
+                             "each optionally with :BITRATE (default: AUDIOBOOK_EXPORT_FORMATS)")
+    return parser.parse_args()
+
+
+def main():
+    """Main entry point."""
+    args = parse_args()
+
+    # Get API key from environment (the local stand-in backend does not need one)
+    api_key = os.environ.get('ELEVEN_LABS_API_KEY')
+    if not api_key and config.tts_backend_from_environment() == config.DEFAULT_TTS_BACKEND:
+        print("❌ Error: ELEVEN_LABS_API_KEY environment variable not set")
+        sys.exit(1)
+
+    try:
+        books = load_batch(args.batch_file)
+    except (AudiobookError, OSError) as e:
+        print(f"❌ Error: {e}")
+        sys.exit(1)
+
+    metrics = RunMetrics.from_environment(args.metrics, args.metrics_prom)
+
+    # Generate every book in one run
+    try:
+        generate_audiobooks(
+            books, api_key, concurrency=args.concurrency, chunking=args.chunking, metrics=metrics,
+            formats=args.formats, name=args.batch_file,
+        )
+    except AudiobookError as e:
+        print(f"❌ Error: {e}")
+        sys.exit(1)
+    except Exception as e:
+        print(f"\n❌ Error generating audiobooks: {e}")
+        traceback.print_exc()
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Render a short clip of one passage of a chapter, to check how it sounds
+without synthesizing the whole book.
+"""
+import argparse
+import os
+import sys
+import traceback
+
+from audiobook import config
+from audiobook.chunking import STRATEGIES
+from audiobook.errors import AudiobookError
+from audiobook.preview import CHARACTERS, LINES, PARAGRAPHS, parse_range, preview_path, render_preview
+
+
+def _range(value):
+    try:
+        return parse_range(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected N or FIRST-LAST, got '{value}'") from None
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Render a short clip of one passage of a chapter using Eleven Labs API.",
+        epilog="Example: python preview_audiobook.py src/You_Me_and_ChatGPT.md --lines 40-48",
+    )
+    parser.add_argument('chapter_file', metavar='chapter.md')
+    selection = parser.add_mutually_exclusive_group(required=True)
+    selection.add_argument('--lines', type=_range, metavar='RANGE',
+                           help='markdown source lines, e.g. 40-48')
+    selection.add_argument('--paragraphs', type=_range, metavar='RANGE',
+                           help='paragraphs of the narration text, e.g. 3 or 3-5')
+    selection.add_argument('--chars', type=_range, metavar='RANGE',
+                           help='characters of the narration text, e.g. 1200-1800')
+    parser.add_argument('--chunks', action='store_true',
+                        help='synthesize the whole chunks of the chapter covering the passage, exactly as '
+                             'the book renders them (and cached for the next build), instead of the passage alone')
+    parser.add_argument('--chunking', choices=STRATEGIES,
+                        help="how text is packed into chunks (default: AUDIOBOOK_CHUNKING or greedy)")
+    parser.add_argument('-o', '--output', metavar='PATH',
+                        help='clip to write (default: <chapter name>.clip.mp3)')
+    return parser.parse_args()
+
+
+def main():
+    """Main entry point."""
+    args = parse_args()
+
+    # Get API key from environment (the local stand-in backend does not need one)
+    api_key = os.environ.get('ELEVEN_LABS_API_KEY')
+    if not api_key and config.tts_backend_from_environment() == config.DEFAULT_TTS_BACKEND:
+        print("❌ Error: ELEVEN_LABS_API_KEY environment variable not set")
+        sys.exit(1)
+
+    if not os.path.exists(args.chapter_file):
+        print(f"❌ Error: Chapter file not found: {args.chapter_file}")
+        sys.exit(1)
+
+    if args.lines:
+        unit, (first, last) = LINES, args.lines
+    elif args.paragraphs:
+        unit, (first, last) = PARAGRAPHS, args.paragraphs
+    else:
+        unit, (first, last) = CHARACTERS, args.chars
+
+    try:
+        render_preview(
+            args.chapter_file, args.output or preview_path(args.chapter_file), api_key, unit, first, last,
+            whole_chunks=args.chunks, chunking=args.chunking,
+        )
+    except AudiobookError as e:
+        print(f"❌ Error: {e}")
+        sys.exit(1)
+    except Exception as e:
+        print(f"\n❌ Error generating preview: {e}")
+        traceback.print_exc()
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()